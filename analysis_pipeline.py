@@ -1,12 +1,21 @@
 # analysis_pipeline.py
-# pip install google-generativeai
-import os, json, sqlite3, math, statistics, re
+# pip install google-generativeai（LLM_BACKEND=stub ならオフラインで動く）
+import os, json, sqlite3, re, hashlib
 from pathlib import Path
-from datetime import datetime, timezone
-from typing import Dict, List, Tuple, Optional
+from datetime import datetime
+from typing import Dict, Iterator, List, Set, Tuple, Optional
 
-import google.generativeai as genai
-from gemini_settings import pick_model, get_api_key
+import gemini_settings
+from llm_backends import LLMBackend, get_backend
+from llm_runner import RateLimiter, call_with_retry, estimate_tokens, run_ordered
+from prompt_packer import (BATCH_MODE, CONVERSATION_TOKEN_BUDGET, build_batch_prompt, fit_conversation,
+                           is_batchable, parse_batch_response, plan_batches, render_message)
+from analysis_store import (ERROR_PREFIX, ReportCache, cache_key, connect as connect_store, create_job,
+                            finish_job, iter_job_items, latest_job, pending_seqs, record_item)
+from message_store import (TEMPLATE_MIN_CHARS, connect as connect_messages, norm_body_hash, template_matcher,
+                           template_norm_hashes)
+from report_index import IndexWriter
+from response_metrics import latency_metrics
 
 # ===== 設定 =====
 DB_PATH = "lstep_users.db"
@@ -15,6 +24,11 @@ OUT_DIR.mkdir(exist_ok=True)
 MODEL_NAME = "gemini-1.5-pro"
 CUSTOMER_SENDER = "you"   # DBのsender値（ユーザー側）
 SUPPORT_SENDER  = "me"    # DBのsender値（サポート側）
+FETCH_SIZE = 5000         # データセット作成時に一度に読む行数
+UNASSIGNED_SUPPORT = "未割当"              # 担当者なしのユーザーの振り分け先
+MAX_OPEN_SHARDS = 64                      # 一括生成で同時に開いておくシャード数
+DATASET_MANIFEST = "dataset_manifest.json"
+TEMPLATE_HEAD_CHARS = 20                  # 畳んだ定型文に残す冒頭の文字数
 
 SYSTEM_PROMPT = """あなたはカスタマーサポート品質のアナリストです。
 与えられた会話ログ（必要に応じて短縮済み）と事前集計(レスポンス時間など)を読み、
@@ -35,149 +49,449 @@ def _slug(text: str) -> str:
     s = re.sub(r"[^\w\-]+", "_", text.strip())
     return re.sub(r"_+", "_", s).strip("_") or "unknown"
 
-def _parse_time(ts: Optional[str]) -> Optional[datetime]:
-    if not ts: return None
-    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
-        try:
-            return datetime.strptime(ts, fmt).replace(tzinfo=timezone.utc)
-        except Exception:
-            continue
-    try:
-        return datetime.fromisoformat(ts).replace(tzinfo=timezone.utc)
-    except Exception:
-        return None
+def _support_slug(support: str) -> str:
+    # 記号・空白を置き換えた名前には元の名前の短いハッシュを付ける
+    # （「山田 太郎」と「山田_太郎」などが同じファイルに上書きされないように）
+    s = _slug(support)
+    if s == support:
+        return s
+    return f"{s}_{hashlib.sha1(support.encode('utf-8')).hexdigest()[:6]}"
+
+def dataset_file(support: str, out_dir: Path = OUT_DIR) -> Path:
+    """担当者の会話JSONL（build_dataset_for_support / build_datasets_for_all_supports で共通）"""
+    return out_dir / f"conversations_{_support_slug(support)}.jsonl"
+
+def reports_file(support: str, out_dir: Path = OUT_DIR) -> Path:
+    """担当者のレポートJSONL（analyze_with_gemini の出力先）"""
+    return out_dir / (dataset_file(support, out_dir).stem + "_gemini_reports.jsonl")
+
+def _latency_metrics(conn, templates: Set[str], support: Optional[str] = None) -> Tuple[Dict, Dict]:
+    # 全会話の応答時間を1回の SQL 走査で（ユーザー別・担当者別）
+    return latency_metrics(conn, CUSTOMER_SENDER, SUPPORT_SENDER, support=support,
+                           is_auto=template_matcher(templates), min_auto_chars=TEMPLATE_MIN_CHARS,
+                           unassigned=UNASSIGNED_SUPPORT)
+
+# ====== 定型文・連投の圧縮（LLMに渡すテキストだけに効く） ======
+def _mark_templates(conv: Dict, templates: Set[str]):
+    # 正規化して一致する定型文（message_store.template_norm_hashes）にも template フラグを立てる
+    for m in conv["messages"]:
+        if (not m["template"] and m["sender"] == SUPPORT_SENDER and len(m["text"]) >= TEMPLATE_MIN_CHARS
+                and norm_body_hash(m["text"], conv["line_name"]) in templates):
+            m["template"] = True
 
-def _compute_response_metrics(messages: List[Dict]) -> Dict:
-    lat = []
-    prev = None
+def _compact_for_llm(messages: List[Dict]) -> Tuple[List[Dict], Dict]:
+    """
+    - 定型文・一斉配信は本文を落とし、連続するものは「〈定型文 N件〉」の1行に畳む
+    - 同じ送信者の連投は1行にまとめる（時刻は最初の発言）
+    戻り値: (圧縮後の発言リスト, {"templates": 畳んだ定型文の数, "squashed": 前の行にまとめた発言の数})
+    """
+    groups: List[Dict] = []
+    counts = {"templates": 0, "squashed": 0}
     for m in messages:
-        t = _parse_time(m["time"])
-        if t is None: 
-            continue
-        if prev and prev["sender"] == CUSTOMER_SENDER and m["sender"] == SUPPORT_SENDER:
-            lat.append((t - prev["time"]).total_seconds())
-        prev = {"sender": m["sender"], "time": t}
-    if not lat:
-        return {"count": 0}
-    lat_sorted = sorted(lat)
-    def pct(p):
-        if not lat_sorted: return None
-        k = (len(lat_sorted)-1)*p
-        a = math.floor(k); b = math.ceil(k)
-        if a == b: return lat_sorted[int(k)]
-        return lat_sorted[a] + (lat_sorted[b]-lat_sorted[a])*(k-a)
+        prev = groups[-1] if groups else None
+        same = prev is not None and prev["sender"] == m["sender"] and prev["template"] == m["template"]
+        if m["template"]:
+            counts["templates"] += 1
+        elif same:
+            counts["squashed"] += 1
+        if same:
+            prev["texts"].append(m["text"])
+        else:
+            groups.append({"time": m["time"], "sender": m["sender"], "template": m["template"],
+                           "texts": [m["text"]]})
+
+    out = []
+    for g in groups:
+        if g["template"]:
+            head = re.sub(r"\s+", " ", g["texts"][0])[:TEMPLATE_HEAD_CHARS]
+            text = f"〈定型文・一斉配信 {len(g['texts'])}件:「{head}…」〉"
+        else:
+            text = " / ".join(t for t in g["texts"] if t)
+        out.append({"time": g["time"], "sender": g["sender"], "text": text})
+    return out, counts
+
+def _fit_for_llm(messages: List[Dict]) -> Tuple[str, Dict]:
+    # 定型文・連投を圧縮してから、トークン予算内なら全文、超えるなら「古い履歴の要約」+ 直近（末尾優先）
+    compact, counts = _compact_for_llm(messages)
+    text, stats = fit_conversation(compact, CONVERSATION_TOKEN_BUDGET, customer_sender=CUSTOMER_SENDER)
+    stats["full"] = sum(estimate_tokens(render_message(m)) for m in messages)  # 圧縮前の全文
+    stats.update(counts)
+    return text, stats
+
+# ====== 1) supportで絞ってJSONL生成 ======
+def _iter_conversations(cur, fetch_size: int = FETCH_SIZE) -> Iterator[Dict]:
+    """
+    user_id 順に並んだ users⋈messages の行を読み進め、次の user_id が来た時点で
+    直前のユーザーの会話を1件ずつ返す（保持するのは常に1会話分だけ）。
+    """
+    conv = None
+    for rows in iter(lambda: cur.fetchmany(fetch_size), []):
+        for r in rows:
+            uid = r["user_id"]
+            if conv is None or conv["user_id"] != uid:
+                if conv is not None:
+                    yield conv
+                conv = {
+                    "user_id": uid,
+                    "line_name": r["line_name"],
+                    "href": r["href"],
+                    "support": r["support"],
+                    "messages": []
+                }
+            if r["msg_id"] is not None:
+                conv["messages"].append({
+                    "msg_id": r["msg_id"],
+                    "sender": r["sender"],
+                    "text": (r["message"] or "").strip(),
+                    "time": r["time_sent"],
+                    "template": bool(r["is_template"]),
+                })
+    if conv is not None:
+        yield conv
+
+def _conversation_record(conv: Dict, templates: Set[str] = frozenset(),
+                         metrics: Optional[Dict[int, Dict]] = None) -> Dict:
+    _mark_templates(conv, templates)
+    llm_text, llm_tokens = _fit_for_llm(conv["messages"])
     return {
-        "count": len(lat),
-        "avg_sec": sum(lat)/len(lat),
-        "median_sec": statistics.median(lat),
-        "p90_sec": pct(0.90),
-        "p95_sec": pct(0.95),
-        "min_sec": min(lat),
-        "max_sec": max(lat),
+        "user_id": conv["user_id"],
+        "line_name": conv["line_name"],
+        "href": conv["href"],
+        "support": conv["support"],
+        "message_count": len(conv["messages"]),
+        "response_metrics": (metrics or {}).get(conv["user_id"], {"count": 0}),
+        "llm_text": llm_text,
+        "llm_tokens": llm_tokens,  # {"full", "packed", "digested", "templates", "squashed"}
+        "messages": conv["messages"],  # 重ければ消してOK
     }
 
-def _truncate_for_llm(messages: List[Dict], max_chars=12000) -> str:
-    # 末尾（最近）優先で連結
-    out, total = [], 0
-    for m in reversed(messages):
-        line = f"[{m['time']}] {m['sender']}: {m['text']}\n"
-        if total + len(line) > max_chars: break
-        out.append(line); total += len(line)
-    return "".join(reversed(out))
+DATASET_SQL = """
+    SELECT u.id as user_id, u.line_name, u.href, u.support,
+           m.id as msg_id, m.sender, m.message, m.time_sent, m.is_template
+    FROM users u
+    LEFT JOIN messages_v m ON u.id = m.user_id
+    {where}
+    ORDER BY u.id ASC, m.time_sent ASC, m.id ASC
+"""
 
-# ====== 1) supportで絞ってJSONL生成 ======
 def build_dataset_for_support(support_name: str,
                               db_path: str = DB_PATH,
                               out_dir: Path = OUT_DIR) -> Tuple[Path, int]:
-    out_file = out_dir / f"conversations_{_slug(support_name)}.jsonl"
-    conn = sqlite3.connect(db_path)
+    out_file = dataset_file(support_name, out_dir)
+    conn = connect_messages(db_path, include_archives=True)  # アーカイブ済みの過去分も含める
     conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    # 指定supportのユーザーのみ
-    cur.execute("""
-        SELECT u.id as user_id, u.line_name, u.href, u.support,
-               m.id as msg_id, m.sender, m.message, m.time_sent
-        FROM users u
-        LEFT JOIN messages m ON u.id = m.user_id
-        WHERE u.support = ?
-        ORDER BY u.id ASC, m.time_sent ASC, m.id ASC
-    """, (support_name,))
-    rows = cur.fetchall()
-    conn.close()
-
-    # ユーザー単位にまとめる
-    convs: Dict[int, Dict] = {}
-    for r in rows:
-        uid = r["user_id"]
-        if uid not in convs:
-            convs[uid] = {
-                "user_id": uid,
-                "line_name": r["line_name"],
-                "href": r["href"],
-                "support": r["support"],
-                "messages": []
-            }
-        if r["msg_id"] is not None:
-            convs[uid]["messages"].append({
-                "msg_id": r["msg_id"],
-                "sender": r["sender"],
-                "text": (r["message"] or "").strip(),
-                "time": r["time_sent"],
-            })
-    conv_list = list(convs.values())
-
-    with out_file.open("w", encoding="utf-8") as fw:
-        for conv in conv_list:
-            stats = _compute_response_metrics(conv["messages"])
-            llm_text = _truncate_for_llm(conv["messages"])
-            rec = {
-                "user_id": conv["user_id"],
-                "line_name": conv["line_name"],
-                "href": conv["href"],
-                "support": conv["support"],
-                "message_count": len(conv["messages"]),
-                "response_metrics": stats,
-                "llm_text": llm_text,
-                "messages": conv["messages"],  # 重ければ消してOK
-            }
-            fw.write(json.dumps(rec, ensure_ascii=False) + "\n")
-
-    return out_file, len(conv_list)
+    n = 0
+    try:
+        # 定型文の判定も応答時間も、この担当のユーザーの会話だけを読む
+        templates = template_norm_hashes(conn, SUPPORT_SENDER, support=support_name)
+        metrics, _ = _latency_metrics(conn, templates, support=support_name)
+        cur = conn.cursor()
+        # 指定supportのユーザーのみ（messages_v: 圧縮本文も平文で返る）
+        # 並び順のとおりに1会話ずつ書き出すので、全件をメモリに載せない
+        cur.execute(DATASET_SQL.format(where="WHERE u.support = ?"), (support_name,))
 
-# ====== 2) JSONLをGeminiに投げて評価レポート生成 ======
-def analyze_with_gemini(input_jsonl: Path,
-                        out_dir: Path = OUT_DIR) -> Tuple[Path, int]:
+        with out_file.open("w", encoding="utf-8") as fw:
+            for conv in _iter_conversations(cur):
+                fw.write(json.dumps(_conversation_record(conv, templates, metrics), ensure_ascii=False) + "\n")
+                n += 1
+    finally:
+        conn.close()
 
-    api_key = get_api_key()
-    genai.configure(api_key=api_key)
-    model_name = pick_model()  # ← 無料枠モデルをここで確定
-    model = genai.GenerativeModel(model_name)
+    return out_file, n
 
-    out_file = out_dir / (input_jsonl.stem + "_gemini_reports.jsonl")
-    n = 0
-    with input_jsonl.open("r", encoding="utf-8") as fr, out_file.open("w", encoding="utf-8") as fw:
-        for line in fr:
-            rec = json.loads(line)
-            prompt = (
-f"""{SYSTEM_PROMPT}
+# ====== 1b) 全担当を1回の走査でまとめて生成 ======
+def build_datasets_for_all_supports(db_path: str = DB_PATH,
+                                    out_dir: Path = OUT_DIR) -> Tuple[Path, Dict]:
+    """
+    users⋈messages を1回だけ順に読み、会話ごとに担当者のJSONL（シャード）へ振り分ける。
+    担当者が未設定のユーザーは conversations_<UNASSIGNED_SUPPORT>.jsonl に入れる。
+    ファイル名は build_dataset_for_support と同じ（dataset_file。UIの「この担当」からそのまま使える）。
+    書き込みは .tmp に行い、最後まで走り切ったら置き換える（途中失敗で半端なファイルを残さない）。
+    戻り値: (マニフェストのパス, マニフェスト)
+    """
+    started = datetime.now()
+    shards: Dict[str, Dict] = {}
+    handles: Dict[str, object] = {}   # support -> 開いているファイル（多すぎたら古い順に閉じる）
+    conn = connect_messages(db_path, include_archives=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        templates = template_norm_hashes(conn, SUPPORT_SENDER)
+        metrics, support_metrics = _latency_metrics(conn, templates)
+        cur = conn.cursor()
+        cur.execute(DATASET_SQL.format(where=""))
+        for conv in _iter_conversations(cur):
+            key = conv["support"] or UNASSIGNED_SUPPORT
+            shard = shards.get(key)
+            if shard is None:
+                path = dataset_file(key, out_dir)
+                owner = next((k for k, sh in shards.items() if sh["file"] == path.name), None)
+                if owner is not None:
+                    raise RuntimeError(f"担当「{owner}」と「{key}」の出力ファイル名が重なります: {path.name}")
+                shard = shards[key] = {"file": path.name, "tmp": path.with_name(path.name + ".tmp"),
+                                       "conversations": 0, "messages": 0}
+                mode = "w"
+            else:
+                mode = "a"
+            fw = handles.pop(key, None)
+            if fw is None:
+                if len(handles) >= MAX_OPEN_SHARDS:
+                    handles.pop(next(iter(handles))).close()
+                fw = shard["tmp"].open(mode, encoding="utf-8")
+            handles[key] = fw  # 末尾に付け直す（最近使った順）
+            fw.write(json.dumps(_conversation_record(conv, templates, metrics), ensure_ascii=False) + "\n")
+            shard["conversations"] += 1
+            shard["messages"] += len(conv["messages"])
+    except Exception:
+        for fw in handles.values():
+            fw.close()
+        for shard in shards.values():
+            shard["tmp"].unlink(missing_ok=True)
+        raise
+    finally:
+        conn.close()
+
+    for fw in handles.values():
+        fw.close()
+    for shard in shards.values():
+        tmp = shard.pop("tmp")
+        os.replace(tmp, out_dir / shard["file"])
+        shard["bytes"] = (out_dir / shard["file"]).stat().st_size
+    for key, shard in shards.items():
+        shard["response_metrics"] = support_metrics.get(key, {"count": 0})
+
+    manifest = {
+        "built_at": started.strftime("%Y-%m-%d %H:%M:%S"),
+        "elapsed_sec": round((datetime.now() - started).total_seconds(), 2),
+        "db_path": str(db_path),
+        "conversations": sum(sh["conversations"] for sh in shards.values()),
+        "messages": sum(sh["messages"] for sh in shards.values()),
+        "bytes": sum(sh["bytes"] for sh in shards.values()),
+        "shards": dict(sorted(shards.items())),
+    }
+    manifest_file = out_dir / DATASET_MANIFEST
+    manifest_file.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return manifest_file, manifest
 
-【担当者】{rec.get('support') or '(未割当)'} / 【ユーザー】{rec.get('line_name')}
+# ====== 2) JSONLをGeminiに投げて評価レポート生成 ======
+def _conversation_block(rec: Dict) -> str:
+    return (
+f"""【担当者】{rec.get('support') or '(未割当)'} / 【ユーザー】{rec.get('line_name')}
 【事前集計】{json.dumps(rec.get('response_metrics', {}), ensure_ascii=False)}
 【会話ログ（短縮版）】
 {rec.get('llm_text','')}
 """)
-            try:
-                res = model.generate_content(prompt)
-                report = res.text or ""
-            except Exception as e:
-                report = f"ERROR: {e}"
-
-            out = {
-                "user_id": rec.get("user_id"),
-                "line_name": rec.get("line_name"),
-                "support": rec.get("support"),
-                "report": report,
-            }
-            fw.write(json.dumps(out, ensure_ascii=False) + "\n")
-            n += 1
-    return out_file, n
+
+def _build_prompt(rec: Dict) -> str:
+    return f"{SYSTEM_PROMPT}\n\n{_conversation_block(rec)}"
+
+def _make_generator(backend: LLMBackend):
+    """プロンプト → 応答テキスト を返す関数を作る（レート制限・再試行つき。ワーカースレッドから並列に呼ばれる）"""
+    limiter = RateLimiter(backend.rpm, backend.tpm)
+
+    def _generate(prompt: str, n_conversations: int = 1) -> str:
+        est = estimate_tokens(prompt) + gemini_settings.OUTPUT_TOKENS_ESTIMATE * n_conversations
+
+        def _once():
+            limiter.acquire(est)  # 再試行も1リクエストとして数える
+            text, used = backend.generate(prompt)
+            limiter.settle(est, used)
+            return text
+
+        return call_with_retry(_once, retries=gemini_settings.MAX_RETRIES,
+                               backoff=backend.backoff,
+                               max_backoff=gemini_settings.BACKOFF_MAX_SEC)
+
+    return _generate
+
+def _analyze_unit(generate, unit: List) -> Dict:
+    """
+    1リクエスト分（1会話、または短い会話のまとまり）を分析する。
+    まとめた応答から読めなかった会話は、その会話だけ単独で投げ直す。
+    戻り値: {"reports": [(レポート, エラー or None, まとめ送りで得たか), ...], "sent_tokens": 送ったトークンの見積もり}
+    """
+    if len(unit) == 1:
+        prompt = unit[0]["prompt"]
+        return {"reports": [(generate(prompt), None, False)], "sent_tokens": estimate_tokens(prompt)}
+    prompt = build_batch_prompt(SYSTEM_PROMPT, [item["block"] for item in unit])
+    sent = estimate_tokens(prompt)
+    parsed = parse_batch_response(generate(prompt, len(unit)), len(unit))
+    reports = []
+    for i, item in enumerate(unit):
+        if i in parsed:
+            reports.append((parsed[i], None, True))
+            continue
+        sent += estimate_tokens(item["prompt"])
+        try:
+            reports.append((generate(item["prompt"]), None, False))
+        except Exception as e:
+            reports.append((None, e, False))
+    return {"reports": reports, "sent_tokens": sent}
+
+def _read_jsonl(path: Path) -> Iterator[Dict]:
+    with Path(path).open("r", encoding="utf-8") as fr:
+        for line in fr:
+            if line.strip():
+                yield json.loads(line)
+
+def _job_fingerprint(input_jsonl: Path) -> str:
+    """入力JSONLの内容と SYSTEM_PROMPT が同じなら同じジョブとみなす"""
+    h = hashlib.sha1(SYSTEM_PROMPT.encode("utf-8"))
+    with Path(input_jsonl).open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _run_job(store, job_id: int, input_jsonl: Path, out_file: Path,
+             backend: LLMBackend, concurrency: int, use_cache: bool) -> Dict:
+    """
+    ジョブの未完了分（pending / error）だけを分析し、1件ごとに analysis.db に確定させる。
+    キャッシュにある会話は API を呼ばない。短い会話は prompt_packer でまとめて1リクエストにする。
+    最後にジョブの状態から out_file を書き直す（.tmp → 置換。途中で落ちても前回のファイルは壊さない）。
+    out_file の索引（report_index）もここで作る。
+    戻り値の "tokens" に、1件ずつ送った場合と比べたトークン数の見積もりを入れる。
+    """
+    todo = pending_seqs(store, job_id)
+    model_name = backend.name
+    tokens = {"requests": 0, "batched_conversations": 0, "cache_hits": 0,
+              "single_est": 0, "sent_est": 0,
+              "saved_batching": 0, "saved_cache": 0, "saved_digest": 0}
+    if todo:
+        cache = ReportCache() if use_cache else None
+        try:
+            generate = _make_generator(backend)
+
+            def _items():
+                for seq, rec in enumerate(_read_jsonl(input_jsonl)):
+                    if seq not in todo:
+                        continue
+                    prompt = _build_prompt(rec)
+                    block = _conversation_block(rec)
+                    # 単独で送った結果のキーと、まとめ送りで得た結果のキー（今回もまとめ送りの候補になる会話だけ使う）
+                    key = cache_key(model_name, prompt)
+                    batch_key = cache_key(model_name, prompt, BATCH_MODE) if is_batchable(block) else None
+                    packed = rec.get("llm_tokens") or {}
+                    # 定型文・連投の圧縮と古い履歴の要約で減った分
+                    tokens["saved_digest"] += packed.get("full", 0) - packed.get("packed", 0)
+                    hit = cache.get(key, batch_key) if cache is not None else None
+                    if hit is not None:
+                        record_item(store, job_id, seq, "done", hit)
+                        tokens["cache_hits"] += 1
+                        tokens["saved_cache"] += estimate_tokens(prompt)
+                        continue
+                    item = {"seq": seq, "key": key, "batch_key": batch_key, "prompt": prompt, "block": block}
+                    yield item, item["block"]
+
+            units = ([item for item, _ in batch]
+                     for batch in plan_batches(_items(), fixed_tokens=estimate_tokens(SYSTEM_PROMPT)))
+            for unit, res, err in run_ordered(units, lambda u: _analyze_unit(generate, u),
+                                              concurrency=concurrency):
+                single = sum(estimate_tokens(item["prompt"]) for item in unit)
+                tokens["requests"] += 1
+                tokens["single_est"] += single
+                tokens["sent_est"] += res["sent_tokens"] if res else single
+                if len(unit) > 1:
+                    tokens["batched_conversations"] += len(unit)
+                for i, item in enumerate(unit):
+                    report, item_err, batched = res["reports"][i] if res else (None, err, False)
+                    if item_err is None:
+                        record_item(store, job_id, item["seq"], "done", report)
+                        if cache is not None and report:
+                            cache.put(item["batch_key"] if batched else item["key"], model_name, report)
+                    else:
+                        record_item(store, job_id, item["seq"], "error", f"{ERROR_PREFIX}{item_err}")
+        finally:
+            if cache is not None:
+                cache.close()  # 上限を超えていればここで古いものを消す
+    tokens["saved_batching"] = tokens["single_est"] - tokens["sent_est"]
+    stats = finish_job(store, job_id, tokens)
+
+    # 行ごとの位置の索引（<out_file>.idx）も一緒に作る。UI はこれで表示する行だけを読む
+    tmp = out_file.with_name(out_file.name + ".tmp")
+    with tmp.open("wb") as fw:
+        index = IndexWriter(fw)
+        for _, user_id, href, line_name, support, _, report in iter_job_items(store, job_id):
+            index.write({
+                "user_id": user_id,
+                "href": href,
+                "line_name": line_name,
+                "support": support,
+                "report": report or "",
+            })
+    os.replace(tmp, out_file)
+    index.save(out_file)
+    stats["analyzed"] = len(todo)
+    return stats
+
+def analyze_with_gemini(input_jsonl: Path,
+                        out_dir: Path = OUT_DIR,
+                        concurrency: int = gemini_settings.CONCURRENCY,
+                        use_cache: bool = True,
+                        resume: bool = True,
+                        backend: Optional[LLMBackend] = None) -> Tuple[Path, int, Dict]:
+    """
+    会話ごとのプロンプトを concurrency 並列で投げる（RPM/TPM はトークンバケットで制限）。
+    429 / 5xx は指数バックオフで再試行し、最終的に失敗したものは "ERROR: ..." として残す。
+    出力の順番は入力JSONLと同じ。
+    use_cache=True なら (モデル, プロンプト) が前回と同じ会話は API を呼ばずにキャッシュを使う
+    （analysis_store.ReportCache。失敗したものはキャッシュしない）。
+    実行はジョブとして analysis.db に記録する。resume=True なら同じ入力・プロンプト・モデルの
+    直近のジョブを引き継ぎ、終わっていない会話と失敗した会話だけを投げ直す。
+    backend を省略したら gemini_settings.LLM_BACKEND のもの（llm_backends.get_backend）を使う。
+    戻り値: (レポートファイル, 件数, {"total", "done", "errors", "analyzed", "job_id", "tokens"})
+    """
+    input_jsonl = Path(input_jsonl)
+    backend = backend or get_backend()  # Gemini なら無料枠モデルをここで確定
+    model_name = backend.name
+    out_file = out_dir / (input_jsonl.stem + "_gemini_reports.jsonl")
+    fingerprint = _job_fingerprint(input_jsonl)
+
+    store = connect_store()
+    try:
+        job_id = latest_job(store, fingerprint, model_name) if resume else None
+        if job_id is None:
+            items = ((seq, rec.get("user_id"), rec.get("href"), rec.get("line_name"), rec.get("support"),
+                      "pending", None)
+                     for seq, rec in enumerate(_read_jsonl(input_jsonl)))
+            job_id = create_job(store, str(input_jsonl), fingerprint, str(out_file), model_name, items)
+        stats = _run_job(store, job_id, input_jsonl, out_file, backend, concurrency, use_cache)
+    finally:
+        store.close()
+    return out_file, stats["total"], stats
+
+def retry_gemini_errors(report_jsonl: Path,
+                        input_jsonl: Optional[Path] = None,
+                        concurrency: int = gemini_settings.CONCURRENCY,
+                        backend: Optional[LLMBackend] = None) -> Tuple[Path, Dict]:
+    """
+    既存のレポートファイルのうち "ERROR: ..." の行（と空の行）だけを分析し直して書き換える。
+    input_jsonl を省略したら <入力>_gemini_reports.jsonl の名前から入力JSONLを推定する。
+    戻り値: (レポートファイル, {"total", "done", "errors", "analyzed", "job_id", "tokens"})
+    """
+    report_jsonl = Path(report_jsonl)
+    if input_jsonl is None:
+        input_jsonl = report_jsonl.with_name(report_jsonl.name.replace("_gemini_reports.jsonl", ".jsonl"))
+    input_jsonl = Path(input_jsonl)
+    if not input_jsonl.exists():
+        raise FileNotFoundError(f"入力JSONLが見つかりません: {input_jsonl}")
+    backend = backend or get_backend()
+    model_name = backend.name
+
+    def _seed():
+        reports = _read_jsonl(report_jsonl)
+        for seq, rec in enumerate(_read_jsonl(input_jsonl)):
+            row = next(reports, None)
+            if row is not None and row.get("user_id") != rec.get("user_id"):
+                raise ValueError(f"レポートと入力JSONLの並びが一致しません（{seq + 1} 行目）")
+            report = (row or {}).get("report") or ""
+            status = "error" if not report or report.startswith(ERROR_PREFIX) else "done"
+            yield (seq, rec.get("user_id"), rec.get("href"), rec.get("line_name"), rec.get("support"),
+                   status, report or None)
+
+    store = connect_store()
+    try:
+        job_id = create_job(store, str(input_jsonl), _job_fingerprint(input_jsonl), str(report_jsonl),
+                            model_name, _seed())
+        stats = _run_job(store, job_id, input_jsonl, report_jsonl, backend, concurrency, use_cache=True)
+    finally:
+        store.close()
+    return report_jsonl, stats
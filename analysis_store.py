@@ -0,0 +1,522 @@
+# analysis_store.py
+# 分析結果の保存先（analysis_out/analysis.db）
+#
+# report_cache: (モデル名, プロンプト[, 送り方]) のハッシュ → Geminiのレポート本文
+#   プロンプトには SYSTEM_PROMPT・担当/ユーザー名・事前集計・会話ログ（短縮版）が入るので、
+#   どれかが変わればキーも変わる。会話に変化がなければ再分析せずにキャッシュを返す。
+#   まとめ送りで得たレポートは prompt_packer.BATCH_MODE を送り方に入れた別のキーで持つ。
+#   合計サイズが CACHE_MAX_BYTES を超えたら、最後に使われたのが古いものから消す。
+#
+# analysis_jobs / analysis_job_items: 分析の実行（ジョブ）と会話ごとの状態（pending / done / error）
+#   1件終わるごとに記録するので、途中で落ちても再実行すると未完了・失敗分だけを投げ直せる。
+#
+# reports / report_improvements / report_examples: レポート本文を書き込み時に1回だけ解析した結果
+#   （ユーザー × モデルごとに最新の1件）。UI や集計は JSONL を読み直さずにここを引く。
+#   users.id はスクレイピングのたびに振り直されるので、ユーザーは user_key（users.href。
+#   href が分からない古いレポートは 名前 + 担当）で見分ける。
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+STORE_PATH = Path("analysis_out") / "analysis.db"
+CACHE_MAX_BYTES = 200 * 1024 * 1024   # レポートキャッシュの上限（本文の合計バイト数）
+EVICT_TO_RATIO = 0.9                  # 上限を超えたら上限の9割まで減らす
+RAW_KEEP_CHARS = 4000                 # JSON として読めなかったレポートに残す原文の長さ
+ERROR_PREFIX = "ERROR: "              # 分析に失敗した会話のレポート本文の先頭（analysis_pipeline と共通）
+NAME_KEY_SQL = "COALESCE(line_name, '') || char(9) || COALESCE(support, '')"  # _name_key と同じ値
+
+
+def _name_key(line_name: Optional[str], support: Optional[str]) -> str:
+    return f"{line_name or ''}\t{support or ''}"
+
+
+def user_key(href: Optional[str], line_name: Optional[str], support: Optional[str]) -> str:
+    """レポートのユーザーを見分けるキー（再スクレイピングで変わらない users.href。無ければ 名前 + 担当）"""
+    return href or _name_key(line_name, support)
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def connect(path: Path = STORE_PATH) -> sqlite3.Connection:
+    """analysis.db を開いてテーブルを用意する（ワーカースレッドからも使うので check_same_thread=False）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS report_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            report TEXT,
+            size INTEGER,
+            created_at TEXT,
+            last_used_at TEXT,
+            hits INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_report_cache_used ON report_cache(last_used_at)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            input_path TEXT,
+            fingerprint TEXT,          -- 入力JSONLの内容 + SYSTEM_PROMPT のハッシュ
+            output_path TEXT,
+            model TEXT,
+            status TEXT,            -- running / done
+            total INTEGER,
+            done INTEGER DEFAULT 0,
+            errors INTEGER DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    """)
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(analysis_jobs)")}
+    if "tokens_json" not in cols:
+        conn.execute("ALTER TABLE analysis_jobs ADD COLUMN tokens_json TEXT")  # prompt_packer の集計
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_jobs_fingerprint ON analysis_jobs(fingerprint, model)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_job_items (
+            job_id INTEGER,
+            seq INTEGER,            -- 入力JSONLの行番号（0始まり）。出力もこの順
+            user_id INTEGER,
+            line_name TEXT,
+            support TEXT,
+            status TEXT,            -- pending / done / error
+            report TEXT,
+            updated_at TEXT,
+            href TEXT,
+            user_key TEXT,          -- user_key(href, line_name, support)
+            PRIMARY KEY (job_id, seq)
+        ) WITHOUT ROWID
+    """)
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(analysis_job_items)")}
+    if "user_key" not in cols:
+        conn.execute("ALTER TABLE analysis_job_items ADD COLUMN href TEXT")
+        conn.execute("ALTER TABLE analysis_job_items ADD COLUMN user_key TEXT")
+        conn.execute(f"UPDATE analysis_job_items SET user_key = {NAME_KEY_SQL}")
+    _migrate_reports(conn)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_key TEXT,
+            user_id INTEGER,        -- 分析した時点の users.id（表示用。再スクレイピングで変わる）
+            line_name TEXT,
+            support TEXT,
+            model TEXT,
+            job_id INTEGER,         -- 最後に書き込んだジョブ
+            score_comm REAL,
+            score_time REAL,
+            score_overall REAL,
+            summary TEXT,
+            raw TEXT,               -- JSON として読めなかったときの原文（先頭 RAW_KEEP_CHARS 文字）
+            error TEXT,             -- 分析に失敗したとき（成功したレポートがあれば上書きしない）
+            created_at TEXT,
+            UNIQUE (user_key, model)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_support_score ON reports(support, score_overall)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_score ON reports(score_overall)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS report_improvements (
+            report_id INTEGER,
+            pos INTEGER,
+            text TEXT,
+            PRIMARY KEY (report_id, pos)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS report_examples (
+            report_id INTEGER,
+            pos INTEGER,
+            type TEXT,              -- good / bad
+            quote TEXT,
+            reason TEXT,
+            PRIMARY KEY (report_id, pos)
+        ) WITHOUT ROWID
+    """)
+    conn.commit()
+    return conn
+
+
+def _migrate_reports(conn: sqlite3.Connection) -> None:
+    """
+    UNIQUE (user_id, model) だった reports を user_key で作り直す（id はそのまま残すので改善案・例は付いたまま）。
+    旧形式には href が無いので 名前 + 担当 をキーにし、同じキーが複数あれば新しい行を残す。
+    """
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(reports)")}
+    if not cols or "user_key" in cols:
+        return
+    conn.execute("ALTER TABLE reports RENAME TO reports_old")
+    conn.execute("""
+        CREATE TABLE reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_key TEXT,
+            user_id INTEGER,
+            line_name TEXT,
+            support TEXT,
+            model TEXT,
+            job_id INTEGER,
+            score_comm REAL,
+            score_time REAL,
+            score_overall REAL,
+            summary TEXT,
+            raw TEXT,
+            error TEXT,
+            created_at TEXT,
+            UNIQUE (user_key, model)
+        )
+    """)
+    conn.execute(f"""
+        INSERT OR REPLACE INTO reports (id, user_key, user_id, line_name, support, model, job_id, score_comm,
+                                        score_time, score_overall, summary, raw, error, created_at)
+        SELECT id, {NAME_KEY_SQL}, user_id, line_name, support, model, job_id, score_comm,
+               score_time, score_overall, summary, raw, error, created_at
+        FROM reports_old ORDER BY id
+    """)
+    conn.execute("DROP TABLE reports_old")
+    conn.execute("DELETE FROM report_improvements WHERE report_id NOT IN (SELECT id FROM reports)")
+    conn.execute("DELETE FROM report_examples WHERE report_id NOT IN (SELECT id FROM reports)")
+
+
+def cache_key(model: str, prompt: str, mode: Optional[str] = None) -> str:
+    """mode: 単独で送ったなら None（従来のキーのまま）、まとめ送りなら prompt_packer.BATCH_MODE"""
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(prompt.encode("utf-8"))
+    if mode is not None:
+        h.update(b"\0")
+        h.update(mode.encode("utf-8"))
+    return h.hexdigest()
+
+
+class ReportCache:
+    """スレッドから同時に使えるレポートキャッシュ（1接続 + ロック）"""
+
+    def __init__(self, path: Path = STORE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.conn = connect(path)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+    def get(self, *keys: Optional[str]) -> Optional[str]:
+        """keys を順に探して最初に見つかったレポート（None のキーは飛ばす）"""
+        with self.lock:
+            row = None
+            for key in keys:
+                if key is not None:
+                    row = self.conn.execute("SELECT report FROM report_cache WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        break
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.conn.execute("UPDATE report_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?",
+                              (_now(), key))
+            self.conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, model: str, report: str):
+        now = _now()
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO report_cache (key, model, report, size, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET report = excluded.report, size = excluded.size,
+                                               last_used_at = excluded.last_used_at
+            """, (key, model, report, len(report.encode("utf-8")), now, now))
+            self.conn.commit()
+            self.stats["stored"] += 1
+
+    def evict(self) -> int:
+        """合計サイズが上限を超えていたら、最後に使われたのが古い順に消す。戻り値: 削除件数"""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM report_cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            target = total - int(self.max_bytes * EVICT_TO_RATIO)
+            # 古い順に並べ、それより前の行だけでは target に届かない行までを消す
+            cur = self.conn.execute("""
+                DELETE FROM report_cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, COALESCE(SUM(size) OVER (
+                            ORDER BY last_used_at, key ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                        ), 0) AS freed_before
+                        FROM report_cache
+                    ) WHERE freed_before < ?
+                )
+            """, (target,))
+            self.conn.commit()
+            self.stats["evicted"] += cur.rowcount
+            return cur.rowcount
+
+    def close(self):
+        self.evict()
+        self.conn.close()
+
+
+# ===== ジョブ（チェックポイント付きの分析実行） =====
+def latest_job(conn: sqlite3.Connection, fingerprint: str, model: str) -> Optional[int]:
+    """同じ入力・同じプロンプト・同じモデルの直近のジョブID"""
+    row = conn.execute("SELECT id FROM analysis_jobs WHERE fingerprint = ? AND model = ? ORDER BY id DESC LIMIT 1",
+                       (fingerprint, model)).fetchone()
+    return row[0] if row else None
+
+
+def create_job(conn: sqlite3.Connection, input_path: str, fingerprint: str, output_path: str, model: str,
+               items: Iterable[Tuple[int, Optional[int], Optional[str], Optional[str], Optional[str],
+                                     str, Optional[str]]]) -> int:
+    """items: (seq, user_id, href, line_name, support, status, report) を並び順に"""
+    now = _now()
+    cur = conn.execute("""
+        INSERT INTO analysis_jobs (input_path, fingerprint, output_path, model, status, total, created_at, updated_at)
+        VALUES (?, ?, ?, ?, 'running', 0, ?, ?)
+    """, (input_path, fingerprint, output_path, model, now, now))
+    job_id = cur.lastrowid
+    conn.executemany("""
+        INSERT INTO analysis_job_items (job_id, seq, user_id, href, line_name, support, status, report,
+                                        user_key, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, ((job_id, *item, user_key(*item[2:5]), now) for item in items))
+    conn.execute("UPDATE analysis_jobs SET total = (SELECT COUNT(*) FROM analysis_job_items WHERE job_id = ?) "
+                 "WHERE id = ?", (job_id, job_id))
+    # 既存のレポートから作ったジョブ（エラーのみ再実行・取り込み）は、終わっている分をここで reports に入れる
+    for key, user_id, line_name, support, report in conn.execute("""
+        SELECT user_key, user_id, line_name, support, report FROM analysis_job_items
+        WHERE job_id = ? AND status = 'done' AND report IS NOT NULL
+    """, (job_id,)).fetchall():
+        save_report(conn, job_id, key, user_id, line_name, support, model, report)
+    conn.commit()
+    return job_id
+
+
+def pending_seqs(conn: sqlite3.Connection, job_id: int) -> Set[int]:
+    """まだ終わっていない（pending / error）行番号"""
+    return {r[0] for r in conn.execute(
+        "SELECT seq FROM analysis_job_items WHERE job_id = ? AND status != 'done'", (job_id,))}
+
+
+def record_item(conn: sqlite3.Connection, job_id: int, seq: int, status: str, report: str):
+    """1件分の結果を確定する（ここでコミットするので、以降に落ちてもこの件は失われない）"""
+    now = _now()
+    conn.execute("UPDATE analysis_job_items SET status = ?, report = ?, updated_at = ? WHERE job_id = ? AND seq = ?",
+                 (status, report, now, job_id, seq))
+    conn.execute("UPDATE analysis_jobs SET status = 'running', updated_at = ? WHERE id = ?", (now, job_id))
+    row = conn.execute("""
+        SELECT i.user_key, i.user_id, i.line_name, i.support, j.model
+        FROM analysis_job_items i JOIN analysis_jobs j ON j.id = i.job_id
+        WHERE i.job_id = ? AND i.seq = ?
+    """, (job_id, seq)).fetchone()
+    if row is not None:
+        save_report(conn, job_id, *row, report)
+    conn.commit()
+
+
+def finish_job(conn: sqlite3.Connection, job_id: int, tokens: Optional[dict] = None) -> dict:
+    conn.execute("""
+        UPDATE analysis_jobs SET
+            status = 'done',
+            done = (SELECT COUNT(*) FROM analysis_job_items WHERE job_id = ?1 AND status = 'done'),
+            errors = (SELECT COUNT(*) FROM analysis_job_items WHERE job_id = ?1 AND status = 'error'),
+            tokens_json = ?3,
+            updated_at = ?2
+        WHERE id = ?1
+    """, (job_id, _now(), json.dumps(tokens) if tokens is not None else None))
+    conn.commit()
+    row = conn.execute("SELECT total, done, errors FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+    return {"job_id": job_id, "total": row[0], "done": row[1], "errors": row[2], "tokens": tokens}
+
+
+def iter_job_items(conn: sqlite3.Connection, job_id: int) -> Iterator[Tuple]:
+    """(seq, user_id, href, line_name, support, status, report) を行番号順に"""
+    yield from conn.execute("""
+        SELECT seq, user_id, href, line_name, support, status, report
+        FROM analysis_job_items WHERE job_id = ? ORDER BY seq
+    """, (job_id,))
+
+
+# ===== 解析済みレポート =====
+def _to_score(v) -> Optional[float]:
+    try:
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_report_text(txt: str) -> Dict:
+    """
+    Gemini のレポート本文（JSON。```json で囲まれていてもよい）を項目に分ける。
+    JSON として読めなければ正規表現で最低限を拾い、原文を "_raw" に残す。
+    """
+    txt = txt or ""
+    start, end = txt.find("{"), txt.rfind("}")
+    try:
+        obj = json.loads(txt[start:end + 1] if 0 <= start < end else txt)
+        if not isinstance(obj, dict):
+            raise ValueError("not an object")
+        imps = obj.get("improvements") or []
+        exs = obj.get("notable_examples") or []
+        return {
+            "score_comm": _to_score(obj.get("score_communication")),
+            "score_time": _to_score(obj.get("score_timeliness")),
+            "score_overall": _to_score(obj.get("score_overall")),
+            "summary": obj.get("summary"),
+            "improvements": [str(i) for i in ([imps] if isinstance(imps, str) else imps)],
+            "examples": [e for e in exs if isinstance(e, dict)] if isinstance(exs, list) else [],
+            "_raw": None,
+        }
+    except ValueError:  # json.JSONDecodeError も含む
+        # 正規表現で最低限を抽出
+        sc = re.search(r"score_communication[^0-9]*([0-5](?:\.\d+)?)", txt)
+        st = re.search(r"score_timeliness[^0-9]*([0-5](?:\.\d+)?)", txt)
+        so = re.search(r"score_overall[^0-9]*([0-5](?:\.\d+)?)", txt)
+        sm = re.search(r'"summary"\s*:\s*"([^"]+)"', txt)
+        im = re.findall(r'"improvements"\s*:\s*\[(.*?)\]', txt, flags=re.S)
+        return {
+            "score_comm": float(sc.group(1)) if sc else None,
+            "score_time": float(st.group(1)) if st else None,
+            "score_overall": float(so.group(1)) if so else None,
+            "summary": sm.group(1) if sm else None,
+            "improvements": re.findall(r'"([^"]+)"', im[0]) if im else [],
+            "examples": [],
+            "_raw": txt[:RAW_KEEP_CHARS],  # 長すぎ防止
+        }
+
+
+def _adopt_name_keyed(conn: sqlite3.Connection, key: str, line_name: Optional[str],
+                      support: Optional[str], model: str):
+    """href の無い頃（旧形式・取り込み）に 名前 + 担当 で保存した同じユーザーの行を、href のキーに寄せる"""
+    old = _name_key(line_name, support)
+    if key == old:
+        return
+    conn.execute("UPDATE OR IGNORE reports SET user_key = ? WHERE user_key = ? AND model = ?", (key, old, model))
+    for (rid,) in conn.execute("SELECT id FROM reports WHERE user_key = ? AND model = ?", (old, model)).fetchall():
+        # href の行が既にあった（寄せられなかった）古い行は消す
+        conn.execute("DELETE FROM report_improvements WHERE report_id = ?", (rid,))
+        conn.execute("DELETE FROM report_examples WHERE report_id = ?", (rid,))
+        conn.execute("DELETE FROM reports WHERE id = ?", (rid,))
+
+
+def save_report(conn: sqlite3.Connection, job_id: int, key: str, user_id: Optional[int],
+                line_name: Optional[str], support: Optional[str], model: str, report: Optional[str]):
+    """
+    レポート本文を解析して reports に書く（コミットは呼び出し側）。key は user_key()。
+    同じユーザー × モデルは1行（再スクレイピングで user_id が変わっても上書き）。
+    失敗（ERROR: ...）は、そのユーザーの成功したレポートがまだ無いときだけ記録する。
+    """
+    now = _now()
+    _adopt_name_keyed(conn, key, line_name, support, model)
+    if not report or report.startswith(ERROR_PREFIX):
+        conn.execute("""
+            INSERT INTO reports (user_key, user_id, line_name, support, model, job_id, error, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_key, model) DO UPDATE SET error = excluded.error, job_id = excluded.job_id,
+                                                      user_id = excluded.user_id
+            WHERE reports.error IS NOT NULL
+        """, (key, user_id, line_name, support, model, job_id, report or ERROR_PREFIX + "(空の応答)", now))
+        return
+    p = parse_report_text(report)
+    conn.execute("""
+        INSERT INTO reports (user_key, user_id, line_name, support, model, job_id, score_comm, score_time,
+                             score_overall, summary, raw, error, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)
+        ON CONFLICT(user_key, model) DO UPDATE SET
+            user_id = excluded.user_id, line_name = excluded.line_name, support = excluded.support,
+            job_id = excluded.job_id, score_comm = excluded.score_comm, score_time = excluded.score_time,
+            score_overall = excluded.score_overall, summary = excluded.summary,
+            raw = excluded.raw, error = NULL, created_at = excluded.created_at
+    """, (key, user_id, line_name, support, model, job_id, p["score_comm"], p["score_time"], p["score_overall"],
+          p["summary"], p["_raw"], now))
+    report_id = conn.execute("SELECT id FROM reports WHERE user_key = ? AND model = ?",
+                             (key, model)).fetchone()[0]
+    conn.execute("DELETE FROM report_improvements WHERE report_id = ?", (report_id,))
+    conn.execute("DELETE FROM report_examples WHERE report_id = ?", (report_id,))
+    conn.executemany("INSERT INTO report_improvements (report_id, pos, text) VALUES (?, ?, ?)",
+                     ((report_id, i, t) for i, t in enumerate(p["improvements"])))
+    conn.executemany("INSERT INTO report_examples (report_id, pos, type, quote, reason) VALUES (?, ?, ?, ?, ?)",
+                     ((report_id, i, e.get("type"), e.get("quote"), e.get("reason"))
+                      for i, e in enumerate(p["examples"])))
+
+
+def job_for_output(conn: sqlite3.Connection, output_path) -> Optional[Tuple[int, str]]:
+    """レポートファイルを書いた直近のジョブ (job_id, model)"""
+    return conn.execute("SELECT id, model FROM analysis_jobs WHERE output_path = ? ORDER BY id DESC LIMIT 1",
+                        (str(output_path),)).fetchone()
+
+
+REPORT_COLUMNS = """
+    r.id, r.user_id, r.line_name, r.support, r.model, r.score_comm, r.score_time, r.score_overall,
+    r.summary, r.raw, r.error, r.created_at,
+    (SELECT json_group_array(text) FROM
+        (SELECT text FROM report_improvements WHERE report_id = r.id ORDER BY pos)) AS improvements
+"""
+
+
+def _report_dict(row) -> Dict:
+    rid, user_id, line_name, support, model, sc, st, so, summary, raw, error, created_at, imps = row
+    return {
+        "id": rid, "user_id": user_id, "line_name": line_name, "support": support, "model": model,
+        "score_comm": sc, "score_time": st, "score_overall": so, "summary": summary,
+        "improvements": json.loads(imps) if imps else [],
+        "_raw": error or raw, "created_at": created_at,
+    }
+
+
+# 一覧表示用の軽い行（改善案・原文は含めない。詳しくは get_report で1件ずつ引く）
+REPORT_HEAD_COLUMNS = """
+    r.id, r.user_id, r.line_name, r.support, r.score_comm, r.score_time, r.score_overall,
+    r.summary, r.error IS NOT NULL
+"""
+
+
+def _head_dict(row) -> Dict:
+    rid, user_id, line_name, support, sc, st, so, summary, failed = row
+    return {
+        "id": rid, "user_id": user_id, "line_name": line_name, "support": support,
+        "score_comm": sc, "score_time": st, "score_overall": so, "summary": summary or "",
+        "error": bool(failed),
+    }
+
+
+def iter_job_report_heads(conn: sqlite3.Connection, job_id: int) -> Iterator[Dict]:
+    """
+    ジョブ（＝レポートファイル）に含まれるユーザーの最新レポートを、一覧用の行（スコア・要約だけ）で
+    ファイルと同じ順に。カーソルのまま少しずつ読める
+    """
+    cur = conn.execute(f"""
+        SELECT {REPORT_HEAD_COLUMNS}
+        FROM analysis_job_items i
+        JOIN analysis_jobs j ON j.id = i.job_id
+        JOIN reports r ON r.user_key = i.user_key AND r.model = j.model
+        WHERE i.job_id = ?
+        ORDER BY i.seq
+    """, (job_id,))
+    for row in cur:
+        yield _head_dict(row)
+
+
+def job_supports(conn: sqlite3.Connection, job_id: int) -> List[str]:
+    """ジョブに含まれる担当の一覧（一覧の担当の選択肢用）"""
+    return [r[0] for r in conn.execute(
+        "SELECT DISTINCT support FROM analysis_job_items WHERE job_id = ? AND support IS NOT NULL ORDER BY support",
+        (job_id,))]
+
+
+def get_report(conn: sqlite3.Connection, report_id: int) -> Optional[Dict]:
+    """1件分のレポート（改善案・特徴的なやり取り・原文つき）"""
+    row = conn.execute(f"SELECT {REPORT_COLUMNS} FROM reports r WHERE r.id = ?", (report_id,)).fetchone()
+    if not row:
+        return None
+    rec = _report_dict(row)
+    rec["examples"] = [{"type": t, "quote": q, "reason": r} for t, q, r in conn.execute(
+        "SELECT type, quote, reason FROM report_examples WHERE report_id = ? ORDER BY pos", (report_id,))]
+    return rec
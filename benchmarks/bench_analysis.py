@@ -0,0 +1,87 @@
+# benchmarks/bench_analysis.py
+# 分析パイプライン（データセット生成 → analyze_with_gemini）をスタブの LLM でオフラインに通し、
+# 同時実行数ごとの所要時間・まとめ送り・キャッシュ・応答の解析を確かめる。
+#
+# 使い方: python benchmarks/bench_analysis.py [ユーザー数] [遅延秒] [エラー率]   （既定: 1000 0.2 0.05）
+# 出力はすべて一時フォルダ（analysis_out/analysis.db も）に作るので、実データには触れない。
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import make_db
+
+from analysis_pipeline import analyze_with_gemini, build_datasets_for_all_supports
+from llm_backends import StubBackend
+
+CONCURRENCY = [4, 16, 64]
+
+
+def _check_reports(path: Path, n: int) -> str:
+    """行数・user_id の並び・レポートが JSON として読めるかを確認する"""
+    rows = [json.loads(line) for line in path.open(encoding="utf-8")]
+    errors = sum(1 for r in rows if r["report"].startswith("ERROR: "))
+    parsed = 0
+    for r in rows:
+        text = r["report"].strip().removeprefix("```json").removesuffix("```")
+        try:
+            obj = json.loads(text)
+            parsed += isinstance(obj, dict) and "score_overall" in obj
+        except json.JSONDecodeError:
+            pass
+    ordered = [r["user_id"] for r in rows] == sorted(r["user_id"] for r in rows)
+    return f"rows={len(rows)}/{n} errors={errors} parsed={parsed} ordered={ordered}"
+
+
+def _run(label: str, jsonl: Path, n: int, backend: StubBackend, concurrency: int, **kw):
+    t0 = time.perf_counter()
+    out, _, stats = analyze_with_gemini(jsonl, concurrency=concurrency, backend=backend, **kw)
+    sec = time.perf_counter() - t0
+    tok = stats["tokens"]
+    print(f"  {label:<22} {sec:7.2f}s  {stats['analyzed'] / sec:7.1f} 会話/s  "
+          f"calls={backend.stats['calls']} (429 {backend.stats['errors']})  "
+          f"max_in_flight={backend.stats['max_in_flight']}  requests={tok['requests']}  "
+          f"batched={tok['batched_conversations']}  cache={tok['cache_hits']}  "
+          f"{_check_reports(out, n)}")
+
+
+def main(n_users: int, latency: float, error_rate: float):
+    work = tempfile.mkdtemp(prefix="bench_analysis_")
+    cwd = os.getcwd()
+    os.chdir(work)  # analysis_out/analysis.db を作業フォルダに作る
+    try:
+        db = os.path.join(work, "synthetic.db")
+        make_db(db, n_users=n_users, n_messages=n_users * 50)
+        out_dir = Path(work) / "analysis_out"
+        out_dir.mkdir(exist_ok=True)
+        _, manifest = build_datasets_for_all_supports(db, out_dir)
+        # 担当ごとのシャードを1本にまとめて入力にする
+        jsonl = out_dir / "all.jsonl"
+        with jsonl.open("w", encoding="utf-8") as fw:
+            for name in sorted(sh["file"] for sh in manifest["shards"].values()):
+                fw.write((out_dir / name).read_text(encoding="utf-8"))
+        rows = sorted((json.loads(line) for line in jsonl.open(encoding="utf-8")), key=lambda r: r["user_id"])
+        jsonl.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), encoding="utf-8")
+        n = len(rows)
+        print(f"=== {n} 会話（スタブ: 遅延 {latency}s, 429 {error_rate:.0%}） ===")
+
+        for c in CONCURRENCY:
+            backend = StubBackend(latency=latency, error_rate=error_rate, backoff=0.05, seed=c)
+            # 最後の回だけキャッシュに書き込む（次の再実行で全件ヒットするはず）
+            _run(f"concurrency={c}", jsonl, n, backend, c, use_cache=(c == CONCURRENCY[-1]), resume=False)
+
+        backend = StubBackend(latency=latency, error_rate=error_rate, backoff=0.05)
+        _run("再実行（キャッシュ）", jsonl, n, backend, CONCURRENCY[-1], resume=False)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 1000,
+         float(args[1]) if len(args) > 1 else 0.2,
+         float(args[2]) if len(args) > 2 else 0.05)
@@ -0,0 +1,49 @@
+# benchmarks/bench_export.py
+# ストリーミングCSVエクスポート: 件数を増やしてもピークメモリが一定かを確認する
+#
+# 使い方: python benchmarks/bench_export.py [件数,件数,...]   （既定: 500000,5000000）
+# ピークメモリは tracemalloc（Pythonヒープ）で計測。SQLiteのページキャッシュは含まない。
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from synthetic import make_db
+
+from exporter import export_tables_to_csv
+
+
+def main(sizes):
+    work = tempfile.mkdtemp(prefix="bench_export_")
+    try:
+        for n in sizes:
+            db = os.path.join(work, f"synthetic_{n}.db")
+            t0 = time.perf_counter()
+            make_db(db, n_users=max(100, n // 100), n_messages=n)
+            t_make = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            res = export_tables_to_csv(db, os.path.join(work, "out_time"))
+            t_export = time.perf_counter() - t0
+
+            tracemalloc.start()
+            export_tables_to_csv(db, os.path.join(work, "out_mem"))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            size = os.path.getsize(res["messages"])
+            print(f"messages={n:>10,}  users={res['users_count']:>7,}  db_build={t_make:6.1f}s  "
+                  f"export={t_export:6.1f}s ({n / t_export:,.0f} rows/s, {size / t_export / 1e6:.1f} MB/s)  "
+                  f"peak_py_heap={peak / 1e6:.1f} MB")
+            shutil.rmtree(os.path.join(work, "out_time"), ignore_errors=True)
+            shutil.rmtree(os.path.join(work, "out_mem"), ignore_errors=True)
+            os.remove(db)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    arg = sys.argv[1] if len(sys.argv) > 1 else "500000,5000000"
+    main([int(x) for x in arg.split(",")])
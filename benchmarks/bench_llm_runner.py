@@ -0,0 +1,76 @@
+# benchmarks/bench_llm_runner.py
+# llm_runner の並列実行: 同時実行数ごとの所要時間、レート制限の効き、429 からの回復、出力順を確認する
+#
+# 使い方: python benchmarks/bench_llm_runner.py [件数]   （既定: 200）
+# 実際の Gemini は呼ばない。応答待ち LATENCY 秒・一定割合で 429 を返す偽モデルで測る。
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # リポジトリ直下
+
+from llm_runner import RateLimiter, call_with_retry, run_ordered
+
+LATENCY = 0.2        # 1リクエストの応答時間（秒）
+ERROR_RATE = 0.1     # 429 を返す割合
+
+
+class ResourceExhausted(Exception):
+    """google.api_core.exceptions.ResourceExhausted の代わり"""
+    code = 429
+
+
+class FakeModel:
+    def __init__(self, seed: int = 1):
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def generate_content(self, prompt: str) -> str:
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.rnd.random() < ERROR_RATE
+        try:
+            time.sleep(LATENCY)
+            if fail:
+                raise ResourceExhausted("429 Resource has been exhausted")
+            return f"report for {prompt}"
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def run(n: int, concurrency: int, rpm: float = 0):
+    model = FakeModel()
+    limiter = RateLimiter(rpm=rpm, window_sec=1.0)
+
+    def _analyze(i: int) -> str:
+        def _once():
+            limiter.acquire()
+            return model.generate_content(str(i))
+        return call_with_retry(_once, retries=5, backoff=0.05, max_backoff=0.5)
+
+    t0 = time.perf_counter()
+    results = list(run_ordered(range(n), _analyze, concurrency=concurrency))
+    sec = time.perf_counter() - t0
+    ordered = [item for item, _, _ in results] == list(range(n))
+    errors = sum(1 for _, _, err in results if err is not None)
+    print(f"concurrency={concurrency:>2}  rpm={rpm or '-':>5}  {sec:6.2f}s  {n / sec * 60:7.0f} req/min  "
+          f"calls={model.calls} (retries {model.calls - n})  max_in_flight={model.max_in_flight}  "
+          f"errors={errors}  ordered={ordered}")
+
+
+def main(n: int):
+    for c in (1, 4, 8, 16):
+        run(n, c)
+    run(n, 16, rpm=1200)  # 20 req/s に制限（同時実行数を増やしても超えない）
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,58 @@
+# benchmarks/bench_message_store.py
+# 本文の zstd 辞書圧縮: DBサイズと messages_v の読み出しスループットを比較する
+#
+# 使い方: python benchmarks/bench_message_store.py [メッセージ件数]
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from synthetic import make_db
+
+from message_store import compress_messages, connect
+
+
+def _scan(db_path: str) -> tuple[int, float]:
+    conn = connect(db_path)
+    try:
+        t0 = time.perf_counter()
+        n = 0
+        for (text,) in conn.execute("SELECT message FROM messages_v"):
+            n += 1
+        return n, time.perf_counter() - t0
+    finally:
+        conn.close()
+
+
+def main(n_messages: int = 200000):
+    work = tempfile.mkdtemp(prefix="bench_store_")
+    try:
+        plain = os.path.join(work, "plain.db")
+        packed = os.path.join(work, "packed.db")
+        make_db(plain, n_users=max(100, n_messages // 50), n_messages=n_messages)
+        conn = connect(plain); conn.execute("VACUUM"); conn.close()
+        shutil.copy(plain, packed)
+
+        t0 = time.perf_counter()
+        stats = compress_messages(packed)
+        t_compress = time.perf_counter() - t0
+
+        size_plain = os.path.getsize(plain)
+        size_packed = os.path.getsize(packed)
+        n1, t1 = _scan(plain)
+        n2, t2 = _scan(packed)
+
+        print(f"messages          : {n_messages:,}")
+        print(f"compress          : {t_compress:.2f}s  rows={stats['rows']:,} skipped={stats['skipped']:,}")
+        print(f"body bytes        : {stats['raw_bytes']:,} -> {stats['stored_bytes']:,} "
+              f"({stats['stored_bytes'] / max(1, stats['raw_bytes']):.1%})")
+        print(f"db size           : {size_plain:,} -> {size_packed:,} ({size_packed / size_plain:.1%})")
+        print(f"read plain        : {n1 / t1:,.0f} rows/s")
+        print(f"read compressed   : {n2 / t2:,.0f} rows/s")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,118 @@
+# benchmarks/bench_metrics.py
+# 応答時間の集計: 会話ごとに Python で回す従来方式と、response_metrics（SQL の LAG() で一括）を比べる
+#
+# 使い方: python benchmarks/bench_metrics.py [メッセージ数]   （既定: 1000000）
+# 両方式の ユーザー別の結果が一致することも確認する。
+import math
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from synthetic import make_db
+
+from message_store import connect
+from response_metrics import latency_metrics
+
+CUSTOMER_SENDER = "you"
+SUPPORT_SENDER = "me"
+
+
+# ===== 従来の実装（比較用。analysis_pipeline にあったもの） =====
+def _parse_time(ts):
+    if not ts: return None
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime(ts, fmt).replace(tzinfo=timezone.utc)
+        except Exception:
+            continue
+    try:
+        return datetime.fromisoformat(ts).replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
+
+
+def _compute_response_metrics(messages):
+    lat = []
+    prev = None
+    for m in messages:
+        if m["template"]:
+            continue
+        t = _parse_time(m["time"])
+        if t is None:
+            continue
+        if prev and prev["sender"] == CUSTOMER_SENDER and m["sender"] == SUPPORT_SENDER:
+            lat.append((t - prev["time"]).total_seconds())
+        prev = {"sender": m["sender"], "time": t}
+    if not lat:
+        return {"count": 0}
+    lat_sorted = sorted(lat)
+    def pct(p):
+        k = (len(lat_sorted)-1)*p
+        a = math.floor(k); b = math.ceil(k)
+        if a == b: return lat_sorted[int(k)]
+        return lat_sorted[a] + (lat_sorted[b]-lat_sorted[a])*(k-a)
+    return {
+        "count": len(lat), "avg_sec": sum(lat)/len(lat), "median_sec": statistics.median(lat),
+        "p90_sec": pct(0.90), "p95_sec": pct(0.95), "min_sec": min(lat), "max_sec": max(lat),
+    }
+
+
+def per_conversation(conn) -> dict:
+    """ユーザーごとに会話を組み立ててから集計する（データセット作成と同じ読み方）"""
+    out, uid, msgs = {}, None, []
+    cur = conn.execute("""
+        SELECT m.user_id, m.sender, m.time_sent, m.is_template
+        FROM users u JOIN messages_v m ON u.id = m.user_id
+        ORDER BY u.id, m.time_sent, m.id
+    """)
+    for user_id, sender, time_sent, is_template in cur:
+        if user_id != uid:
+            if uid is not None:
+                out[uid] = _compute_response_metrics(msgs)
+            uid, msgs = user_id, []
+        msgs.append({"sender": sender, "time": time_sent, "template": bool(is_template)})
+    if uid is not None:
+        out[uid] = _compute_response_metrics(msgs)
+    return out
+
+
+def main(n_messages: int):
+    work = tempfile.mkdtemp(prefix="bench_metrics_")
+    try:
+        db = os.path.join(work, "synthetic.db")
+        t0 = time.perf_counter()
+        make_db(db, n_users=max(100, n_messages // 100), n_messages=n_messages)
+        # 合成DBのサポート側はほぼ定型文なので、一部を手入力の返信にする（応答時間が出るように）
+        raw = sqlite3.connect(db)
+        raw.execute("UPDATE messages SET sender = 'me', message = '確認します' WHERE id % 4 = 0")
+        raw.commit()
+        raw.close()
+        print(f"=== {n_messages:,} messages（作成 {time.perf_counter() - t0:.1f}s） ===")
+
+        conn = connect(db)
+        t0 = time.perf_counter()
+        old = per_conversation(conn)
+        t_old = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        by_user, by_support = latency_metrics(conn, CUSTOMER_SENDER, SUPPORT_SENDER)
+        t_new = time.perf_counter() - t0
+        conn.close()
+
+        old = {uid: m for uid, m in old.items() if m["count"]}  # 新方式は応答のないユーザーを返さない
+        print(f"  会話ごと（Python）  {t_old:7.2f}s")
+        print(f"  一括（SQL LAG）     {t_new:7.2f}s  x{t_old / t_new:.1f}  "
+              f"users={len(by_user)}  supports={len(by_support)}  一致={old == by_user}")
+        for sup, m in sorted(by_support.items())[:3]:
+            print(f"    {sup}: count={m['count']} median={m['median_sec'] / 60:.0f}分 p90={m['p90_sec'] / 60:.0f}分")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
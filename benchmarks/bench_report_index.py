@@ -0,0 +1,89 @@
+# benchmarks/bench_report_index.py
+# レポートJSONLの表示: 全行を読んで解析する従来方式と、索引（report_index）で必要な行だけ読む方式を比べる
+#
+# 使い方: python benchmarks/bench_report_index.py [レポート数]   （既定: 50000）
+# 最初のページ・特定 user_id の表示までの時間と、その間のメモリの最大使用量（tracemalloc）を出す。
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # リポジトリ直下
+
+from analysis_store import parse_report_text
+from llm_backends import StubBackend
+from report_index import IndexWriter, build_index, index_path, open_index
+
+PAGE = 100
+
+
+def _write_reports(path: str, n: int):
+    stub = StubBackend(latency=0, error_rate=0)
+    rnd = random.Random(1)
+    with open(path, "wb") as fw:
+        index = IndexWriter(fw)
+        for uid in range(1, n + 1):
+            if rnd.random() < 0.02:
+                report = "ERROR: 429 Resource has been exhausted"
+            else:
+                report, _ = stub.generate(f"【担当者】S{uid % 7}\n[2024-01-01 10:00:00] you: 質問 {uid}\n"
+                                          f"[2024-01-01 10:05:00] me: 回答 {uid} " + "あ" * rnd.randint(50, 400))
+            index.write({"user_id": uid, "line_name": f"ユーザー{uid}", "support": f"S{uid % 7}", "report": report})
+    index.save(path)
+
+
+def _full(path: str, user_id: int):
+    """従来: 全行を読んで解析してから表示"""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            rows.append({**rec, **parse_report_text(rec["report"])})
+    return rows[:PAGE], next(r for r in rows if r["user_id"] == user_id)
+
+
+def _indexed(path: str, user_id: int):
+    idx = open_index(path)
+    try:
+        return idx.page(0, PAGE), idx.read(idx.find(user_id))
+    finally:
+        idx.close()
+
+
+def _measure(label, fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    res = fn(*args)
+    sec = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<24} {sec * 1000:9.1f}ms  peak {peak / 1e6:7.1f}MB")
+    return res
+
+
+def main(n: int):
+    work = tempfile.mkdtemp(prefix="bench_report_index_")
+    try:
+        path = os.path.join(work, "reports.jsonl")
+        t0 = time.perf_counter()
+        _write_reports(path, n)
+        print(f"=== {n:,} reports（{os.path.getsize(path) / 1e6:.1f}MB, 索引 {os.path.getsize(index_path(path)) / 1e6:.2f}MB,"
+              f" 書き込み {time.perf_counter() - t0:.1f}s） ===")
+        target = n * 3 // 4
+        old_page, old_rec = _measure("全件読み込み", _full, path, target)
+        new_page, new_rec = _measure("索引（1ページ + seek）", _indexed, path, target)
+        os.remove(index_path(path))
+        _measure("索引の作り直し", build_index, path)
+        same = [r["summary"] for r in old_page] == [r["summary"] for r in new_page] \
+            and old_rec["summary"] == new_rec["summary"] and new_rec["user_id"] == target
+        print(f"  一致={same}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,150 @@
+# benchmarks/bench_upload.py
+# upload_db_ftps をローカル FTPS（ftps_server.py）に向けて走らせ、
+# スループットと blocksize / 圧縮 / 差分 / 転送再開 の効果を測る。
+# 障害を注入して 再開・rename・アップロード後の確認（探索）の経路も通す。
+#
+# 使い方:
+#     python benchmarks/bench_upload.py                    # 10MB, 100MB
+#     python benchmarks/bench_upload.py 10,100,1000        # MB 単位（1000 ≒ 1GB。DB作成に数分かかる）
+#     python benchmarks/bench_upload.py --faults           # 障害注入のシナリオだけ（10MB）
+#
+# どのシナリオもサーバー側に届いたファイルを展開して messages の件数を照合する。
+# ループバックなので回線の遅さは再現しない（暗号化・ディスク・Python側の処理の比較になる）。
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from synthetic import make_db
+
+from db_delta import unpack
+from ftps_server import PASSWORD, USER, LocalFTPS
+import uploader
+
+BYTES_PER_MESSAGE = 140            # synthetic.make_db の1件あたりのDBサイズ（実測）
+BLOCKSIZES = [8 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024]
+REMOTE_DIR = "public_html/support/"
+REMOTE_NAME = "lstep_users.db"
+
+
+def _count(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _remote_count(srv: LocalFTPS, payload_name: str) -> int:
+    """サーバー側のファイルを（必要なら db_delta.unpack で展開して）件数を返す"""
+    remote_db = srv.path(REMOTE_DIR + REMOTE_NAME)
+    if payload_name != REMOTE_NAME:
+        unpack(srv.path(REMOTE_DIR + payload_name), remote_db)
+    return _count(remote_db)
+
+
+def _upload(srv: LocalFTPS, db: str, **kw) -> tuple[dict, float]:
+    t0 = time.perf_counter()
+    debug = uploader.upload_db_ftps(USER, PASSWORD, hosts=[srv.host], port=srv.port,
+                                    remote_dir=REMOTE_DIR, remote_name=REMOTE_NAME, local_file=db,
+                                    timeout=10, backoff=0.0, **kw)
+    return debug, time.perf_counter() - t0
+
+
+def _report(label: str, debug: dict, sec: float, db: str, expected: int, got: int):
+    """payload はネットワークに出た量、effective は元DBのサイズ / 所要時間（圧縮・差分の効果込み）"""
+    trial = next((t for t in reversed(debug["trials"]) if t.get("ok")), debug["trials"][-1] if debug["trials"] else {})
+    size = debug.get("payload", {}).get("size") or trial.get("transfer", {}).get("bytes", 0)
+    resumes = len(trial.get("resumes", []))
+    ok = debug.get("success") and expected == got
+    print(f"  {label:<26} payload={size / 1e6:9.3f} MB  {sec:6.2f}s  "
+          f"effective={os.path.getsize(db) / sec / 1e6:7.1f} MB/s  "
+          f"resumes={resumes}  trials={len(debug['trials'])}  {'OK' if ok else 'NG'}"
+          + ("" if ok else f"  ({debug.get('error')} / rows {got} != {expected})"))
+
+
+def _make_sized_db(path: str, mb: int) -> int:
+    n = max(1000, mb * 1_000_000 // BYTES_PER_MESSAGE)
+    make_db(path, n_users=max(100, n // 100), n_messages=n)
+    return n
+
+
+def bench_size(work: str, mb: int):
+    db = os.path.join(work, f"synthetic_{mb}mb.db")
+    t0 = time.perf_counter()
+    n = _make_sized_db(db, mb)
+    print(f"\n=== {os.path.getsize(db) / 1e6:.0f} MB ({n:,} messages, 作成 {time.perf_counter() - t0:.1f}s) ===")
+
+    with LocalFTPS() as srv:
+        for bs in BLOCKSIZES:
+            debug, sec = _upload(srv, db, blocksize=bs)
+            _report(f"full blocksize={bs // 1024}K", debug, sec, db, n, _remote_count(srv, REMOTE_NAME))
+        for method in ("gzip", "zstd"):
+            try:
+                debug, sec = _upload(srv, db, compress=method)
+            except RuntimeError as e:  # zstandard 未インストール
+                print(f"  {method:<26} スキップ: {e}")
+                continue
+            payload_name = REMOTE_NAME + uploader.COMPRESS_SUFFIX[method]
+            _report(f"compress={method}", debug, sec, db, n, _remote_count(srv, payload_name))
+
+        # 差分: 基準をフルで送る → 数百件追加 → .delta だけ送ってサーバー側で適用
+        _upload(srv, db, delta=True)
+        conn = sqlite3.connect(db)
+        conn.executemany("INSERT INTO messages (user_id, sender_name, sender, message, time_sent) "
+                         "VALUES (1, 'x', 'you', ?, '2025-01-01 00:00')", [(f"追加 {i}",) for i in range(300)])
+        conn.commit()
+        conn.close()
+        n += 300
+        debug, sec = _upload(srv, db, delta=True)
+        _report("delta (+300 messages)", debug, sec, db, n, _remote_count(srv, REMOTE_NAME + ".delta"))
+
+        # 転送の途中で回線断 → 再接続して続きから
+        srv.faults.update(drop_session_after=os.path.getsize(db) // 2, drops=1)
+        debug, sec = _upload(srv, db)
+        _report("drop at 50% → resume", debug, sec, db, n, _remote_count(srv, REMOTE_NAME))
+    os.remove(db)
+
+
+def bench_faults(work: str):
+    db = os.path.join(work, "faults.db")
+    n = _make_sized_db(db, 10)
+    print(f"\n=== 障害注入（{os.path.getsize(db) / 1e6:.0f} MB） ===")
+    scenarios = [
+        ("data channel 426 x2", dict(drop_data_after=2_000_000, drops=2)),
+        ("session drop x3", dict(drop_session_after=1_000_000, drops=3)),
+        ("drop on RNTO", dict(drop_on_rename=1)),
+        ("hidden in LIST → search", dict(hide_in_list=1)),
+    ]
+    for label, faults in scenarios:
+        with LocalFTPS(**faults) as srv:
+            debug, sec = _upload(srv, db, snapshot=False)
+            _report(label, debug, sec, db, n, _remote_count(srv, REMOTE_NAME))
+            trial = debug["trials"][-1]
+            print(f"    注入: {srv.events}  探索: {trial.get('search_results')} {trial.get('search_stats', '')}")
+            leftovers = [f for f in os.listdir(srv.path(REMOTE_DIR)) if f.endswith(".tmp")]
+            if leftovers:
+                print(f"    ⚠️ .tmp が残っています: {leftovers}")
+    os.remove(db)
+
+
+def main(sizes, faults_only=False):
+    work = tempfile.mkdtemp(prefix="bench_upload_")
+    cwd = os.getcwd()
+    os.chdir(work)  # .upload_state を作業フォルダに作る
+    try:
+        bench_faults(work)
+        if not faults_only:
+            for mb in sizes:
+                bench_size(work, mb)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    sizes = [int(x) for x in (args[0] if args else "10,100").split(",")]
+    main(sizes, faults_only="--faults" in sys.argv)
@@ -0,0 +1,198 @@
+# benchmarks/ftps_server.py
+# upload_db_ftps を本番ホストなしで試すためのローカル FTPS サーバー（pyftpdlib + 自己署名証明書）
+#
+# 使い方:
+#     with LocalFTPS(drop_session_after=3_000_000) as srv:
+#         upload_db_ftps("u", "p", hosts=[srv.host], port=srv.port, remote_dir="public_html/support/", ...)
+#         srv.path("public_html/support/lstep_users.db")   # サーバー側の実ファイル
+#
+# 単体起動（手動確認用）: python benchmarks/ftps_server.py [port]
+#
+# 障害の注入（いずれも回数指定。0 なら注入しない）:
+#   drop_data_after=N     … STOR で N バイト受けたらデータ接続だけ切る（426 応答）
+#   drop_session_after=N  … STOR で N バイト受けたら制御・データ両方の接続を切る（回線断相当）
+#   drop_on_rename=k      … RNTO を受けたら rename せずに接続を切る（k 回）
+#   hide_in_list=k        … LIST の結果からファイルを隠す（k 回。MLSD では見える。探索経路の確認用）
+#   drops=k               … drop_*_after を何回起こすか（既定 1）
+#   no_size=True          … SIZE を 502 で断る（SIZE 非対応のサーバー相当）
+#
+# 必要: pip install pyftpdlib pyopenssl（cryptography も pyopenssl と一緒に入る）
+import datetime
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.filesystems import AbstractedFS
+from pyftpdlib.handlers import TLS_DTPHandler, TLS_FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+USER = "u"
+PASSWORD = "p"
+
+
+def make_self_signed(cert_path: str, key_path: str, host: str = "127.0.0.1"):
+    """ローカル用の自己署名証明書と鍵を書き出す"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=30))
+            .sign(key, hashes.SHA256()))
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+
+
+class LocalFTPS:
+    """一時ディレクトリをルートにした FTPS サーバーを別スレッドで動かす"""
+
+    def __init__(self, port: int = 0, root: str = None, drop_data_after: int = 0,
+                 drop_session_after: int = 0, drops: int = 1, drop_on_rename: int = 0,
+                 hide_in_list: int = 0, no_size: bool = False):
+        self.host = "127.0.0.1"
+        self._port = port
+        self._own_root = root is None
+        self.root = root or tempfile.mkdtemp(prefix="ftps_root_")
+        self._certdir = tempfile.mkdtemp(prefix="ftps_cert_")
+        # 注入する障害の残り回数（ハンドラから書き換える）
+        self.faults = {
+            "drop_data_after": drop_data_after,
+            "drop_session_after": drop_session_after,
+            "drops": drops if (drop_data_after or drop_session_after) else 0,
+            "drop_on_rename": drop_on_rename,
+            "hide_in_list": hide_in_list,
+            "no_size": no_size,
+        }
+        self.events = []  # 実際に注入した障害の記録
+        self._server = None
+        self._thread = None
+
+    # ===== 起動・停止 =====
+    def start(self) -> "LocalFTPS":
+        cert, key = os.path.join(self._certdir, "cert.pem"), os.path.join(self._certdir, "key.pem")
+        make_self_signed(cert, key, self.host)
+
+        authorizer = DummyAuthorizer()
+        # uploader は "u" と "u@host" の両方を試すので、どちらでも同じホームに入れる
+        for name in (USER, f"{USER}@{self.host}"):
+            authorizer.add_user(name, PASSWORD, self.root, perm="elradfmwMT")
+
+        faults, events = self.faults, self.events
+
+        class _DTP(TLS_DTPHandler):
+            def handle_read_event(self):
+                super().handle_read_event()
+                if not self.receive or faults["drops"] <= 0:
+                    return
+                for kind in ("drop_session_after", "drop_data_after"):
+                    limit = faults[kind]
+                    if limit and self.tot_bytes_received >= limit:
+                        faults["drops"] -= 1
+                        events.append((kind, self.tot_bytes_received))
+                        cmd = self.cmd_channel
+                        if kind == "drop_session_after":
+                            self.close()
+                            cmd.close()
+                        else:
+                            self._resp = ("426 Connection closed; transfer aborted.", lambda *a: None)
+                            self.close()
+                        return
+
+        class _FS(AbstractedFS):
+            hide_files = False
+
+            def listdir(self, path):
+                names = super().listdir(path)
+                if self.hide_files:
+                    names = [n for n in names if os.path.isdir(os.path.join(path, n))]
+                return names
+
+        class _Handler(TLS_FTPHandler):
+            certfile = cert
+            keyfile = key
+            dtp_handler = _DTP
+            abstracted_fs = _FS
+            tls_control_required = True
+            tls_data_required = True
+
+            def ftp_RNTO(self, path):
+                if faults["drop_on_rename"] > 0:
+                    faults["drop_on_rename"] -= 1
+                    events.append(("drop_on_rename", path))
+                    self.close()
+                    return
+                return super().ftp_RNTO(path)
+
+            def ftp_SIZE(self, path):
+                if faults["no_size"]:
+                    self.respond("502 Command not implemented.")
+                    return
+                return super().ftp_SIZE(path)
+
+            def ftp_LIST(self, path):
+                if faults["hide_in_list"] > 0:
+                    faults["hide_in_list"] -= 1
+                    events.append(("hide_in_list", path))
+                    self.fs.hide_files = True  # listdir はこの中で同期的に呼ばれる
+                    try:
+                        return super().ftp_LIST(path)
+                    finally:
+                        self.fs.hide_files = False
+                return super().ftp_LIST(path)
+
+        _Handler.authorizer = authorizer
+        # ハンドラを付けておくと pyftpdlib が INFO ログを stderr に出す設定をしない
+        log = logging.getLogger("pyftpdlib")
+        if not log.handlers:
+            log.addHandler(logging.StreamHandler())
+            log.setLevel(logging.WARNING)
+        self._server = ThreadedFTPServer((self.host, self._port), _Handler)
+        self.port = self._server.address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"handle_exit": False},
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close_all()
+            self._server = None
+        shutil.rmtree(self._certdir, ignore_errors=True)
+        if self._own_root:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self) -> "LocalFTPS":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ===== 確認用 =====
+    def path(self, remote_path: str) -> str:
+        """リモートパス（ホーム基準）→ サーバー側の実ファイルパス"""
+        return os.path.join(self.root, remote_path.strip("/"))
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 2121
+    srv = LocalFTPS(port=port).start()
+    print(f"FTPS: {srv.host}:{srv.port}  user={USER} password={PASSWORD}  root={srv.root}")
+    print("Ctrl+C で終了")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.stop()
@@ -0,0 +1,139 @@
+# benchmarks/synthetic.py
+# ベンチマーク用の合成DB（users / messages）を作る
+#
+# 実データに近づけるため、サポート側(me)の多くは定型文・一斉配信、
+# ユーザー側(you)は短い自由文にしている。
+import json
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+SUPPORTS = ["佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村"]
+
+TEMPLATES = [
+    "{name}さん、ご登録ありがとうございます！\nこちらから無料講座の第{n}回をご覧いただけます。\nhttps://example.com/lesson/{n}",
+    "【お知らせ】本日20時からライブ配信を行います。\n参加URLはこちら👇\nhttps://example.com/live",
+    "{name}さん、その後いかがでしょうか？\n分からないことがあればお気軽にご質問ください😊",
+    "ご質問ありがとうございます。担当の{support}です。\n確認して折り返しご連絡いたします。",
+    "【第{n}回】副業で月5万円を達成するためのステップを解説します。\n最後まで読んでくださいね！",
+    "個別相談のご予約はこちらから承っております。\nhttps://example.com/reserve",
+]
+
+CUSTOMER_WORDS = [
+    "ありがとうございます", "よろしくお願いします", "質問です", "動画見ました",
+    "難しいです", "できました！", "明日でも大丈夫ですか", "予約しました",
+    "ログインできません", "了解です", "教えてください", "助かります",
+]
+
+
+def _customer_text(rnd: random.Random) -> str:
+    return "".join(rnd.choice(CUSTOMER_WORDS) + rnd.choice(["。", "！", "？", "\n"])
+                   for _ in range(rnd.randint(1, 4)))
+
+
+def make_db(path: str, n_users: int = 2000, n_messages: int = 100000,
+            seed: int = 1, start: datetime = datetime(2024, 1, 1)) -> str:
+    """合成DBを path に作成する（既存ファイルは上書き）"""
+    if os.path.exists(path):
+        os.remove(path)
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            line_name TEXT, href TEXT, support TEXT, friend_registered_at TEXT,
+            tags TEXT, display_name TEXT, friend_value TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER, sender_name TEXT, sender TEXT, message TEXT, time_sent TEXT
+        )
+    """)
+    users = []
+    for uid in range(1, n_users + 1):
+        support = rnd.choice(SUPPORTS)
+        reg = start + timedelta(minutes=rnd.randint(0, 60 * 24 * 365))
+        fv = {"メールアドレス": f"user{uid}@example.com", "収益シート": rnd.choice(["", "済", "未"])}
+        if rnd.random() < 0.3:
+            fv["呼び方(さんは入れない）"] = f"ユーザー{uid}"
+        users.append((f"ユーザー{uid}", f"/basic/friendlist/my_page/{27000000 + uid}",
+                      support, reg.strftime("%Y-%m-%d %H:%M"), None, None,
+                      json.dumps(fv, ensure_ascii=False)))
+    cur.executemany(
+        "INSERT INTO users (line_name, href, support, friend_registered_at, tags, display_name, friend_value) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)", users)
+
+    # ユーザーごとに時系列で会話を生成（最後の1人が端数を持つ）
+    per_user = max(1, n_messages // n_users)
+    batch = []
+    remaining = n_messages
+    for uid in range(1, n_users + 1):
+        cnt = per_user if uid < n_users else remaining
+        remaining -= cnt
+        support = users[uid - 1][2]
+        t = datetime.strptime(users[uid - 1][3], "%Y-%m-%d %H:%M")
+        for _ in range(cnt):
+            t += timedelta(minutes=rnd.randint(1, 60 * 24))
+            if rnd.random() < 0.55:
+                tpl = rnd.choice(TEMPLATES)
+                text = tpl.format(name=f"ユーザー{uid}" if rnd.random() < 0.2 else "", n=rnd.randint(1, 7), support=support)
+                batch.append((uid, support, "me", text, t.strftime("%Y-%m-%d %H:%M:00")))
+            else:
+                batch.append((uid, None, "you", _customer_text(rnd), t.strftime("%Y-%m-%d %H:%M:00")))
+            if len(batch) >= 50000:
+                cur.executemany("INSERT INTO messages (user_id, sender_name, sender, message, time_sent) VALUES (?, ?, ?, ?, ?)", batch)
+                batch.clear()
+    if batch:
+        cur.executemany("INSERT INTO messages (user_id, sender_name, sender, message, time_sent) VALUES (?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def chat_history(path: str) -> list:
+    """LINE 側にある会話の全履歴として、現行DBのメッセージを (href, sender_name, sender, message, time_sent) で返す"""
+    from message_store import connect
+    conn = connect(path)
+    try:
+        return conn.execute("""
+            SELECT u.href, m.sender_name, m.sender, m.message, m.time_sent
+            FROM messages_v m JOIN users u ON u.id = m.user_id
+            ORDER BY m.id
+        """).fetchall()
+    finally:
+        conn.close()
+
+
+def rescrape(path: str, history: list) -> str:
+    """
+    ui_main.run_scraping と同じく users / messages を DELETE して、history（chat_history の形）を入れ直す。
+    AUTOINCREMENT なので users.id・messages.id は振り直され、本文は平文で入る。
+    """
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    users = cur.execute(
+        "SELECT line_name, href, support, friend_registered_at, tags, display_name, friend_value FROM users ORDER BY id"
+    ).fetchall()
+    cur.execute("DELETE FROM messages")
+    cur.execute("DELETE FROM users")
+    new_id = {}
+    for row in users:
+        cur.execute(
+            "INSERT INTO users (line_name, href, support, friend_registered_at, tags, display_name, friend_value) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+        new_id[row[1]] = cur.lastrowid
+    cur.executemany(
+        "INSERT INTO messages (user_id, sender_name, sender, message, time_sent) VALUES (?, ?, ?, ?, ?)",
+        [(new_id[href], *rest) for href, *rest in history])
+    conn.commit()
+    conn.close()
+    return path
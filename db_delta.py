@@ -0,0 +1,169 @@
+# db_delta.py
+# SQLite ファイルのページ単位の差分（.delta）と圧縮ファイル（.gz / .zst）の作成・展開
+#
+# サーバー側は標準ライブラリだけで展開できる（.zst のみ zstandard が必要）:
+#     python db_delta.py unpack lstep_users.db.delta lstep_users.db
+#     python db_delta.py unpack lstep_users.db.gz    lstep_users.db
+#
+# .delta の中身（全体を gzip 圧縮）:
+#     b"LDBDELTA 1\n" + JSONヘッダ1行 + [ページ番号(4byte BE) + ページ本体] * 変更ページ数
+# ヘッダの base_sha1 が展開先の現在のDBと一致しないときは適用しない。
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+try:
+    import zstandard as zstd
+except ImportError:  # .zst を使わないなら不要
+    zstd = None
+
+MAGIC = b"LDBDELTA 1\n"
+COPY_BUFSIZE = 1024 * 1024
+
+
+def sqlite_page_size(path) -> int:
+    """SQLite ヘッダ（オフセット16, 2byte）からページサイズを読む"""
+    with open(path, "rb") as f:
+        header = f.read(100)
+    if not header.startswith(b"SQLite format 3\x00"):
+        raise ValueError(f"SQLite のDBファイルではありません: {path}")
+    size = struct.unpack(">H", header[16:18])[0]
+    return 65536 if size == 1 else size
+
+
+def file_sha1(path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_BUFSIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def page_hashes(path, page_size: Optional[int] = None) -> Tuple[int, List[bytes]]:
+    """(page_size, 各ページの sha1 digest のリスト)"""
+    page_size = page_size or sqlite_page_size(path)
+    hashes = []
+    with open(path, "rb") as f:
+        for page in iter(lambda: f.read(page_size), b""):
+            hashes.append(hashlib.sha1(page).digest())
+    return page_size, hashes
+
+
+def save_page_hashes(path, hashes: List[bytes]):
+    with open(path, "wb") as f:
+        f.write(b"".join(hashes))
+
+
+def load_page_hashes(path) -> List[bytes]:
+    data = Path(path).read_bytes()
+    return [data[i:i + 20] for i in range(0, len(data), 20)]
+
+
+def make_delta(new_path, base_hashes: List[bytes], base_sha1: str, page_size: int,
+               out_path, new_hashes: Optional[List[bytes]] = None) -> dict:
+    """
+    new_path と「前回アップロード分のページハッシュ」を比べ、変わったページだけの .delta を作る。
+    戻り値: {"pages": 総ページ数, "changed": 変更ページ数, "size": .delta のサイズ}
+    """
+    if new_hashes is None:
+        _, new_hashes = page_hashes(new_path, page_size)
+    changed = [i for i, h in enumerate(new_hashes)
+               if i >= len(base_hashes) or base_hashes[i] != h]
+    header = {
+        "page_size": page_size,
+        "new_size": os.path.getsize(new_path),
+        "base_sha1": base_sha1,
+        "new_sha1": file_sha1(new_path),
+        "changed": len(changed),
+    }
+    with open(new_path, "rb") as fr, gzip.open(out_path, "wb", compresslevel=6) as fw:
+        fw.write(MAGIC)
+        fw.write(json.dumps(header).encode("utf-8") + b"\n")
+        for i in changed:
+            fr.seek(i * page_size)
+            fw.write(struct.pack(">I", i))
+            fw.write(fr.read(page_size))
+    return {"pages": len(new_hashes), "changed": len(changed), "size": os.path.getsize(out_path),
+            "new_sha1": header["new_sha1"]}
+
+
+def apply_delta(base_path, delta_path, out_path) -> dict:
+    """base_path に .delta を適用した結果を out_path に書く（base_path 自体は変更しない）"""
+    with gzip.open(delta_path, "rb") as fr:
+        if fr.readline() != MAGIC:
+            raise ValueError("差分ファイルの形式が不正です")
+        header = json.loads(fr.readline())
+        if file_sha1(base_path) != header["base_sha1"]:
+            raise ValueError("展開先のDBが差分の基準と一致しません（フルアップロードが必要です）")
+        page_size = header["page_size"]
+        shutil.copyfile(base_path, out_path)
+        with open(out_path, "r+b") as fw:
+            fw.truncate(header["new_size"])
+            for _ in range(header["changed"]):
+                (idx,) = struct.unpack(">I", fr.read(4))
+                fw.seek(idx * page_size)
+                fw.write(fr.read(page_size))
+    if file_sha1(out_path) != header["new_sha1"]:
+        raise ValueError("差分適用後のハッシュが一致しません")
+    return header
+
+
+def compress_file(path, method: str) -> Path:
+    """path を gzip / zstd で圧縮し、隣に <name>.gz / <name>.zst を作って返す"""
+    path = Path(path)
+    if method == "gzip":
+        out = path.with_name(path.name + ".gz")
+        with path.open("rb") as fr, gzip.open(out, "wb", compresslevel=6) as fw:
+            shutil.copyfileobj(fr, fw, COPY_BUFSIZE)
+        return out
+    if method == "zstd":
+        if zstd is None:
+            raise RuntimeError("zstd 圧縮には zstandard が必要です（pip install zstandard）")
+        out = path.with_name(path.name + ".zst")
+        with path.open("rb") as fr, out.open("wb") as fw:
+            zstd.ZstdCompressor(level=10, threads=-1).copy_stream(fr, fw)
+        return out
+    raise ValueError(f"未対応の圧縮形式です: {method}")
+
+
+def unpack(src, dest) -> str:
+    """
+    サーバー側の展開手順。拡張子で判定して dest を置き換える（一時ファイル → 置換）。
+    .delta は dest の現在の内容を基準に適用する。
+    """
+    src, dest = Path(src), Path(dest)
+    fd, tmp = tempfile.mkstemp(prefix=dest.name + ".", dir=str(dest.parent or "."))
+    os.close(fd)
+    try:
+        if src.suffix == ".delta":
+            apply_delta(dest, src, tmp)
+        elif src.suffix == ".gz":
+            with gzip.open(src, "rb") as fr, open(tmp, "wb") as fw:
+                shutil.copyfileobj(fr, fw, COPY_BUFSIZE)
+        elif src.suffix == ".zst":
+            if zstd is None:
+                raise RuntimeError(".zst の展開には zstandard が必要です")
+            with src.open("rb") as fr, open(tmp, "wb") as fw:
+                zstd.ZstdDecompressor().copy_stream(fr, fw)
+        else:
+            raise ValueError(f"未対応のファイルです: {src}")
+        os.replace(tmp, dest)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return str(dest)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "unpack":
+        print("使い方: python db_delta.py unpack <.delta|.gz|.zst> <展開先DB>")
+        sys.exit(2)
+    print(f"✅ 展開しました: {unpack(sys.argv[2], sys.argv[3])}")
@@ -0,0 +1,527 @@
+# exporter.py
+# users / messages のエクスポート（カーソルを少しずつ読みながら書き出す）
+#
+# fetchall() で全件をメモリに載せないので、messages が何百万件あってもピークメモリはほぼ一定。
+# 形式は CSV（UTF-8 BOM）に加えて、型付きの Parquet / Arrow IPC も選べる。
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from message_store import MESSAGE_KEY_SQL, connect as connect_messages
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet / Arrow 出力を使わないなら不要（pip install pyarrow）
+    pa = pc = pq = None
+
+DB_PATH = "lstep_users.db"
+OUT_DIR = "exports"
+CHUNK_SIZE = 5000
+ROW_GROUP_SIZE = 100000       # Parquet の row group / Arrow の record batch 単位
+EXPORT_FORMATS = {"csv": "csv", "parquet": "parquet", "arrow": "arrow"}  # 形式 -> 拡張子
+
+# 列ごとの型（これ以外の列は文字列）
+INT_COLUMNS = {"id", "user_id"}
+DICT_COLUMNS = {"sender", "support"}                 # 値の種類が少ないので辞書エンコード
+TIMESTAMP_COLUMNS = {"time_sent", "friend_registered_at"}
+TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M")
+MESSAGE_COLUMNS = ["id", "user_id", "sender_name", "sender", "message", "time_sent"]
+
+
+def _iter_chunks(cur, size: int = CHUNK_SIZE) -> Iterator[list]:
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def friend_value_labels(conn) -> List[str]:
+    """
+    users.friend_value(JSON) に現れるラベルを、初出順（users.id 順 → JSON内の並び順）で返す。
+    行は読み込まず、SQLite の json_each で集計する。
+    """
+    # MIN(u.id) と同じ行の j.id（JSON内の位置）が pos に入る（SQLite の集約の仕様）
+    rows = conn.execute("""
+        SELECT j.key, MIN(u.id) AS first_uid, j.id AS pos
+        FROM users u,
+             json_each(CASE WHEN json_valid(u.friend_value)
+                            THEN CASE WHEN json_type(u.friend_value) = 'object'
+                                      THEN u.friend_value END
+                       END) j
+        GROUP BY j.key
+        ORDER BY first_uid, pos
+    """).fetchall()
+    return [str(r[0]) for r in rows]
+
+
+def _parse_friend_value(raw) -> dict:
+    if not raw:
+        return {}
+    try:
+        obj = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    if not isinstance(obj, dict):
+        return {}
+    return {str(k): v for k, v in obj.items()}
+
+
+# ===================== Parquet / Arrow =====================
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Parquet / Arrow 出力には pyarrow が必要です（pip install pyarrow）")
+
+
+class _DictEncoder:
+    """
+    バッチをまたいで同じ辞書を育てる（既存値の番号は変えない）。
+    Arrow IPC でも辞書の差分追記だけで済み、Parquet でも列の辞書が安定する。
+    """
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, vals) -> "pa.DictionaryArray":
+        idx = []
+        for v in vals:
+            if v is None:
+                idx.append(None)
+                continue
+            v = str(v)
+            i = self.index.get(v)
+            if i is None:
+                i = self.index[v] = len(self.values)
+                self.values.append(v)
+            idx.append(i)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(idx, type=pa.int32()), pa.array(self.values, type=pa.string())
+        )
+
+
+def _arrow_type(name: str):
+    if name in INT_COLUMNS:
+        return pa.int64()
+    if name in DICT_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if name in TIMESTAMP_COLUMNS:
+        return pa.timestamp("s")
+    return pa.string()
+
+
+def _to_timestamp(vals) -> "pa.Array":
+    arr = pa.array([None if v is None else str(v) for v in vals], type=pa.string())
+    parsed = [pc.strptime(arr, format=f, unit="s", error_is_null=True) for f in TIMESTAMP_FORMATS]
+    return pc.coalesce(*parsed)
+
+
+class _ColumnarWriter:
+    """Parquet / Arrow IPC の書き出しを同じ手順で扱う（row group 単位で追記）"""
+    missing = None
+
+    def __init__(self, path: str, fmt: str, columns: List[str]):
+        self.columns = columns
+        self.schema = pa.schema([pa.field(c, _arrow_type(c)) for c in columns])
+        self.encoders = {c: _DictEncoder() for c in columns if c in DICT_COLUMNS}
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(
+                self._sink, self.schema,
+                options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True),
+            )
+        self.fmt = fmt
+
+    def write_rows(self, rows: list):
+        cols = list(zip(*rows)) if rows else [() for _ in self.columns]
+        arrays = []
+        for name, vals in zip(self.columns, cols):
+            if name in self.encoders:
+                arrays.append(self.encoders[name].encode(vals))
+            elif name in TIMESTAMP_COLUMNS:
+                arrays.append(_to_timestamp(vals))
+            elif name in INT_COLUMNS:
+                arrays.append(pa.array(vals, type=pa.int64()))
+            else:
+                arrays.append(pa.array([None if v is None else str(v) for v in vals], type=pa.string()))
+        batch = pa.record_batch(arrays, schema=self.schema)
+        if self.fmt == "parquet":
+            self._writer.write_batch(batch, row_group_size=len(rows) or None)
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+        if self.fmt != "parquet":
+            self._sink.close()
+
+
+# ===================== 共通の書き出し =====================
+class _CsvWriter:
+    """CSV（UTF-8 BOM）を _ColumnarWriter と同じ手順で扱う"""
+    missing = ""
+
+    def __init__(self, path: str, columns: List[str]):
+        self.columns = columns
+        self._fw = open(path, "w", encoding="utf-8-sig", newline="")
+        self._w = csv.writer(self._fw)
+        self._w.writerow(columns)
+
+    def write_rows(self, rows: list):
+        self._w.writerows(rows)
+
+    def close(self):
+        self._fw.close()
+
+
+def _open_writer(path: str, fmt: str, columns: List[str]):
+    if fmt == "csv":
+        return _CsvWriter(path, columns)
+    _require_pyarrow()
+    return _ColumnarWriter(path, fmt, columns)
+
+
+def write_users(conn, out_path: str, fmt: str = "csv",
+                where: str = "", params: tuple = (), labels: Optional[List[str]] = None) -> int:
+    """
+    users を friend_value のラベル列つきで書き出す。戻り値: 件数
+    where を渡すとその条件の行だけ（差分出力用）。labels 省略時は全 users から集計。
+    """
+    cur = conn.cursor()
+    cur.execute(f"SELECT * FROM users {where} ORDER BY id", params)
+    cols = [d[0] for d in cur.description]
+    fv_idx = cols.index("friend_value") if "friend_value" in cols else None
+    if fv_idx is not None and labels is None:
+        labels = friend_value_labels(conn)
+    header = [c for c in cols if c != "friend_value"] + labels if fv_idx is not None else cols
+
+    writer = _open_writer(out_path, fmt, header)
+    chunk_size = CHUNK_SIZE if fmt == "csv" else ROW_GROUP_SIZE
+    n = 0
+    try:
+        for rows in _iter_chunks(cur, chunk_size):
+            if fv_idx is not None:
+                out = []
+                for row in rows:
+                    parsed = _parse_friend_value(row[fv_idx])
+                    base = [v for i, v in enumerate(row) if i != fv_idx]
+                    out.append(base + [parsed.get(label, writer.missing) for label in labels])
+                rows = out
+            writer.write_rows(rows)
+            n += len(rows)
+    finally:
+        writer.close()
+    return n
+
+
+def write_messages(conn, out_path: str, fmt: str = "csv", where: str = "", params: tuple = ()) -> int:
+    """messages_v（圧縮・共有本文は平文）を書き出す。戻り値: 件数"""
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(MESSAGE_COLUMNS)} FROM messages_v {where}", params)
+    writer = _open_writer(out_path, fmt, MESSAGE_COLUMNS)
+    chunk_size = CHUNK_SIZE if fmt == "csv" else ROW_GROUP_SIZE
+    n = 0
+    try:
+        for rows in _iter_chunks(cur, chunk_size):
+            writer.write_rows(rows)
+            n += len(rows)
+    finally:
+        writer.close()
+    return n
+
+
+# ===================== 入口 =====================
+def _stamp() -> str:
+    # 同じ秒に2回出力しても上書きしないようマイクロ秒まで付ける
+    return datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+
+
+def export_tables(db_path: str = DB_PATH, out_dir: str = OUT_DIR,
+                  fmt: str = "csv", include_archives: bool = False) -> dict:
+    """
+    users と messages を fmt（csv / parquet / arrow）で出力する。
+    include_archives=True ならアーカイブ済みの過去メッセージも含める。
+    戻り値: {"users": <path>, "messages": <path>, "users_count": n, "messages_count": n}
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"未対応の出力形式です: {fmt}（{', '.join(EXPORT_FORMATS)}）")
+    if fmt != "csv":
+        _require_pyarrow()
+
+    os.makedirs(out_dir, exist_ok=True)
+    ts = _stamp()
+    ext = EXPORT_FORMATS[fmt]
+    out_users = os.path.join(out_dir, f"users_{ts}.{ext}")
+    out_messages = os.path.join(out_dir, f"messages_{ts}.{ext}")
+
+    conn = connect_messages(db_path, include_archives=include_archives)
+    try:
+        users_count = write_users(conn, out_users, fmt)
+        messages_count = write_messages(conn, out_messages, fmt)
+        return {"users": out_users, "messages": out_messages,
+                "users_count": users_count, "messages_count": messages_count}
+    finally:
+        conn.close()
+
+
+def export_tables_to_csv(db_path: str = DB_PATH, out_dir: str = OUT_DIR,
+                         include_archives: bool = False) -> dict:
+    """users と messages を CSV 出力（UTF-8 with BOM）する。"""
+    return export_tables(db_path, out_dir, fmt="csv", include_archives=include_archives)
+
+
+# ===================== 差分エクスポート =====================
+# スクレイピングのたびに users / messages は DELETE → 入れ直しになり id が振り直されるので、
+# 「前回どこまで出したか」は id ではなく行の内容で覚える。
+# - users:    href ごとに追跡列のハッシュ（export_users）。新しい href・値が変わった行を出す
+# - messages: message_store.MESSAGE_KEY_SQL の内容キー（export_messages）。まだ出していないキーの行を出す
+# アーカイブで現行DBから消えた行は「削除」とは扱わない（出力済みのまま）。
+USERS_TRACKED_COLUMNS = ["line_name", "href", "support", "friend_registered_at",
+                         "tags", "display_name", "friend_value"]
+
+
+def ensure_export_tracking(conn) -> None:
+    """export_runs と、出力済みの行を覚える export_users / export_messages を用意"""
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS export_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,                 -- full / delta / compact
+            fmt TEXT,
+            created_at TEXT,
+            users_path TEXT,
+            messages_path TEXT,
+            users_count INTEGER,
+            messages_count INTEGER
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS export_users (
+            href TEXT PRIMARY KEY,
+            row_hash TEXT,
+            run_id INTEGER
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS export_messages (
+            user_href TEXT,
+            sender TEXT,
+            time_sent TEXT,
+            msg_key TEXT,
+            occurrence INTEGER,
+            run_id INTEGER,
+            PRIMARY KEY (user_href, sender, time_sent, msg_key, occurrence)
+        ) WITHOUT ROWID
+    """)
+    # 旧方式（updated_at トリガ）の名残は使わないので外す
+    cur.execute("DROP TRIGGER IF EXISTS users_touch_insert")
+    cur.execute("DROP TRIGGER IF EXISTS users_touch_update")
+    conn.commit()
+
+
+def _last_run(conn) -> Optional[dict]:
+    cur = conn.execute("SELECT * FROM export_runs ORDER BY id DESC LIMIT 1")
+    row = cur.fetchone()
+    return dict(zip([d[0] for d in cur.description], row)) if row else None
+
+
+def _stage_delta(conn) -> None:
+    """
+    まだ出していない行を temp.delta_users / temp.delta_messages（id と内容キー）に集める。
+    users は href ごとに最後の行だけを見る。href がない（ユーザーに結び付かない）行は毎回出す。
+    """
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    tracked = " || '|' || ".join(f"quote(u.{c})" for c in USERS_TRACKED_COLUMNS if c in cols)
+    conn.create_function("sha1", 1, lambda s: hashlib.sha1(s.encode("utf-8")).hexdigest(), deterministic=True)
+    conn.execute("DROP TABLE IF EXISTS temp.delta_users")
+    conn.execute(f"""
+        CREATE TEMP TABLE delta_users AS
+        SELECT u.id, u.href, sha1({tracked}) AS row_hash
+        FROM users u
+        WHERE u.href IS NULL
+           OR u.id IN (SELECT MAX(id) FROM users WHERE href IS NOT NULL GROUP BY href)
+    """)
+    conn.execute("""
+        DELETE FROM temp.delta_users
+        WHERE EXISTS (SELECT 1 FROM main.export_users e
+                      WHERE e.href = delta_users.href AND e.row_hash = delta_users.row_hash)
+    """)
+    conn.execute("DROP TABLE IF EXISTS temp.delta_messages")
+    conn.execute(f"CREATE TEMP TABLE delta_messages AS {MESSAGE_KEY_SQL.format(where='')}")
+    conn.execute("""
+        DELETE FROM temp.delta_messages
+        WHERE EXISTS (SELECT 1 FROM main.export_messages e
+                      WHERE e.user_href = delta_messages.href AND e.sender = delta_messages.sender
+                        AND e.time_sent = delta_messages.time_sent AND e.msg_key = delta_messages.msg_key
+                        AND e.occurrence = delta_messages.occurrence)
+    """)
+
+
+def export_incremental(db_path: str = DB_PATH, out_dir: str = OUT_DIR, fmt: str = "csv") -> dict:
+    """
+    前回の出力以降に追加・変更された行だけを users_delta_<ts> / messages_delta_<ts> に出力する。
+    - 初回（出力済みの記録がない）は通常の全件出力（kind=full）になる
+    - 再スクレイピングで id が変わっても、内容が同じ行は出し直さない
+    - 出した行の内容キーを export_users / export_messages に、実行を export_runs に記録する
+    戻り値: export_tables と同じ形 + "kind"
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"未対応の出力形式です: {fmt}（{', '.join(EXPORT_FORMATS)}）")
+    os.makedirs(out_dir, exist_ok=True)
+
+    conn = connect_messages(db_path)
+    try:
+        ensure_export_tracking(conn)
+        # 旧方式（id の目印）で出していたDBは、内容キーの記録が空なので1回全件から始め直す
+        tracked = conn.execute("SELECT 1 FROM export_users UNION ALL SELECT 1 FROM export_messages LIMIT 1").fetchone()
+        kind = "delta" if _last_run(conn) and tracked else "full"
+        _stage_delta(conn)
+
+        ts = _stamp()
+        ext = EXPORT_FORMATS[fmt]
+        suffix = "_delta" if kind == "delta" else ""
+        out_users = os.path.join(out_dir, f"users{suffix}_{ts}.{ext}")
+        out_messages = os.path.join(out_dir, f"messages{suffix}_{ts}.{ext}")
+
+        users_count = write_users(conn, out_users, fmt, "WHERE id IN (SELECT id FROM temp.delta_users)")
+        messages_count = write_messages(conn, out_messages, fmt,
+                                        "WHERE id IN (SELECT id FROM temp.delta_messages) ORDER BY id")
+
+        cur = conn.execute("""
+            INSERT INTO export_runs (kind, fmt, created_at, users_path, messages_path, users_count, messages_count)
+            VALUES (?, ?, datetime('now', 'localtime'), ?, ?, ?, ?)
+        """, (kind, fmt, out_users, out_messages, users_count, messages_count))
+        run_id = cur.lastrowid
+        conn.execute("""
+            INSERT OR REPLACE INTO export_users (href, row_hash, run_id)
+            SELECT href, row_hash, ? FROM temp.delta_users WHERE href IS NOT NULL
+        """, (run_id,))
+        conn.execute("""
+            INSERT OR IGNORE INTO export_messages (user_href, sender, time_sent, msg_key, occurrence, run_id)
+            SELECT href, sender, time_sent, msg_key, occurrence, ? FROM temp.delta_messages
+            WHERE href IS NOT NULL
+        """, (run_id,))
+        conn.commit()
+        return {"kind": kind, "users": out_users, "messages": out_messages,
+                "users_count": users_count, "messages_count": messages_count}
+    finally:
+        conn.close()
+
+
+def _read_rows(path: str, fmt: str) -> Iterator[tuple]:
+    """出力済みファイルを (header, rows) のチャンクで読み直す"""
+    if fmt == "csv":
+        with open(path, "r", encoding="utf-8-sig", newline="") as fr:
+            r = csv.reader(fr)
+            header = next(r, [])
+            chunk = []
+            for row in r:
+                chunk.append(row)
+                if len(chunk) >= CHUNK_SIZE:
+                    yield header, chunk
+                    chunk = []
+            if chunk:
+                yield header, chunk
+        return
+    _require_pyarrow()
+    if fmt == "parquet":
+        batches = pq.ParquetFile(path).iter_batches(batch_size=ROW_GROUP_SIZE)
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    for batch in batches:
+        header = batch.schema.names
+        yield header, [tuple(d[c] for c in header) for d in batch.to_pylist()]
+
+
+def compact_exports(db_path: str = DB_PATH, out_dir: str = OUT_DIR) -> dict:
+    """
+    直近の全件出力（full / compact）とその後の差分をまとめて、1つの全件スナップショットにする。
+    - users は href ごとに最後の行を採用（id は再スクレイピングで変わるため）、messages は順に連結
+    - 結果は kind=compact として export_runs に記録（次の差分はここから続く）
+    戻り値: export_tables と同じ形 + "merged"（まとめたファイル数）
+    """
+    conn = connect_messages(db_path)
+    try:
+        ensure_export_tracking(conn)
+        cur = conn.execute("SELECT * FROM export_runs ORDER BY id")
+        names = [d[0] for d in cur.description]
+        runs = [dict(zip(names, r)) for r in cur.fetchall()]
+        base = max((i for i, r in enumerate(runs) if r["kind"] in ("full", "compact")), default=None)
+        if base is None:
+            raise RuntimeError("全件出力の記録がありません。先に差分エクスポートを1回実行してください。")
+        chain = runs[base:]
+        fmt = chain[0]["fmt"]
+        if any(r["fmt"] != fmt for r in chain):
+            raise RuntimeError("形式の異なる出力が混在しているため結合できません。")
+
+        ts = _stamp()
+        ext = EXPORT_FORMATS[fmt]
+        out_users = os.path.join(out_dir, f"users_{ts}.{ext}")
+        out_messages = os.path.join(out_dir, f"messages_{ts}.{ext}")
+
+        # users: id ごとに最新の行（件数は users テーブル程度なのでメモリで持つ）
+        header_u: List[str] = []
+        latest: Dict[str, dict] = {}
+        for r in chain:
+            for header, rows in _read_rows(r["users_path"], fmt):
+                for h in header:
+                    if h not in header_u:
+                        header_u.append(h)
+                for row in rows:
+                    d = dict(zip(header, row))
+                    latest[str(d.get("href") or f"id:{d.get('id')}")] = d
+        writer = _open_writer(out_users, fmt, header_u)
+        try:
+            ordered = list(latest.values())
+            for i in range(0, len(ordered), CHUNK_SIZE):
+                writer.write_rows([[d.get(h, writer.missing) for h in header_u]
+                                   for d in ordered[i:i + CHUNK_SIZE]])
+        finally:
+            writer.close()
+
+        # messages: 差分どうしは内容キーが重ならないので順に流し込むだけ
+        messages_count = 0
+        writer = _open_writer(out_messages, fmt, MESSAGE_COLUMNS)
+        try:
+            for r in chain:
+                for header, rows in _read_rows(r["messages_path"], fmt):
+                    idx = [header.index(c) for c in MESSAGE_COLUMNS]
+                    writer.write_rows([[row[i] for i in idx] for row in rows])
+                    messages_count += len(rows)
+        finally:
+            writer.close()
+
+        conn.execute("""
+            INSERT INTO export_runs (kind, fmt, created_at, users_path, messages_path, users_count, messages_count)
+            VALUES ('compact', ?, datetime('now', 'localtime'), ?, ?, ?, ?)
+        """, (fmt, out_users, out_messages, len(latest), messages_count))
+        conn.commit()
+        return {"kind": "compact", "merged": len(chain), "users": out_users, "messages": out_messages,
+                "users_count": len(latest), "messages_count": messages_count}
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="users / messages のエクスポート")
+    ap.add_argument("command", choices=["full", "incremental", "compact"])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--out", default=OUT_DIR)
+    ap.add_argument("--format", default="csv", choices=list(EXPORT_FORMATS))
+    args = ap.parse_args()
+
+    if args.command == "full":
+        print(export_tables(args.db, args.out, fmt=args.format))
+    elif args.command == "incremental":
+        print(export_incremental(args.db, args.out, fmt=args.format))
+    else:
+        print(compact_exports(args.db, args.out))
@@ -14,6 +14,20 @@ ALLOWED_MODELS = {
     # "gemini-1.5-pro",
 }
 
+# 並列実行とレート制限（無料枠: 15 リクエスト/分, 100万トークン/分）
+CONCURRENCY = 4          # 同時に投げるリクエスト数
+RPM_LIMIT = 15           # リクエスト数/分（0 なら制限なし）
+TPM_LIMIT = 1_000_000    # トークン数/分（0 なら制限なし）
+MAX_RETRIES = 5          # 429 / 5xx のときの再試行回数
+BACKOFF_SEC = 2.0        # 再試行の待ち（秒）。回数ごとに倍々
+BACKOFF_MAX_SEC = 60.0
+OUTPUT_TOKENS_ESTIMATE = 800  # 応答側のトークン数の見積もり（TPM の予約用）
+
+# LLM の呼び出し先（llm_backends.get_backend）。"stub" ならネットワークなしの偽モデル
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+STUB_LATENCY_SEC = 0.5   # スタブの応答時間（秒）
+STUB_ERROR_RATE = 0.05   # スタブが 429 を返す割合
+
 def pick_model() -> str:
     return DEFAULT_MODEL
 
@@ -0,0 +1,138 @@
+# llm_backends.py
+# 分析パイプラインから呼ぶ LLM の差し替え口
+#
+# - GeminiBackend: google.generativeai（本番）
+# - StubBackend:   ネットワークなしで動く偽モデル。プロンプトから決まる（同じ入力 → 同じ出力）
+#                  SYSTEM_PROMPT 形式のJSONレポートを、指定の遅延・エラー率で返す。
+#                  並列実行・レート制限・キャッシュ・応答の解析をオフラインで負荷試験するためのもの。
+#
+# どちらを使うかは gemini_settings.LLM_BACKEND（環境変数 LLM_BACKEND でも上書き可）。
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Optional, Tuple
+
+import gemini_settings
+
+BATCH_MARKER_RE = re.compile(r"^=== 会話ID: (c\d+) ===$", re.M)  # prompt_packer.build_batch_prompt の区切り
+CONVERSATION_HEAD = "【担当者】"                                 # 会話ブロックの先頭
+LOG_LINE_RE = re.compile(r"^\[[^\]]*\] (\w+): (.+)$", re.M)
+
+
+class LLMBackend:
+    """
+    name: キャッシュ・ジョブのキーに使うモデル名（バックエンドが違えば結果を混ぜない）
+    rpm / tpm: このバックエンドに掛けるレート制限（0 なら制限なし）
+    backoff: 429 / 5xx の再試行の初回待ち（秒）
+    """
+    name = "base"
+    rpm = 0
+    tpm = 0
+    backoff = gemini_settings.BACKOFF_SEC
+
+    def generate(self, prompt: str) -> Tuple[str, Optional[int]]:
+        """プロンプト → (応答テキスト, 実際のトークン数 or None)。失敗は例外で返す"""
+        raise NotImplementedError
+
+
+# ===== Gemini =====
+class GeminiBackend(LLMBackend):
+    def __init__(self, model_name: Optional[str] = None):
+        import google.generativeai as genai  # pip install google-generativeai（スタブだけなら不要）
+
+        self.name = model_name or gemini_settings.pick_model()
+        self.rpm = gemini_settings.RPM_LIMIT
+        self.tpm = gemini_settings.TPM_LIMIT
+        genai.configure(api_key=gemini_settings.get_api_key())
+        self.model = genai.GenerativeModel(self.name)
+
+    def generate(self, prompt: str) -> Tuple[str, Optional[int]]:
+        res = self.model.generate_content(prompt)
+        usage = getattr(res, "usage_metadata", None)
+        return res.text or "", getattr(usage, "total_token_count", None) if usage else None
+
+
+# ===== オフライン用のスタブ =====
+class StubError(Exception):
+    """429 相当（llm_runner.is_retryable で再試行される）"""
+    code = 429
+
+
+class StubBackend(LLMBackend):
+    """
+    latency 秒（± jitter 割）待ってから、プロンプトのハッシュで決まるレポートを返す。
+    error_rate の割合で StubError（429）を送出する。fenced=True なら Gemini と同じく ```json で囲む。
+    まとめ送り（=== 会話ID: cN === 区切り）には "id" つきの JSON 配列で答える。
+    """
+    name = "stub"
+
+    def __init__(self, latency: float = gemini_settings.STUB_LATENCY_SEC,
+                 error_rate: float = gemini_settings.STUB_ERROR_RATE,
+                 jitter: float = 0.5, fenced: bool = True, seed: int = 1,
+                 rpm: float = 0, tpm: float = 0, backoff: float = gemini_settings.BACKOFF_SEC):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.fenced = fenced
+        self.rpm = rpm
+        self.tpm = tpm
+        self.backoff = backoff
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def _report(self, block: str) -> dict:
+        h = hashlib.sha256(block.encode("utf-8")).digest()
+        quotes = [(s, t) for s, t in LOG_LINE_RE.findall(block) if not t.startswith("〈定型文")]
+        examples = []
+        for i in range(min(2, len(quotes))):
+            sender, text = quotes[h[4 + i] % len(quotes)]
+            examples.append({"type": "good" if h[6 + i] % 2 else "bad", "quote": text[:40],
+                             "reason": f"{sender} の発言（スタブ）"})
+        return {
+            "score_communication": h[0] % 6,
+            "score_timeliness": h[1] % 6,
+            "score_overall": h[2] % 6,
+            "summary": f"スタブによる評価です（会話ログ {len(quotes)} 行、ハッシュ {h.hex()[:8]}）。" * 3,
+            "improvements": [f"改善提案{i + 1}（{h.hex()[8 + i * 4:12 + i * 4]}）" for i in range(3)],
+            "notable_examples": examples,
+        }
+
+    def generate(self, prompt: str) -> Tuple[str, Optional[int]]:
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            fail = self.rnd.random() < self.error_rate
+            wait = self.latency * (1 + self.rnd.uniform(-self.jitter, self.jitter))
+        try:
+            time.sleep(max(0.0, wait))
+            if fail:
+                with self.lock:
+                    self.stats["errors"] += 1
+                raise StubError("429 Resource has been exhausted (stub)")
+            parts = BATCH_MARKER_RE.split(prompt)
+            if len(parts) > 1:  # [前置き, id, ブロック, id, ブロック, ...]
+                body = [{"id": cid, **self._report(block.strip())} for cid, block in zip(parts[1::2], parts[2::2])]
+            else:  # SYSTEM_PROMPT を除いた会話ブロックで決める（まとめ送りと同じ結果になる）
+                start = prompt.find(CONVERSATION_HEAD)
+                body = self._report((prompt[start:] if start >= 0 else prompt).strip())
+            text = json.dumps(body, ensure_ascii=False, indent=1)
+            if self.fenced:
+                text = f"```json\n{text}\n```"
+            return text, len(prompt) + len(text)
+        finally:
+            with self.lock:
+                self.stats["in_flight"] -= 1
+
+
+def get_backend(name: Optional[str] = None) -> LLMBackend:
+    name = name or gemini_settings.LLM_BACKEND
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "stub":
+        return StubBackend()
+    raise ValueError(f"未対応の LLM_BACKEND です: {name}（gemini / stub）")
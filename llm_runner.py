@@ -0,0 +1,145 @@
+# llm_runner.py
+# LLM 呼び出しの実行エンジン（同時実行数の上限・レート制限・リトライ・入力順での出力）
+#
+#     limiter = RateLimiter(rpm=15, tpm=1_000_000)
+#     def call(rec):
+#         def once():
+#             limiter.acquire(estimate_tokens(prompt))   # リトライも1リクエストとして数える
+#             return model.generate_content(prompt)
+#         return call_with_retry(once)
+#     for rec, result, err in run_ordered(records, call, concurrency=4):
+#         ...   # records と同じ順で返る。err は最終的に失敗した例外（成功なら None）
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+CHARS_PER_TOKEN = 1.0        # 日本語はおおむね1文字≒1トークン（少し多めに見積もる）
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# google.api_core.exceptions のクラス名（import せずに名前で判定する）
+RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "InternalServerError",
+                   "ServiceUnavailable", "DeadlineExceeded", "GatewayTimeout", "BadGateway"}
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+# ===== レート制限 =====
+class TokenBucket:
+    """1分あたり rate_per_min だけ回復するバケツ。take(n) は n 貯まるまで待つ"""
+
+    def __init__(self, rate_per_min: float, capacity: Optional[float] = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity or rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n: float = 1.0):
+        n = min(n, self.capacity)  # 容量を超える要求は満タンになったら通す
+        with self._cond:
+            while True:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                self._cond.wait((n - self.tokens) / self.rate)
+
+    def adjust(self, n: float):
+        """見積もりとの差を後から精算する（マイナスになれば次の take が待つ）"""
+        with self._cond:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - n)
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """
+    リクエスト数/分 と トークン数/分 の両方で絞る（0 / None なら制限なし）。
+    window_sec は何秒分の枠までまとめて流してよいか（60 なら1分ぶんを一気に使える。小さいほど平準化）。
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, window_sec: float = 60.0):
+        self.requests = TokenBucket(rpm, max(1.0, rpm * window_sec / 60)) if rpm else None
+        self.tokens = TokenBucket(tpm, tpm * window_sec / 60) if tpm else None
+
+    def acquire(self, tokens: int = 0):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens and tokens:
+            self.tokens.take(tokens)
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        if self.tokens and actual is not None:
+            self.tokens.adjust(actual - estimated)
+
+
+# ===== リトライ =====
+def is_retryable(e: Exception) -> bool:
+    """429（レート超過）・5xx・タイムアウト・接続エラーならリトライする"""
+    code = getattr(e, "code", None)
+    if callable(code):  # grpc.RpcError
+        try:
+            code = code()
+        except Exception:
+            code = None
+    if isinstance(code, int) and code in RETRYABLE_STATUS:
+        return True
+    if type(e).__name__ in RETRYABLE_NAMES:
+        return True
+    return isinstance(e, (TimeoutError, ConnectionError))
+
+
+def call_with_retry(fn: Callable[[], object], retries: int = 5, backoff: float = 2.0,
+                    max_backoff: float = 60.0,
+                    on_retry: Optional[Callable[[int, float, Exception], None]] = None):
+    """
+    fn() を実行し、リトライ可能なエラーなら 指数バックオフ（±ジッタ）で retries 回まで再試行する。
+    リトライ不可のエラー・回数切れはそのまま送出する。
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            wait = min(max_backoff, backoff * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            attempt += 1
+            if on_retry:
+                on_retry(attempt, wait, e)
+            time.sleep(wait)
+
+
+# ===== 並列実行（入力順で返す） =====
+def run_ordered(items: Iterable, fn: Callable, concurrency: int = 4,
+                window: Optional[int] = None) -> Iterator[Tuple[object, object, Optional[Exception]]]:
+    """
+    items を concurrency 並列で fn に通し、(item, 結果, 例外) を items と同じ順に返す。
+    先読みは window 件（既定 concurrency*2）までなので、items はジェネレータでよい。
+    """
+    window = max(window or concurrency * 2, concurrency)
+    pending = deque()
+
+    def _pop():
+        item, fut = pending.popleft()
+        try:
+            return item, fut.result(), None
+        except Exception as e:
+            return item, None, e
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm") as pool:
+        for item in items:
+            pending.append((item, pool.submit(fn, item)))
+            if len(pending) >= window:
+                yield _pop()
+        while pending:
+            yield _pop()
@@ -15,6 +15,7 @@ import threading
 import re
 import json
 from datetime import datetime
+from message_store import ensure_message_store, encode_message
 RESUME_FILE = "last_user_id.txt"  # ← 再開用ファイル
 current_date = None  # ← 追加：日付ヘッダの状態保持
 def _find_chat_scroll_container(driver):
@@ -121,16 +122,19 @@ def initialize_message_table():
         )
     ''')
     conn.commit()
+    ensure_message_store(conn)  # 圧縮モード用カラム
     conn.close()
 
 # メッセージ保存
 def save_message(user_id, sender, sender_name, message, time_sent):
     conn = sqlite3.connect("lstep_users.db")
     cursor = conn.cursor()
+    # 共有済みの定型文なら body_id、圧縮モードONなら message_z に入る（どちらでもなければ平文）
+    text, text_z, dict_id, body_id = encode_message(conn, message)
     cursor.execute('''
-        INSERT INTO messages (user_id, sender, sender_name, message, time_sent)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (user_id, sender, sender_name, message, time_sent))
+        INSERT INTO messages (user_id, sender, sender_name, message, time_sent, message_z, dict_id, body_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, sender, sender_name, text, time_sent, text_z, dict_id, body_id))
     conn.commit()
     conn.close()
 
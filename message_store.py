@@ -0,0 +1,623 @@
+# message_store.py
+# messages テーブルの保存形式（zstd辞書圧縮・定型文の共有）と、export / analysis 共通の読み出しAPI
+#
+# 読み出し側は connect() で開いた接続の TEMP VIEW「messages_v」を使う。
+# 本文が圧縮されていても、message_bodies に共有されていても messages_v.message は常に平文で返る。
+# 古いメッセージは archive_messages() で四半期ごとのアーカイブDBへ移せる
+# （connect(include_archives=True) なら ATTACH して現行DBと合わせて1つのビューで読める）。
+#
+# スキーマの追加（ensure_message_store）は message.initialize_message_table と下の保守コマンドだけが行う。
+# connect() は読み出し専用で、未移行のDBでも列が無いものとして読む。
+#
+# 既存データの移行・保守（スクレイピングしていないときに実行）:
+#     python message_store.py intern   [DB]   # 同一本文を message_bodies に共有（定型文フラグも更新）
+#     python message_store.py compress [DB]   # 残りの平文本文を zstd 辞書圧縮（要 zstandard）
+#     python message_store.py decompress [DB] # 圧縮モードを解除して平文に戻す
+#     python message_store.py archive  [DB]   # ARCHIVE_KEEP_DAYS より古いメッセージをアーカイブ
+import hashlib
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import zstandard as zstd
+except ImportError:  # 圧縮モードを使わないなら不要（pip install zstandard）
+    zstd = None
+
+DB_PATH = "lstep_users.db"
+DICT_SIZE = 112 * 1024        # 学習する辞書サイズ（byte）
+DICT_SAMPLES = 20000          # 辞書学習に使う本文数（ランダム抽出）
+COMPRESS_LEVEL = 9
+BATCH_SIZE = 2000
+INTERN_MIN_REPEAT = 2         # この回数以上出現した本文を message_bodies に共有
+TEMPLATE_MIN_USERS = 5        # me が この人数以上に送った本文は定型文/一斉配信とみなす
+TEMPLATE_MIN_CHARS = 20       # これより短い本文（「承知しました」など）は正規化での定型文検出の対象外
+ARCHIVE_DIR = "archive"       # アーカイブDB（messages_2025Q1.db など）の置き場所
+ARCHIVE_KEEP_DAYS = 180       # 現行DBに残す日数（これより古い time_sent をアーカイブ）
+STORE_COLUMNS = ("message_z", "dict_id", "body_id")  # ensure_message_store が messages に足す列
+
+# dict_id -> (ZstdCompressor, ZstdDecompressor)。辞書は作成後に変更しないので使い回せる
+_codec_cache: Dict[Tuple[str, int], tuple] = {}
+
+
+def _require_zstd():
+    if zstd is None:
+        raise RuntimeError("圧縮モードには zstandard が必要です（pip install zstandard）")
+
+
+# ===================== スキーマ =====================
+def ensure_message_store(conn: sqlite3.Connection) -> None:
+    """
+    messages に圧縮/共有用カラム、辞書テーブル message_dicts、
+    共有本文テーブル message_bodies を用意（既存DBにも対応）
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS message_dicts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dict_data BLOB NOT NULL,
+            sample_count INTEGER,
+            active INTEGER DEFAULT 1,
+            created_at TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS message_bodies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash TEXT NOT NULL UNIQUE,
+            text TEXT,
+            ref_count INTEGER DEFAULT 0,
+            me_users INTEGER DEFAULT 0,
+            is_template INTEGER DEFAULT 0
+        )
+    """)
+    cols = _table_columns(conn, "messages")
+    if cols:  # messages 未作成（initialize_message_table 前）なら何もしない
+        if "message_z" not in cols:
+            cur.execute("ALTER TABLE messages ADD COLUMN message_z BLOB")
+        if "dict_id" not in cols:
+            cur.execute("ALTER TABLE messages ADD COLUMN dict_id INTEGER")
+        if "body_id" not in cols:
+            cur.execute("ALTER TABLE messages ADD COLUMN body_id INTEGER")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_body_id ON messages(body_id)")
+        # 担当ごとのデータセット・集計（users.support で絞って user_id で引く）と、アーカイブとの重複確認用
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_user_time ON messages(user_id, time_sent)")
+    if _has_table(conn, "users"):
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_support ON users(support)")
+    conn.commit()
+
+
+def _table_columns(conn: sqlite3.Connection, table: str, schema: str = "main") -> Set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+
+
+def _has_table(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _ensure_schema(db_path: str) -> None:
+    """保守コマンドの前に1回だけスキーマを追加する（connect() 自体は書き込まない）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_message_store(conn)
+    finally:
+        conn.close()
+
+
+def _hot_text_expr(conn: sqlite3.Connection, cols: Set[str]) -> str:
+    """現行DBの行 h の平文を返すSQL式（未移行のDBでは無い列を参照しない）"""
+    if "message_z" not in cols:
+        return "h.message"
+    text = "msg_text(h.message, h.message_z, h.dict_id)"
+    if "body_id" in cols and _has_table(conn, "message_bodies"):
+        text = f"""CASE WHEN h.body_id IS NULL THEN {text}
+                       ELSE (SELECT b.text FROM main.message_bodies b WHERE b.id = h.body_id) END"""
+    return text
+
+
+def _db_key(conn: sqlite3.Connection) -> str:
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row else ""
+
+
+def _codec(conn: sqlite3.Connection, dict_id: int):
+    key = (_db_key(conn), dict_id)
+    codec = _codec_cache.get(key)
+    if codec is None:
+        _require_zstd()
+        row = conn.execute("SELECT dict_data FROM message_dicts WHERE id = ?", (dict_id,)).fetchone()
+        if not row:
+            raise KeyError(f"message_dicts に辞書 {dict_id} がありません")
+        d = zstd.ZstdCompressionDict(row[0])
+        codec = (
+            zstd.ZstdCompressor(level=COMPRESS_LEVEL, dict_data=d),
+            zstd.ZstdDecompressor(dict_data=d),
+        )
+        _codec_cache[key] = codec
+    return codec
+
+
+def _active_dict_id(conn: sqlite3.Connection) -> Optional[int]:
+    try:
+        row = conn.execute(
+            "SELECT id FROM message_dicts WHERE active = 1 ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None  # 辞書テーブルなし = 圧縮モードOFF
+    return row[0] if row else None
+
+
+def body_hash(text: Optional[str]) -> Optional[str]:
+    """本文の完全一致キー（message_bodies.hash）"""
+    if text is None:
+        return None
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# 宛名・URL・数字・空白の違いを無視した比較（差し込みつきの定型文を同一視する）
+_URL_RE = re.compile(r"https?://\S+")
+_DIGITS_RE = re.compile(r"\d+")
+_SPACE_RE = re.compile(r"\s+")
+
+TEMPLATE_NORM_SQL = """
+    SELECT h FROM (
+        SELECT norm_hash(m.message, u.line_name) AS h, m.user_id
+        FROM messages_v m JOIN users u ON u.id = m.user_id
+        WHERE m.sender = ? AND length(m.message) >= ? {where}
+    )
+    GROUP BY h
+    HAVING COUNT(DISTINCT user_id) >= ?
+"""
+
+
+def normalize_body(text: Optional[str], line_name: Optional[str] = None) -> str:
+    """宛名（line_name）→ <name>、URL → <url>、数字 → 0、空白は除去（NFKC 正規化のうえで）"""
+    t = unicodedata.normalize("NFKC", text or "")
+    if line_name and len(line_name) >= 2:
+        t = t.replace(unicodedata.normalize("NFKC", line_name), "<name>")
+    t = _URL_RE.sub("<url>", t)
+    t = _DIGITS_RE.sub("0", t)
+    return _SPACE_RE.sub("", t)
+
+
+def norm_body_hash(text: Optional[str], line_name: Optional[str] = None) -> str:
+    return hashlib.sha1(normalize_body(text, line_name).encode("utf-8")).hexdigest()
+
+
+# メッセージ行の内容キー (href, sender, time_sent, msg_key, occurrence)。
+# 再スクレイピングで id が振り直されても同じ行なら同じ値になる（archive_messages / exporter で共通）。
+# occurrence は同じ分に同じ本文を送った何通目か。conn は connect() の接続。
+MESSAGE_KEY_SQL = """
+    SELECT id, href, sender, time_sent, msg_key,
+           ROW_NUMBER() OVER (PARTITION BY href, sender, time_sent, msg_key ORDER BY id) AS occurrence
+    FROM (
+        SELECT v.id, u.href, v.sender, v.time_sent, body_hash(COALESCE(v.message, '')) AS msg_key
+        FROM temp.messages_v v
+        LEFT JOIN main.users u ON u.id = v.user_id
+        {where}
+    )
+"""
+
+
+def template_norm_hashes(conn: sqlite3.Connection, sender: str = "me",
+                         min_chars: int = TEMPLATE_MIN_CHARS,
+                         min_users: int = TEMPLATE_MIN_USERS,
+                         support: Optional[str] = None) -> Set[str]:
+    """
+    sender の本文のうち、正規化すると同じになるものが min_users 人以上に送られているもの
+    （ステップ配信・一斉配信・定型返信）の norm_body_hash。conn は connect() の接続。
+    message_bodies.is_template は完全一致なので、宛名や日付の差し込みがあると拾えない分を補う。
+    support を指定したらその担当のユーザーの会話だけから数える。
+    """
+    conn.create_function("norm_hash", 2, norm_body_hash, deterministic=True)
+    where, args = "", [sender, min_chars]
+    if support is not None:
+        where, args = "AND u.support = ?", args + [support]
+    return {r[0] for r in conn.execute(TEMPLATE_NORM_SQL.format(where=where), args + [min_users])}
+
+
+def template_matcher(templates: Set[str]) -> Optional[Callable[[Optional[str], Optional[str]], bool]]:
+    """(本文, ユーザー名) → 定型文か。templates が空なら None（判定不要）"""
+    if not templates:
+        return None
+    return lambda text, line_name: norm_body_hash((text or "").strip(), line_name) in templates
+
+
+# ===================== 書き込み =====================
+def encode_message(conn: sqlite3.Connection, text: Optional[str]) -> Tuple[Optional[str], Optional[bytes], Optional[int], Optional[int]]:
+    """
+    保存用に本文を (message, message_z, dict_id, body_id) へ変換する。
+    - 共有済みの本文（定型文など）と一致すれば body_id だけを返す
+    - 圧縮モードOFF、または圧縮しても小さくならない短文は平文のまま返す
+    """
+    if not text:
+        return text, None, None, None
+    try:
+        row = conn.execute("SELECT id FROM message_bodies WHERE hash = ?", (body_hash(text),)).fetchone()
+    except sqlite3.OperationalError:
+        row = None  # message_bodies 未作成
+    if row:
+        return None, None, None, row[0]
+    if zstd is None:
+        return text, None, None, None
+    dict_id = _active_dict_id(conn)
+    if dict_id is None:
+        return text, None, None, None
+    raw = text.encode("utf-8")
+    packed = _codec(conn, dict_id)[0].compress(raw)
+    if len(packed) >= len(raw):
+        return text, None, None, None
+    return None, packed, dict_id, None
+
+
+def compress_messages(db_path: str = DB_PATH,
+                      dict_size: int = DICT_SIZE,
+                      sample_limit: int = DICT_SAMPLES,
+                      retrain: bool = False,
+                      vacuum: bool = True) -> dict:
+    """
+    圧縮モードを有効化して既存の平文本文をまとめて圧縮する。
+    - 辞書は自DBの本文からランダム抽出で学習し message_dicts に保存
+    - 以後 save_message も同じ辞書で圧縮して保存する
+    戻り値: 統計の辞書（rows / raw_bytes / stored_bytes など）
+    """
+    _require_zstd()
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_message_store(conn)
+        cur = conn.cursor()
+
+        dict_id = None if retrain else _active_dict_id(conn)
+        if dict_id is None:
+            cur.execute(
+                "SELECT message FROM messages WHERE message IS NOT NULL AND message != '' "
+                "ORDER BY random() LIMIT ?",
+                (sample_limit,),
+            )
+            samples = [r[0].encode("utf-8") for r in cur.fetchall()]
+            if len(samples) < 100:
+                raise ValueError(f"辞書学習に必要な本文が不足しています（{len(samples)}件）")
+            trained = zstd.train_dictionary(dict_size, samples)
+            cur.execute("UPDATE message_dicts SET active = 0")
+            cur.execute(
+                "INSERT INTO message_dicts (dict_data, sample_count, active, created_at) VALUES (?, ?, 1, ?)",
+                (trained.as_bytes(), len(samples), time.strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            dict_id = cur.lastrowid
+            conn.commit()
+
+        compressor = _codec(conn, dict_id)[0]
+        stats = {"dict_id": dict_id, "rows": 0, "skipped": 0, "raw_bytes": 0, "stored_bytes": 0}
+        last_id = 0
+        while True:
+            cur.execute(
+                "SELECT id, message FROM messages "
+                "WHERE id > ? AND message_z IS NULL AND message IS NOT NULL "
+                "ORDER BY id LIMIT ?",
+                (last_id, BATCH_SIZE),
+            )
+            batch = cur.fetchall()
+            if not batch:
+                break
+            updates = []
+            for mid, text in batch:
+                raw = text.encode("utf-8")
+                packed = compressor.compress(raw)
+                stats["raw_bytes"] += len(raw)
+                if len(packed) >= len(raw):
+                    stats["skipped"] += 1
+                    stats["stored_bytes"] += len(raw)
+                    continue
+                updates.append((packed, dict_id, mid))
+                stats["stored_bytes"] += len(packed)
+            cur.executemany(
+                "UPDATE messages SET message = NULL, message_z = ?, dict_id = ? WHERE id = ?",
+                updates,
+            )
+            conn.commit()
+            stats["rows"] += len(updates)
+            last_id = batch[-1][0]
+
+        if vacuum:
+            conn.execute("VACUUM")
+        return stats
+    finally:
+        conn.close()
+
+
+def decompress_messages(db_path: str = DB_PATH) -> int:
+    """圧縮モードを解除し、全本文を平文に戻す。戻り値: 戻した件数"""
+    _ensure_schema(db_path)
+    conn = connect(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute("UPDATE message_dicts SET active = 0")
+        cur.execute("""
+            UPDATE messages
+            SET message = msg_text(message, message_z, dict_id), message_z = NULL, dict_id = NULL
+            WHERE message_z IS NOT NULL
+        """)
+        n = cur.rowcount
+        conn.commit()
+        return n
+    finally:
+        conn.close()
+
+
+def intern_message_bodies(db_path: str = DB_PATH,
+                          min_repeat: int = INTERN_MIN_REPEAT,
+                          template_min_users: int = TEMPLATE_MIN_USERS,
+                          vacuum: bool = True) -> dict:
+    """
+    同一本文を message_bodies に共有し、messages からは body_id で参照する。
+    - min_repeat 回以上出現した本文、または既に共有済みの本文が対象
+    - me が template_min_users 人以上に送った本文は is_template=1（ステップ配信・一斉配信）
+    戻り値: 統計の辞書（bodies / rows / templates）
+    """
+    _ensure_schema(db_path)
+    conn = connect(db_path)
+    try:
+        cur = conn.cursor()
+        conn.create_function("body_hash", 1, body_hash, deterministic=True)
+
+        # 未共有の本文をハッシュ化（圧縮済みの本文も msg_text で平文に戻して比較）
+        cur.execute("DROP TABLE IF EXISTS temp.pending_bodies")
+        cur.execute("""
+            CREATE TEMP TABLE pending_bodies AS
+            SELECT id, body_hash(msg_text(message, message_z, dict_id)) AS h
+            FROM main.messages
+            WHERE body_id IS NULL AND (message IS NOT NULL OR message_z IS NOT NULL)
+        """)
+        cur.execute("CREATE INDEX temp.idx_pending_bodies_h ON pending_bodies(h)")
+
+        before = cur.execute("SELECT COUNT(*) FROM message_bodies").fetchone()[0]
+        cur.execute("""
+            INSERT OR IGNORE INTO message_bodies (hash, text)
+            SELECT p.h, v.message
+            FROM (SELECT h, MIN(id) AS first_id FROM temp.pending_bodies
+                  GROUP BY h HAVING COUNT(*) >= ?) p
+            JOIN temp.messages_v v ON v.id = p.first_id
+        """, (min_repeat,))
+        bodies = cur.execute("SELECT COUNT(*) FROM message_bodies").fetchone()[0] - before
+
+        cur.execute("""
+            UPDATE main.messages
+            SET body_id = (SELECT b.id FROM temp.pending_bodies p
+                           JOIN message_bodies b ON b.hash = p.h
+                           WHERE p.id = messages.id),
+                message = NULL, message_z = NULL, dict_id = NULL
+            WHERE id IN (SELECT p.id FROM temp.pending_bodies p
+                         JOIN message_bodies b ON b.hash = p.h)
+        """)
+        rows = cur.rowcount
+        cur.execute("DROP TABLE temp.pending_bodies")
+
+        # 参照数と定型文フラグを更新（アーカイブ済みの分は数えられないので減らさない）
+        cur.execute("""
+            UPDATE message_bodies SET
+                ref_count = MAX(ref_count, (SELECT COUNT(*) FROM main.messages m
+                                            WHERE m.body_id = message_bodies.id)),
+                me_users  = MAX(me_users, (SELECT COUNT(DISTINCT m.user_id) FROM main.messages m
+                                           WHERE m.body_id = message_bodies.id AND m.sender = 'me'))
+        """)
+        cur.execute("UPDATE message_bodies SET is_template = (me_users >= ?)", (template_min_users,))
+        templates = cur.execute("SELECT COUNT(*) FROM message_bodies WHERE is_template = 1").fetchone()[0]
+        conn.commit()
+
+        if vacuum:
+            conn.execute("VACUUM")
+        return {"bodies": bodies, "rows": rows, "templates": templates}
+    finally:
+        conn.close()
+
+
+# ===================== アーカイブ =====================
+def _quarter_key(year: int, quarter: int) -> str:
+    return f"{year:04d}Q{quarter}"
+
+
+def _quarter_range(year: int, quarter: int) -> Tuple[str, str]:
+    start = f"{year:04d}-{(quarter - 1) * 3 + 1:02d}-01"
+    end = f"{year + 1:04d}-01-01" if quarter == 4 else f"{year:04d}-{quarter * 3 + 1:02d}-01"
+    return start, end
+
+
+def list_archives(archive_dir: str = ARCHIVE_DIR) -> List[Path]:
+    """アーカイブDBの一覧（古い順）"""
+    d = Path(archive_dir)
+    if not d.exists():
+        return []
+    return sorted(d.glob("messages_*Q*.db"))
+
+
+def archive_messages(db_path: str = DB_PATH,
+                     archive_dir: str = ARCHIVE_DIR,
+                     keep_days: int = ARCHIVE_KEEP_DAYS,
+                     cutoff: Optional[str] = None,
+                     vacuum: bool = True) -> dict:
+    """
+    time_sent が cutoff より古いメッセージを四半期ごとのアーカイブDBへ移動する。
+    - cutoff 省略時は「今日 - keep_days」
+    - アーカイブには users.href も保存し、再スクレイピングで user_id が振り直されても
+      現行の users に結び付けられるようにする
+    - 同じメッセージ（href・送信者・時刻・本文・同じ分の中で何通目か）は二重に保存しない
+      （同じ分に同じ本文を連投したものは occurrence 1, 2, ... として別々に残る）
+    戻り値: {"cutoff":..., "moved": 件数, "archives": {"2025Q1": 件数, ...}}
+    """
+    cutoff = cutoff or (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+    Path(archive_dir).mkdir(parents=True, exist_ok=True)
+
+    _ensure_schema(db_path)
+    conn = connect(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_time_sent ON messages(time_sent)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_href ON users(href)")
+        cur.execute("""
+            SELECT DISTINCT CAST(substr(time_sent, 1, 4) AS INTEGER),
+                            (CAST(substr(time_sent, 6, 2) AS INTEGER) + 2) / 3
+            FROM main.messages
+            WHERE time_sent IS NOT NULL AND time_sent < ?
+        """, (cutoff,))
+        quarters = sorted(cur.fetchall())
+
+        result = {"cutoff": cutoff, "moved": 0, "archives": {}}
+        for year, quarter in quarters:
+            start, end = _quarter_range(year, quarter)
+            end = min(end, cutoff)
+            arc_path = Path(archive_dir) / f"messages_{_quarter_key(year, quarter)}.db"
+            cur.execute("ATTACH DATABASE ? AS arc", (str(arc_path),))
+            try:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS arc.messages (
+                        id INTEGER PRIMARY KEY,
+                        user_id INTEGER,
+                        user_href TEXT,
+                        sender_name TEXT,
+                        sender TEXT,
+                        message TEXT,
+                        time_sent TEXT,
+                        message_z BLOB,
+                        dict_id INTEGER,
+                        body_id INTEGER,
+                        msg_key TEXT,
+                        occurrence INTEGER NOT NULL DEFAULT 1
+                    )
+                """)
+                if "occurrence" not in _table_columns(conn, "messages", "arc"):
+                    # 旧形式のアーカイブ: 既存の行はすべて1通目として扱う
+                    cur.execute("ALTER TABLE arc.messages ADD COLUMN occurrence INTEGER NOT NULL DEFAULT 1")
+                cur.execute("DROP INDEX IF EXISTS arc.idx_messages_key")
+                cur.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS arc.idx_messages_occ
+                    ON messages(user_href, sender, time_sent, msg_key, occurrence)
+                """)
+                # 現行DBの移動と削除は1トランザクション（途中で落ちても二重化・欠落しない）
+                cur.execute(f"""
+                    INSERT OR IGNORE INTO arc.messages
+                        (id, user_id, user_href, sender_name, sender, message, time_sent,
+                         message_z, dict_id, body_id, msg_key, occurrence)
+                    SELECT m.id, m.user_id, k.href, m.sender_name, m.sender, m.message, m.time_sent,
+                           m.message_z, m.dict_id, m.body_id, k.msg_key, k.occurrence
+                    FROM ({MESSAGE_KEY_SQL.format(where="WHERE v.time_sent >= ? AND v.time_sent < ?")}) k
+                    JOIN main.messages m ON m.id = k.id
+                """, (start, end))
+                cur.execute("DELETE FROM main.messages WHERE time_sent >= ? AND time_sent < ?", (start, end))
+                moved = cur.rowcount
+                conn.commit()
+            finally:
+                cur.execute("DETACH DATABASE arc")
+            result["archives"][_quarter_key(year, quarter)] = moved
+            result["moved"] += moved
+
+        if vacuum and result["moved"]:
+            conn.execute("VACUUM")
+        return result
+    finally:
+        conn.close()
+
+
+# ===================== 読み出し =====================
+def connect(db_path: str = DB_PATH,
+            include_archives: bool = False,
+            archive_dir: str = ARCHIVE_DIR) -> sqlite3.Connection:
+    """
+    読み出し用の接続を返す。
+    - SQL関数 msg_text(message, message_z, dict_id) と body_hash(text) を登録
+    - TEMP VIEW messages_v（message は常に平文、is_template は定型文フラグ）を作成
+      message_bodies は主キー結合なので、message / is_template を参照しない
+      クエリでは SQLite が結合自体を省略する（必要な列だけ遅延解決）
+    - include_archives=True ならアーカイブDBを ATTACH し、messages_v に合算する
+      （アーカイブ側の user_id は users.href で現行の id に読み替える）
+      再スクレイピング後〜次の archive_messages までは同じ日のメッセージが現行DBにも入っているので、
+      現行DBに同じもの（送信者・時刻・本文が一致）が occurrence 通以上あるアーカイブ行は除く
+    """
+    conn = sqlite3.connect(db_path)
+    if zstd is not None and _has_table(conn, "message_dicts"):
+        # UDF 実行中にクエリを発行しないよう、辞書は先に読み込んでおく
+        for (dict_id,) in conn.execute("SELECT id FROM message_dicts").fetchall():
+            _codec(conn, dict_id)
+
+    def _msg_text(message, message_z, dict_id):
+        if message_z is None:
+            return message
+        return _codec(conn, dict_id)[1].decompress(message_z).decode("utf-8")
+
+    conn.create_function("msg_text", 3, _msg_text, deterministic=True)
+    conn.create_function("body_hash", 1, body_hash, deterministic=True)
+
+    # 未移行のDB（ensure_message_store 前）は圧縮・共有の列が無いので NULL として読む
+    cols = _table_columns(conn, "messages")
+    store_cols = ", ".join(c if c in cols else f"NULL AS {c}" for c in STORE_COLUMNS)
+    sources = [f"""
+        SELECT id, user_id, sender_name, sender, message, time_sent, {store_cols}
+        FROM main.messages
+    """]
+    if include_archives:
+        hot_text = _hot_text_expr(conn, cols)
+        archives = list_archives(archive_dir)
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(archives) > limit:
+            conn.close()
+            raise RuntimeError(
+                f"アーカイブDBが {len(archives)} 個あり、同時に ATTACH できる上限 {limit} を超えています。"
+            )
+        for i, path in enumerate(archives):
+            alias = f"arc{i}"
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (str(path),))
+            occurrence = "a.occurrence" if "occurrence" in _table_columns(conn, "messages", alias) else "1"
+            sources.append(f"""
+        SELECT a.id, COALESCE(u.id, a.user_id) AS user_id, a.sender_name, a.sender, a.message,
+               a.time_sent, a.message_z, a.dict_id, a.body_id
+        FROM {alias}.messages a
+        LEFT JOIN main.users u ON u.href = a.user_href
+        WHERE u.id IS NULL OR (
+            SELECT COUNT(*) FROM main.messages h
+            WHERE h.user_id = u.id AND h.sender = a.sender AND h.time_sent = a.time_sent
+              AND body_hash(COALESCE({hot_text}, '')) = a.msg_key
+        ) < {occurrence}
+    """)
+
+    conn.execute("DROP VIEW IF EXISTS temp.messages_v")
+    if _has_table(conn, "message_bodies"):
+        conn.execute(f"""
+            CREATE TEMP VIEW messages_v AS
+            SELECT m.id, m.user_id, m.sender_name, m.sender,
+                   CASE WHEN m.body_id IS NULL THEN msg_text(m.message, m.message_z, m.dict_id)
+                        ELSE b.text END AS message,
+                   m.time_sent,
+                   COALESCE(b.is_template, 0) AS is_template
+            FROM ({" UNION ALL ".join(sources)}) AS m
+            LEFT JOIN main.message_bodies b ON b.id = m.body_id
+        """)
+    else:
+        conn.execute(f"""
+            CREATE TEMP VIEW messages_v AS
+            SELECT m.id, m.user_id, m.sender_name, m.sender,
+                   msg_text(m.message, m.message_z, m.dict_id) AS message,
+                   m.time_sent, 0 AS is_template
+            FROM ({" UNION ALL ".join(sources)}) AS m
+        """)
+    return conn
+
+
+# ===================== 保守コマンド =====================
+COMMANDS = {
+    "intern": intern_message_bodies,
+    "compress": compress_messages,
+    "decompress": decompress_messages,
+    "archive": archive_messages,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3) or sys.argv[1] not in COMMANDS:
+        print("使い方: python message_store.py intern|compress|decompress|archive [DBパス]")
+        sys.exit(2)
+    db = sys.argv[2] if len(sys.argv) == 3 else DB_PATH
+    print(f"✅ {sys.argv[1]}: {COMMANDS[sys.argv[1]](db)}")
@@ -0,0 +1,139 @@
+# prompt_packer.py
+# LLM に渡すプロンプトをトークン予算に合わせて詰める
+#
+# - 1会話の会話ログ: 予算に収まれば全文。収まらなければ「それ以前の履歴の要約」+ 直近の発言（末尾優先）
+# - 短い会話は数件まとめて1リクエストにする（SYSTEM_PROMPT を1回で済ませ、応答は会話IDつきの JSON 配列）
+# トークン数は llm_runner.estimate_tokens の見積もり（文字数ベース）。
+import hashlib
+import json
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from llm_runner import estimate_tokens
+
+CONVERSATION_TOKEN_BUDGET = 12000  # 1会話の会話ログの上限（従来の 12000 文字相当）
+DIGEST_TOKEN_BUDGET = 600          # 予算を超える会話で、古い履歴の要約に使う分
+DIGEST_QUOTES = 6                  # 要約に載せるユーザー発言の数
+DIGEST_QUOTE_CHARS = 60            # 要約に載せるユーザー発言1件の長さ
+SHORT_CONVERSATION_TOKENS = 1500   # これ以下の会話はまとめて送る候補
+BATCH_MAX_CONVERSATIONS = 6        # 1リクエストにまとめる会話数の上限（応答の長さに効く）
+BATCH_TOKEN_BUDGET = 12000         # まとめたリクエストの入力トークンの上限
+
+BATCH_INSTRUCTION = """以下の {n} 件の会話それぞれについて、上の形式のJSONを作り、
+"id" に会話IDを入れた JSON 配列だけを出力してください（例: [{{"id": "c0", "score_communication": ...}}, ...]）。
+"""
+BATCH_HEADER = "=== 会話ID: c{i} ==="
+# まとめ送りで得たレポートのキャッシュのキーに入れる（指示文・区切り・まとめる件数が変われば別のキーになる）
+BATCH_MODE = "batch:" + hashlib.sha256(
+    f"{BATCH_INSTRUCTION}\0{BATCH_HEADER}\0{BATCH_MAX_CONVERSATIONS}".encode("utf-8")).hexdigest()[:12]
+
+
+def render_message(m: Dict) -> str:
+    return f"[{m['time']}] {m['sender']}: {m['text']}\n"
+
+
+# ===== 1会話をトークン予算に収める =====
+def _digest(older: List[Dict], budget: int, customer_sender: str) -> str:
+    """予算外になった古い履歴を、件数・期間・ユーザーの主な発言で短くまとめる（LLMは使わない）"""
+    counts: Dict[str, int] = {}
+    for m in older:
+        counts[m["sender"]] = counts.get(m["sender"], 0) + 1
+    times = [m["time"] for m in older if m.get("time")]
+    head = (f"【それ以前の履歴の要約】{min(times) if times else '?'} 〜 {max(times) if times else '?'} / "
+            + " / ".join(f"{s}: {c}件" for s, c in counts.items()) + "\n")
+    quotes = [m["text"] for m in older if m["sender"] == customer_sender and m["text"]]
+    if len(quotes) > DIGEST_QUOTES:  # 期間全体から均等に拾う
+        step = len(quotes) / DIGEST_QUOTES
+        quotes = [quotes[int(i * step)] for i in range(DIGEST_QUOTES)]
+    lines = [head]
+    for q in quotes:
+        q = re.sub(r"\s+", " ", q)
+        line = f"・ユーザー: {q[:DIGEST_QUOTE_CHARS]}{'…' if len(q) > DIGEST_QUOTE_CHARS else ''}\n"
+        if estimate_tokens("".join(lines) + line) > budget:
+            break
+        lines.append(line)
+    return "".join(lines)
+
+
+def fit_conversation(messages: List[Dict], budget: int = CONVERSATION_TOKEN_BUDGET,
+                     customer_sender: str = "you",
+                     render: Callable[[Dict], str] = render_message) -> Tuple[str, Dict]:
+    """
+    会話ログを budget トークンに収めたテキストにする。
+    戻り値: (テキスト, {"full": 全文のトークン数, "packed": 詰めた後のトークン数, "digested": 要約した発言数})
+    """
+    lines = [render(m) for m in messages]
+    full = sum(estimate_tokens(line) for line in lines)
+    if full <= budget:
+        return "".join(lines), {"full": full, "packed": full, "digested": 0}
+
+    # 末尾（最近）優先で、要約の分を残して詰める
+    tail, used = [], 0
+    for line in reversed(lines):
+        t = estimate_tokens(line)
+        if used + t > budget - DIGEST_TOKEN_BUDGET:
+            break
+        tail.append(line)
+        used += t
+    older = messages[:len(messages) - len(tail)]
+    text = _digest(older, DIGEST_TOKEN_BUDGET, customer_sender) + "".join(reversed(tail))
+    return text, {"full": full, "packed": estimate_tokens(text), "digested": len(older)}
+
+
+# ===== 短い会話をまとめて1リクエストにする =====
+def is_batchable(block: str) -> bool:
+    """plan_batches がまとめ送りの候補にする会話か"""
+    return estimate_tokens(block) <= SHORT_CONVERSATION_TOKENS
+
+
+def plan_batches(items: Iterable[Tuple[object, str]],
+                 fixed_tokens: int) -> Iterator[List[Tuple[object, str]]]:
+    """
+    items: (任意の値, 会話ブロックのテキスト)。
+    長い会話はそのまま単独のバッチとして返し、短い会話は BATCH_MAX_CONVERSATIONS 件 /
+    BATCH_TOKEN_BUDGET トークンまで溜めてから返す（並び順は変わるので、呼び出し側で元の順に戻すこと）。
+    fixed_tokens: SYSTEM_PROMPT など、どのリクエストにも付く分
+    """
+    batch: List[Tuple[object, str]] = []
+    used = fixed_tokens
+    for item in items:
+        t = estimate_tokens(item[1])
+        if not is_batchable(item[1]):
+            yield [item]
+            continue
+        if batch and (len(batch) >= BATCH_MAX_CONVERSATIONS or used + t > BATCH_TOKEN_BUDGET):
+            yield batch
+            batch, used = [], fixed_tokens
+        batch.append(item)
+        used += t
+    if batch:
+        yield batch
+
+
+def build_batch_prompt(system_prompt: str, blocks: List[str]) -> str:
+    parts = [system_prompt, "", BATCH_INSTRUCTION.format(n=len(blocks))]
+    for i, block in enumerate(blocks):
+        parts.append(f"{BATCH_HEADER.format(i=i)}\n{block}")
+    return "\n".join(parts)
+
+
+def parse_batch_response(text: str, n: int) -> Dict[int, str]:
+    """
+    まとめたリクエストの応答（JSON配列）を 会話の位置 → レポート本文（JSON文字列） にする。
+    読めなかった会話は含めない（呼び出し側で単独リクエストに回す）。
+    """
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        arr = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    out: Dict[int, str] = {}
+    for obj in arr if isinstance(arr, list) else []:
+        if not isinstance(obj, dict):
+            continue
+        m = re.fullmatch(r"c?(\d+)", str(obj.pop("id", "")).strip())
+        if m and int(m.group(1)) < n:
+            out[int(m.group(1))] = json.dumps(obj, ensure_ascii=False)
+    return out
@@ -0,0 +1,211 @@
+# report_index.py
+# レポートJSONL（*_gemini_reports.jsonl）の索引ファイル（<ファイル名>.idx）
+#
+# 行ごとの 開始バイト位置・user_id・総合スコア・失敗フラグ・担当 を列ごとに並べたバイナリ。
+# 担当は番号で持ち、名前の一覧はファイルの末尾（JSON）に置く。
+# これがあれば、ファイル全体を読まずに N ページ目や特定の user_id の行へ直接 seek して、
+# 表示する行だけ json.loads できる（50k 件でも索引は 1MB ちょっと）。
+#
+# - analysis_pipeline._run_job がレポートを書くときに IndexWriter で一緒に作る
+# - UI（ui_analysis）はジョブの記録があれば analysis.db の reports を使い、
+#   記録のないファイル（別の環境から持ってきた等）だけこの索引で読む
+# - load_index は索引がない・元ファイルとサイズ/更新時刻が合わないとき None を返す
+#   （open_index はそのとき1回だけ作り直す）
+#
+#     idx = open_index(path)
+#     rows = idx.page(3)            # 4ページ目（PAGE_SIZE 件）
+#     i = idx.find(user_id)         # その user_id の行番号
+#     rec = idx.read(i)
+import json
+import os
+import struct
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from analysis_store import ERROR_PREFIX, parse_report_text
+
+INDEX_SUFFIX = ".idx"
+PAGE_SIZE = 100
+MAGIC = b"RPTIDX2\0"               # 1 → 2: 担当の列を追加（旧形式は load_index が None を返して作り直す）
+HEADER = struct.Struct("<8sqqq")   # MAGIC, 行数, 元ファイルのサイズ, 元ファイルの更新時刻（ns）
+NO_USER = -1                       # user_id がない行
+NO_SCORE = float("nan")            # 総合スコアがない行
+NO_SUPPORT = -1                    # 担当がない行
+
+
+def index_path(path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def _score_and_flag(report: str):
+    """(総合スコア, 失敗なら1)"""
+    if not report or report.startswith(ERROR_PREFIX):
+        return NO_SCORE, 1
+    so = parse_report_text(report)["score_overall"]
+    return (NO_SCORE if so is None else so), 0
+
+
+# ===== 書き込み =====
+class IndexWriter:
+    """
+    レポートJSONLを書きながら各行の位置を覚える。
+    改行コードの変換で位置がずれないよう、ファイルはバイナリ（"wb"）で開いて渡す。
+    """
+
+    def __init__(self, fw):
+        self.fw = fw
+        self.pos = 0
+        self.cols = _Columns()
+
+    def write(self, rec: Dict):
+        data = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+        self.cols.add(self.pos, rec)
+        self.fw.write(data)
+        self.pos += len(data)
+
+    def save(self, path):
+        """JSONL を閉じて置き換えた後に呼ぶ（元ファイルのサイズ・更新時刻を索引に記録する）"""
+        self.cols.save(path)
+
+
+class _Columns:
+    """索引の列（IndexWriter と build_index で共通）"""
+
+    def __init__(self):
+        self.offsets = array("q")
+        self.user_ids = array("q")
+        self.scores = array("d")
+        self.flags = array("b")
+        self.support_ids = array("i")
+        self.supports: Dict[str, int] = {}   # 担当名 → 番号（出てきた順）
+
+    def add(self, pos: int, rec: Dict):
+        score, flag = _score_and_flag(rec.get("report") or "")
+        support = rec.get("support")
+        self.offsets.append(pos)
+        self.user_ids.append(NO_USER if rec.get("user_id") is None else int(rec["user_id"]))
+        self.scores.append(score)
+        self.flags.append(flag)
+        self.support_ids.append(NO_SUPPORT if not support else self.supports.setdefault(support, len(self.supports)))
+
+    def save(self, path):
+        st = Path(path).stat()
+        dst = index_path(path)
+        tmp = dst.with_name(dst.name + ".tmp")
+        with tmp.open("wb") as f:
+            f.write(HEADER.pack(MAGIC, len(self.offsets), st.st_size, st.st_mtime_ns))
+            for col in (self.offsets, self.user_ids, self.scores, self.flags, self.support_ids):
+                col.tofile(f)
+            f.write(json.dumps(list(self.supports), ensure_ascii=False).encode("utf-8"))
+        os.replace(tmp, dst)
+
+
+def build_index(path) -> None:
+    """索引のないレポートJSONLを1回だけ頭から読んで索引を作る（1行ずつ読むのでメモリは増えない）"""
+    cols = _Columns()
+    pos = 0
+    with Path(path).open("rb") as f:
+        for line in f:
+            if line.strip():
+                cols.add(pos, json.loads(line))
+            pos += len(line)
+    cols.save(path)
+
+
+# ===== 読み込み =====
+class ReportIndex:
+    """索引（列ごとの array）と、必要な行だけ読むためのファイルハンドル"""
+
+    def __init__(self, path, offsets: array, user_ids: array, scores: array, flags: array,
+                 support_ids: array, supports: List[str]):
+        self.path = Path(path)
+        self.offsets = offsets
+        self.user_ids = user_ids
+        self.scores = scores
+        self.flags = flags
+        self.support_ids = support_ids
+        self.supports = supports   # 担当名の一覧（ファイルに出てくる順）
+        self._f = None
+        self._rows_by_user: Optional[Dict[int, int]] = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def read(self, i: int) -> Dict:
+        """i 行目だけを読んで、analysis_store.get_report と同じ形の dict にする"""
+        if self._f is None:
+            self._f = self.path.open("rb")
+        self._f.seek(self.offsets[i])
+        row = json.loads(self._f.readline())
+        report = row.get("report") or ""
+        failed = bool(self.flags[i])
+        p = parse_report_text("" if failed else report)
+        return {
+            "user_id": row.get("user_id"), "line_name": row.get("line_name"), "support": row.get("support"),
+            "score_comm": p["score_comm"], "score_time": p["score_time"], "score_overall": p["score_overall"],
+            "summary": p["summary"] or "", "improvements": p["improvements"], "examples": p["examples"],
+            "_raw": report if failed else p["_raw"], "error": failed,
+        }
+
+    def page(self, n: int, size: int = PAGE_SIZE) -> List[Dict]:
+        """n ページ目（0 始まり）の行"""
+        return [self.read(i) for i in range(n * size, min((n + 1) * size, len(self)))]
+
+    def find(self, user_id: int) -> Optional[int]:
+        """user_id の行番号（初回だけ user_id → 行番号 の表を作る）"""
+        if self._rows_by_user is None:
+            self._rows_by_user = {}
+            for i, uid in enumerate(self.user_ids):
+                self._rows_by_user.setdefault(uid, i)
+        return self._rows_by_user.get(int(user_id))
+
+    def heads(self) -> Iterator[Dict]:
+        """
+        一覧用の行（索引だけで分かる項目）。名前・要約は入れずに "_row" を付けておき、
+        表示やキーワードでの絞り込みで必要になった行だけ read する（ui_report_list の load_head）
+        """
+        for i in range(len(self)):
+            so = self.scores[i]
+            sid = self.support_ids[i]
+            yield {"_row": i, "user_id": None if self.user_ids[i] == NO_USER else self.user_ids[i],
+                   "support": None if sid == NO_SUPPORT else self.supports[sid],
+                   "score_overall": None if so != so else so, "error": bool(self.flags[i])}
+
+
+def load_index(path) -> Optional[ReportIndex]:
+    """索引を開く。無い・古い（JSONL が書き換えられた）なら None"""
+    ipath = index_path(path)
+    if not ipath.exists():
+        return None
+    st = Path(path).stat()
+    with ipath.open("rb") as f:
+        head = f.read(HEADER.size)
+        if len(head) < HEADER.size:
+            return None
+        magic, n, size, mtime_ns = HEADER.unpack(head)
+        if magic != MAGIC or size != st.st_size or mtime_ns != st.st_mtime_ns:
+            return None
+        cols = [array("q"), array("q"), array("d"), array("b"), array("i")]
+        try:
+            for col in cols:
+                col.fromfile(f, n)
+            supports = json.loads(f.read().decode("utf-8"))
+        except (EOFError, ValueError):
+            return None
+    return ReportIndex(path, *cols, supports)
+
+
+def open_index(path) -> ReportIndex:
+    """索引を開く。無い・古い場合は作り直してから開く"""
+    idx = load_index(path)
+    if idx is None:
+        build_index(path)
+        idx = load_index(path)
+    return idx
@@ -0,0 +1,100 @@
+# response_metrics.py
+# 応答時間（ユーザーの発言 → サポートの返信）の集計を、全会話まとめて1回の走査で行う
+#
+# 直前の発言との比較と時刻の解釈は SQL（LAG() ウィンドウ関数・strftime）で済ませ、
+# Python は待ち時間（秒）の並びから 件数・平均・中央値・p90・p95・最小・最大 を出すだけ。
+# ユーザー別と担当者別を同じ走査で作る。
+#
+#     conn = message_store.connect(DB_PATH, include_archives=True)
+#     by_user, by_support = latency_metrics(conn, "you", "me")
+import math
+import sqlite3
+import statistics
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 時刻は "YYYY-MM-DD HH:MM:SS" / "YYYY/MM/DD HH:MM:SS" / "YYYY-MM-DDTHH:MM:SS"（秒なしも可）を解釈する。
+# 解釈できない時刻の発言は、直前の発言としても数えない（従来の _parse_time と同じ）
+LATENCY_SQL = """
+    WITH msgs AS (
+        SELECT m.user_id, COALESCE(NULLIF(u.support, ''), ?) AS support, m.sender, m.time_sent, m.id,
+               CAST(strftime('%s', replace(m.time_sent, '/', '-')) AS INTEGER) AS ts
+        FROM messages_v m
+        JOIN users u ON u.id = m.user_id
+        WHERE {where}
+    ),
+    seq AS (
+        SELECT user_id, support, sender, ts,
+               LAG(sender) OVER w AS prev_sender,
+               LAG(ts) OVER w AS prev_ts
+        FROM msgs
+        WHERE ts IS NOT NULL
+        WINDOW w AS (PARTITION BY user_id ORDER BY time_sent, id)
+    )
+    SELECT user_id, support, ts - prev_ts AS latency
+    FROM seq
+    WHERE prev_sender = ? AND sender = ?
+    ORDER BY user_id, latency
+"""
+FETCH_SIZE = 10000
+
+
+def summarize(lat_sorted: List[float]) -> Dict:
+    """昇順に並んだ待ち時間（秒）の要約。p90 / p95 は線形補間"""
+    if not lat_sorted:
+        return {"count": 0}
+
+    def pct(p):
+        k = (len(lat_sorted) - 1) * p
+        a = math.floor(k); b = math.ceil(k)
+        if a == b: return lat_sorted[int(k)]
+        return lat_sorted[a] + (lat_sorted[b] - lat_sorted[a]) * (k - a)
+
+    return {
+        "count": len(lat_sorted),
+        "avg_sec": sum(lat_sorted) / len(lat_sorted),
+        "median_sec": statistics.median(lat_sorted),
+        "p90_sec": pct(0.90),
+        "p95_sec": pct(0.95),
+        "min_sec": lat_sorted[0],
+        "max_sec": lat_sorted[-1],
+    }
+
+
+def latency_metrics(conn: sqlite3.Connection, customer_sender: str, support_sender: str,
+                    support: Optional[str] = None,
+                    is_auto: Optional[Callable[[str, Optional[str]], bool]] = None,
+                    min_auto_chars: int = 0,
+                    unassigned: str = "未割当") -> Tuple[Dict[int, Dict], Dict[str, Dict]]:
+    """
+    conn は message_store.connect() の接続（messages_v を使う）。
+    - 定型文（messages_v.is_template）は応答とみなさず、直前の発言としても数えない
+    - is_auto(本文, ユーザー名) が True を返すサポート側の発言も同様（min_auto_chars 文字未満は判定しない）
+    - support を指定したらその担当のユーザーだけ
+    戻り値: (user_id → 要約, 担当者 → 要約)。担当者なしは unassigned にまとめる
+    """
+    where, args = ["m.is_template = 0"], [unassigned]
+    if is_auto is not None:
+        conn.create_function("is_auto", 2, is_auto, deterministic=True)
+        where.append("NOT (m.sender = ? AND length(trim(m.message)) >= ? AND is_auto(m.message, u.line_name))")
+        args += [support_sender, min_auto_chars]
+    if support is not None:
+        where.append("u.support = ?")
+        args.append(support)
+    args += [customer_sender, support_sender]
+
+    by_user: Dict[int, Dict] = {}
+    per_support: Dict[str, List[float]] = {}
+    cur = conn.execute(LATENCY_SQL.format(where=" AND ".join(where)), args)
+    uid, lat = None, []
+    for rows in iter(lambda: cur.fetchmany(FETCH_SIZE), []):
+        for user_id, sup, latency in rows:
+            if user_id != uid:
+                if uid is not None:
+                    by_user[uid] = summarize(lat)
+                uid, lat = user_id, []
+            lat.append(float(latency))
+            per_support.setdefault(sup, []).append(float(latency))
+    if uid is not None:
+        by_user[uid] = summarize(lat)
+    by_support = {sup: summarize(sorted(v)) for sup, v in per_support.items()}
+    return by_user, by_support
@@ -0,0 +1,320 @@
+# rollups.py
+# 担当者 × 日 の集計（ダッシュボード用）を analysis_out/analysis.db に保持する
+#
+# support_daily          : メッセージ数・応答数・応答時間（合計/中央値/p90/p95/最大）・未返信数
+# support_latency_hist   : 応答時間の分布（LATENCY_BUCKETS ごとの件数。期間をまたいだ分位点の目安に使う）
+# support_daily_scores   : LLM レポートの件数・スコア合計（日 = レポートの作成日。1人1件 = 最新のレポート）
+# support_score_hist     : 総合スコアの分布（0〜5 に丸めた件数）
+#
+# スクレイピングのたびに users / messages は入れ直されるので、id ではなく
+# 「担当 × 日 のメッセージ数」を前回の集計と比べ、変わった最初の日以降だけを作り直す。
+# それより前の日（アーカイブ済みで現行DBから消えた日も）はそのまま残す。
+# 応答時間はユーザーの発言の日に、未返信（最後の発言がユーザーのまま）もその発言の日に数える。
+# そのため、その日より前で返信待ちのままだった発言があれば、作り直しはその発言の日からにする。
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from analysis_pipeline import CUSTOMER_SENDER, SUPPORT_SENDER, UNASSIGNED_SUPPORT
+from analysis_store import STORE_PATH, connect as connect_store
+from message_store import (DB_PATH, TEMPLATE_MIN_CHARS, connect as connect_messages, template_matcher,
+                           template_norm_hashes)
+from response_metrics import summarize
+
+# 応答時間の分布の区切り（秒。この値以下）。最後の区切りを超えたものは最終バケット
+LATENCY_BUCKETS = [5 * 60, 15 * 60, 30 * 60, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 24 * 3600, 48 * 3600]
+
+# 担当 × 日 のメッセージ数（定型文も含む）。作り直す日の判定にも使う
+COUNTS_SQL = """
+    SELECT COALESCE(NULLIF(u.support, ''), ?) AS support,
+           date(replace(m.time_sent, '/', '-')) AS day,
+           COUNT(*) AS messages,
+           SUM(m.sender = ?) AS customer_messages,
+           SUM(m.sender = ?) AS support_messages,
+           SUM(m.is_template) AS template_messages
+    FROM messages_v m
+    JOIN users u ON u.id = m.user_id
+    GROUP BY 1, 2
+    HAVING day IS NOT NULL
+"""
+
+# since 以降の 応答（ユーザー → サポート）と未返信。定型文は応答・直前の発言として数えない
+# （since より前の発言は、since 以降の日に数える応答・未返信には影響しない。
+#   逆に since 以降の発言が前の日の数を変えることは PENDING_SQL で since を戻して防ぐ）
+EVENTS_SQL = """
+    WITH msgs AS (
+        SELECT m.user_id, COALESCE(NULLIF(u.support, ''), ?) AS support, m.sender, m.time_sent, m.id,
+               CAST(strftime('%s', replace(m.time_sent, '/', '-')) AS INTEGER) AS ts
+        FROM messages_v m
+        JOIN users u ON u.id = m.user_id
+        WHERE m.time_sent >= ? AND {where}
+    ),
+    seq AS (
+        SELECT support, sender, ts,
+               LAG(sender) OVER w AS prev_sender,
+               LAG(ts) OVER w AS prev_ts,
+               LEAD(sender) OVER w AS next_sender
+        FROM msgs
+        WHERE ts IS NOT NULL
+        WINDOW w AS (PARTITION BY user_id ORDER BY time_sent, id)
+    )
+    SELECT support, date(prev_ts, 'unixepoch') AS day, ts - prev_ts AS latency
+    FROM seq WHERE prev_sender = ? AND sender = ?
+    UNION ALL
+    SELECT support, date(ts, 'unixepoch'), NULL
+    FROM seq WHERE sender = ? AND next_sender IS NULL
+"""
+
+# ユーザーごとの since より前の最後の発言（定型文を除く）がユーザーのものなら、その日。
+# その発言への応答・未返信は since 以降の発言で変わるので、作り直しをその日まで戻す
+PENDING_SQL = """
+    SELECT MIN(day) FROM (
+        SELECT date(replace(m.time_sent, '/', '-')) AS day, m.sender,
+               ROW_NUMBER() OVER (PARTITION BY m.user_id ORDER BY m.time_sent DESC, m.id DESC) AS rn
+        FROM messages_v m
+        JOIN users u ON u.id = m.user_id
+        WHERE m.time_sent < ? AND strftime('%s', replace(m.time_sent, '/', '-')) IS NOT NULL AND {where}
+    )
+    WHERE rn = 1 AND sender = ?
+"""
+
+
+# 顧客（reports.user_key = users.href）ごとに最新の1件だけ。再スクレイピング後の再分析や
+# 別モデルでの分析で同じ人のレポートが複数あっても1人として数える
+LATEST_REPORTS_SQL = """
+    SELECT support, created_at, score_overall, score_comm, score_time FROM (
+        SELECT support, created_at, score_overall, score_comm, score_time,
+               ROW_NUMBER() OVER (PARTITION BY user_key ORDER BY created_at DESC, id DESC) AS rn
+        FROM reports WHERE error IS NULL AND score_overall IS NOT NULL
+    ) WHERE rn = 1
+"""
+
+
+def ensure_rollup_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS support_daily (
+            support TEXT,
+            day TEXT,                -- YYYY-MM-DD
+            messages INTEGER,
+            customer_messages INTEGER,
+            support_messages INTEGER,
+            template_messages INTEGER,
+            responses INTEGER,       -- ユーザー → サポート の応答数
+            latency_sum REAL,
+            latency_median REAL,
+            latency_p90 REAL,
+            latency_p95 REAL,
+            latency_max REAL,
+            unanswered INTEGER,      -- 最後の発言がユーザーのまま（返信待ち）
+            updated_at TEXT,
+            PRIMARY KEY (support, day)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS support_latency_hist (
+            support TEXT, day TEXT, bucket INTEGER, n INTEGER,
+            PRIMARY KEY (support, day, bucket)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS support_daily_scores (
+            support TEXT, day TEXT,
+            reports INTEGER,         -- スコアのあるレポート数
+            overall_sum REAL, comm_sum REAL, time_sum REAL,
+            PRIMARY KEY (support, day)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS support_score_hist (
+            support TEXT, day TEXT, bucket INTEGER, n INTEGER,   -- bucket: 総合スコアを 0〜5 に丸めた値
+            PRIMARY KEY (support, day, bucket)
+        ) WITHOUT ROWID
+    """)
+    conn.commit()
+
+
+def _bucket(sec: float) -> int:
+    for i, edge in enumerate(LATENCY_BUCKETS):
+        if sec <= edge:
+            return i
+    return len(LATENCY_BUCKETS)
+
+
+def _first_changed_day(store: sqlite3.Connection, counts: Dict[Tuple[str, str], tuple]) -> Optional[str]:
+    """現行DBの 担当 × 日 のメッセージ数が前回の集計と違う最初の日（変化なしなら None）"""
+    old = {(s, d): (m, c, sp, t) for s, d, m, c, sp, t in store.execute(
+        "SELECT support, day, messages, customer_messages, support_messages, template_messages FROM support_daily")}
+    changed = [day for (support, day), row in counts.items() if old.get((support, day)) != row]
+    # 現行DBより前の日（アーカイブ済み）は残すが、現行DBの期間内で消えた 担当 × 日 は作り直す
+    first_day = min((day for _, day in counts), default=None)
+    if first_day is not None:
+        changed += [day for (support, day) in old if day >= first_day and (support, day) not in counts]
+    return min(changed) if changed else None
+
+
+def refresh_rollups(db_path: str = DB_PATH, store_path: Path = STORE_PATH, full: bool = False) -> Dict:
+    """
+    メッセージ側の集計を更新する（変わった最初の日以降だけ。full=True なら現行DBの全期間）。
+    変わった日より前に返信待ちの発言があれば、その日から作り直す（PENDING_SQL）。
+    定型文の扱いは analysis_pipeline の応答時間と同じ（is_template + 正規化での一致）。
+    戻り値: {"since": 作り直した最初の日 or None, "days": 行数, "responses": 件数}
+    """
+    conn = connect_messages(db_path, include_archives=True)
+    store = connect_store(store_path)
+    try:
+        ensure_rollup_tables(store)
+        counts = {(s, d): (m, c or 0, sp or 0, t or 0) for s, d, m, c, sp, t in conn.execute(
+            COUNTS_SQL, (UNASSIGNED_SUPPORT, CUSTOMER_SENDER, SUPPORT_SENDER))}
+        since = min((d for _, d in counts), default=None) if full else _first_changed_day(store, counts)
+        if since is None:
+            return {"since": None, "days": 0, "responses": 0}
+
+        where, where_args = ["m.is_template = 0"], []
+        is_auto = template_matcher(template_norm_hashes(conn, SUPPORT_SENDER))
+        if is_auto is not None:
+            conn.create_function("is_auto", 2, is_auto, deterministic=True)
+            where.append("NOT (m.sender = ? AND length(trim(m.message)) >= ? AND is_auto(m.message, u.line_name))")
+            where_args += [SUPPORT_SENDER, TEMPLATE_MIN_CHARS]
+        where = " AND ".join(where)
+        if not full:
+            pending = conn.execute(PENDING_SQL.format(where=where),
+                                   [since, *where_args, CUSTOMER_SENDER]).fetchone()[0]
+            if pending is not None and pending < since:
+                since = pending
+
+        args = [UNASSIGNED_SUPPORT, since, *where_args, CUSTOMER_SENDER, SUPPORT_SENDER, CUSTOMER_SENDER]
+        latencies: Dict[Tuple[str, str], List[float]] = {}
+        unanswered: Dict[Tuple[str, str], int] = {}
+        for support, day, latency in conn.execute(EVENTS_SQL.format(where=where), args):
+            if day is None or day < since:
+                continue
+            if latency is None:
+                unanswered[(support, day)] = unanswered.get((support, day), 0) + 1
+            else:
+                latencies.setdefault((support, day), []).append(float(latency))
+
+        rows, hist = [], []
+        for key in sorted(k for k in set(counts) | set(latencies) | set(unanswered) if k[1] >= since):
+            lat = sorted(latencies.get(key, []))
+            s = summarize(lat)
+            m, c, sp, t = counts.get(key, (0, 0, 0, 0))
+            rows.append((*key, m, c, sp, t, len(lat), sum(lat), s.get("median_sec"), s.get("p90_sec"),
+                         s.get("p95_sec"), s.get("max_sec"), unanswered.get(key, 0)))
+            per_bucket: Dict[int, int] = {}
+            for x in lat:
+                b = _bucket(x)
+                per_bucket[b] = per_bucket.get(b, 0) + 1
+            hist += [(*key, b, n) for b, n in per_bucket.items()]
+
+        store.execute("DELETE FROM support_daily WHERE day >= ?", (since,))
+        store.execute("DELETE FROM support_latency_hist WHERE day >= ?", (since,))
+        store.executemany("""
+            INSERT INTO support_daily (support, day, messages, customer_messages, support_messages,
+                                       template_messages, responses, latency_sum, latency_median,
+                                       latency_p90, latency_p95, latency_max, unanswered, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
+        """, rows)
+        store.executemany("INSERT INTO support_latency_hist (support, day, bucket, n) VALUES (?, ?, ?, ?)", hist)
+        store.commit()
+        return {"since": since, "days": len(rows), "responses": sum(r[6] for r in rows)}
+    finally:
+        conn.close()
+        store.close()
+
+
+def refresh_score_rollups(store_path: Path = STORE_PATH) -> int:
+    """reports（解析済みレポート。顧客ごとに最新の1件）からスコアの集計を作り直す（毎回全件）。戻り値: 行数"""
+    store = connect_store(store_path)
+    try:
+        ensure_rollup_tables(store)
+        store.execute("DELETE FROM support_daily_scores")
+        store.execute("DELETE FROM support_score_hist")
+        store.execute(f"""
+            INSERT INTO support_daily_scores (support, day, reports, overall_sum, comm_sum, time_sum)
+            SELECT COALESCE(NULLIF(support, ''), ?), date(created_at), COUNT(*),
+                   SUM(score_overall), SUM(score_comm), SUM(score_time)
+            FROM ({LATEST_REPORTS_SQL})
+            GROUP BY 1, 2
+        """, (UNASSIGNED_SUPPORT,))
+        store.execute(f"""
+            INSERT INTO support_score_hist (support, day, bucket, n)
+            SELECT COALESCE(NULLIF(support, ''), ?), date(created_at),
+                   MIN(5, MAX(0, CAST(round(score_overall) AS INTEGER))), COUNT(*)
+            FROM ({LATEST_REPORTS_SQL})
+            GROUP BY 1, 2, 3
+        """, (UNASSIGNED_SUPPORT,))
+        store.commit()
+        return store.execute("SELECT COUNT(*) FROM support_daily_scores").fetchone()[0]
+    finally:
+        store.close()
+
+
+# ===== ダッシュボード用の読み出し =====
+def _hist_percentile(counts: List[int], p: float) -> Optional[float]:
+    """分布から分位点の目安（そのバケットの上限。最終バケットは最後の区切りの値）"""
+    total = sum(counts)
+    if not total:
+        return None
+    need, acc = total * p, 0
+    for i, n in enumerate(counts):
+        acc += n
+        if acc >= need:
+            return float(LATENCY_BUCKETS[min(i, len(LATENCY_BUCKETS) - 1)])
+    return float(LATENCY_BUCKETS[-1])
+
+
+def _empty_row(support: str) -> Dict:
+    return {
+        "support": support, "days": 0, "messages": 0, "customer_messages": 0, "support_messages": 0,
+        "template_messages": 0, "responses": 0, "latency_avg": None, "latency_max": None, "unanswered": 0,
+        "latency_hist": [0] * (len(LATENCY_BUCKETS) + 1),
+        "reports": 0, "score_overall": None, "score_comm": None, "score_time": None, "score_hist": [0] * 6,
+    }
+
+
+def dashboard(store_path: Path = STORE_PATH, since: Optional[str] = None) -> List[Dict]:
+    """
+    担当者ごとの since 以降（None なら全期間）の集計。集計テーブルを足し合わせるだけなので速い。
+    latency_p50 / latency_p90 は分布からの目安（バケットの上限値）。
+    """
+    store = connect_store(store_path)
+    try:
+        ensure_rollup_tables(store)
+        day_from = since or ""
+        out: Dict[str, Dict] = {}
+        for (support, messages, customer, staff, templates, responses, lat_sum, lat_max, unanswered,
+             days) in store.execute("""
+                SELECT support, SUM(messages), SUM(customer_messages), SUM(support_messages),
+                       SUM(template_messages), SUM(responses), SUM(latency_sum), MAX(latency_max),
+                       SUM(unanswered), COUNT(*)
+                FROM support_daily WHERE day >= ? GROUP BY support
+            """, (day_from,)):
+            out[support] = _empty_row(support)
+            out[support].update(days=days, messages=messages, customer_messages=customer, support_messages=staff,
+                                template_messages=templates, responses=responses,
+                                latency_avg=lat_sum / responses if responses else None, latency_max=lat_max,
+                                unanswered=unanswered)
+        for support, bucket, n in store.execute("""
+            SELECT support, bucket, SUM(n) FROM support_latency_hist WHERE day >= ? GROUP BY 1, 2
+        """, (day_from,)):
+            if support in out:
+                out[support]["latency_hist"][bucket] = n
+        for support, reports, overall, comm, time_ in store.execute("""
+            SELECT support, SUM(reports), SUM(overall_sum), SUM(comm_sum), SUM(time_sum)
+            FROM support_daily_scores WHERE day >= ? GROUP BY support
+        """, (day_from,)):
+            row = out.setdefault(support, _empty_row(support))
+            row.update(reports=reports, score_overall=overall / reports,
+                       score_comm=comm / reports if comm is not None else None,
+                       score_time=time_ / reports if time_ is not None else None)
+        for support, bucket, n in store.execute("""
+            SELECT support, bucket, SUM(n) FROM support_score_hist WHERE day >= ? GROUP BY 1, 2
+        """, (day_from,)):
+            if support in out:
+                out[support]["score_hist"][bucket] = n
+        for row in out.values():
+            row["latency_p50"] = _hist_percentile(row["latency_hist"], 0.5)
+            row["latency_p90"] = _hist_percentile(row["latency_hist"], 0.9)
+        return sorted(out.values(), key=lambda r: r["support"])
+    finally:
+        store.close()
@@ -0,0 +1,9 @@
+# tests/conftest.py
+# リポジトリ直下のモジュールと benchmarks/（合成DB・ローカル FTPS）を import できるようにする
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
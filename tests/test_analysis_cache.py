@@ -0,0 +1,40 @@
+# tests/test_analysis_cache.py
+# まとめ送りで得たレポートは単独送信のキーとは別のキー（BATCH_MODE つき）でキャッシュされること
+import sqlite3
+
+import pytest
+
+from analysis_pipeline import _build_prompt, _read_jsonl, analyze_with_gemini, build_dataset_for_support
+from analysis_store import STORE_PATH, cache_key
+from llm_backends import StubBackend
+from prompt_packer import BATCH_MODE
+from synthetic import make_db
+
+
+@pytest.fixture(autouse=True)
+def _cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # analysis_out/analysis.db を一時ディレクトリに作る
+
+
+def test_batched_reports_use_batch_key(tmp_path):
+    out_dir = tmp_path / "analysis_out"
+    out_dir.mkdir()
+    db = make_db(str(tmp_path / "t.db"), n_users=16, n_messages=160)   # 短い会話だけ（まとめ送りされる）
+    conn = sqlite3.connect(db)
+    support = conn.execute("SELECT support FROM users GROUP BY support ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    conn.close()
+    dataset, n = build_dataset_for_support(support, db, out_dir)
+    backend = StubBackend(latency=0, error_rate=0)
+
+    _, _, stats = analyze_with_gemini(dataset, out_dir=out_dir, backend=backend)
+    assert stats["tokens"]["batched_conversations"] == n > 1
+
+    store = sqlite3.connect(STORE_PATH)
+    keys = {k for (k,) in store.execute("SELECT key FROM report_cache")}
+    store.close()
+    prompts = [_build_prompt(rec) for rec in _read_jsonl(dataset)]
+    assert keys == {cache_key(backend.name, p, BATCH_MODE) for p in prompts}
+
+    # 同じ会話をもう一度（新しいジョブで）: まとめ送りの候補なのでキャッシュから返る
+    _, _, stats = analyze_with_gemini(dataset, out_dir=out_dir, backend=backend, resume=False)
+    assert stats["tokens"]["cache_hits"] == n and stats["tokens"]["requests"] == 0
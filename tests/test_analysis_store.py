@@ -0,0 +1,56 @@
+# tests/test_analysis_store.py
+# reports がユーザー（href）× モデルごとに1行に保たれること
+import json
+import sqlite3
+
+from analysis_store import connect, create_job, finish_job, iter_job_report_heads
+
+
+def _report(score):
+    return json.dumps({"score_communication": score, "score_timeliness": score, "score_overall": score,
+                       "summary": f"{score}点", "improvements": ["返信を早く"]}, ensure_ascii=False)
+
+
+def _job(conn, items, model="m"):
+    job_id = create_job(conn, "in.jsonl", "fp", "out.jsonl", model,
+                        ((seq, *item, "done", report) for seq, (*item, report) in enumerate(items)))
+    finish_job(conn, job_id)
+    return job_id
+
+
+def test_reanalysis_after_rescrape_replaces_row(tmp_path):
+    conn = connect(tmp_path / "analysis.db")
+    _job(conn, [(1, "/friend/1", "Aさん", "佐藤", _report(2)),
+                (None, None, "Bさん", "鈴木", _report(3))])
+    # 再スクレイピングで users.id が変わってから分析し直す（B は user_id も href も無い）
+    job_id = _job(conn, [(101, "/friend/1", "Aさん", "佐藤", _report(4)),
+                         (None, None, "Bさん", "鈴木", _report(5))])
+
+    rows = conn.execute("SELECT user_id, score_overall FROM reports ORDER BY line_name").fetchall()
+    assert rows == [(101, 4.0), (None, 5.0)]
+    assert [h["score_overall"] for h in iter_job_report_heads(conn, job_id)] == [4.0, 5.0]
+    assert conn.execute("SELECT COUNT(*) FROM report_improvements").fetchone()[0] == 2
+
+
+def test_old_reports_are_migrated_and_adopted(tmp_path):
+    path = tmp_path / "analysis.db"
+    old = sqlite3.connect(path)
+    old.execute("""
+        CREATE TABLE reports (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, line_name TEXT,
+            support TEXT, model TEXT, job_id INTEGER, score_comm REAL, score_time REAL, score_overall REAL,
+            summary TEXT, raw TEXT, error TEXT, created_at TEXT, UNIQUE (user_id, model))
+    """)
+    old.execute("CREATE TABLE report_improvements (report_id INTEGER, pos INTEGER, text TEXT, PRIMARY KEY (report_id, pos))")
+    old.execute("""CREATE TABLE report_examples (report_id INTEGER, pos INTEGER, type TEXT, quote TEXT,
+                   reason TEXT, PRIMARY KEY (report_id, pos))""")
+    # 同じ人が再スクレイピングで別の user_id になり、2行に分かれていた
+    old.executemany("INSERT INTO reports (user_id, line_name, support, model, score_overall) VALUES (?, 'Aさん', '佐藤', 'm', ?)",
+                    [(1, 2.0), (7, 3.0)])
+    old.commit()
+    old.close()
+
+    conn = connect(path)
+    assert conn.execute("SELECT user_id, score_overall FROM reports").fetchall() == [(7, 3.0)]
+    # href つきで分析し直すと、名前 + 担当 の行を引き継いで1行のまま
+    _job(conn, [(120, "/friend/1", "Aさん", "佐藤", _report(4))])
+    assert conn.execute("SELECT user_key, user_id, score_overall FROM reports").fetchall() == [("/friend/1", 120, 4.0)]
@@ -0,0 +1,35 @@
+# tests/test_datasets.py
+# 担当ごとのデータセット: 名前の似た担当が同じファイルに上書きされないこと・1担当だけの生成と一括生成が同じ会話を出すこと
+import json
+import sqlite3
+
+from analysis_pipeline import build_dataset_for_support, build_datasets_for_all_supports, dataset_file
+from synthetic import make_db
+
+TWINS = ("山田 太郎", "山田_太郎", "山田/太郎")
+
+
+def _users(path):
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line)["href"] for line in f]
+
+
+def test_similar_support_names_get_separate_shards(tmp_path):
+    db = make_db(str(tmp_path / "t.db"), n_users=30, n_messages=900)
+    conn = sqlite3.connect(db)
+    for i, name in enumerate(TWINS):
+        conn.execute("UPDATE users SET support = ? WHERE id % 3 = ?", (name, i))
+    conn.commit()
+    conn.close()
+
+    _, manifest = build_datasets_for_all_supports(db, tmp_path)
+    files = {sh["file"] for sh in manifest["shards"].values()}
+    assert len(files) == len(TWINS)
+    assert manifest["conversations"] == 30
+
+    for name in TWINS:
+        path, n = build_dataset_for_support(name, db, tmp_path)
+        assert path == dataset_file(name, tmp_path)
+        assert path.name == manifest["shards"][name]["file"]
+        assert n == manifest["shards"][name]["conversations"] == 10
+        assert len(set(_users(path))) == 10
@@ -0,0 +1,34 @@
+# tests/test_exporter.py
+# 差分エクスポートが再スクレイピング（id の振り直し）やアーカイブで全件に戻らないこと
+import sqlite3
+
+from exporter import compact_exports, export_incremental
+from message_store import archive_messages
+from synthetic import chat_history, make_db, rescrape
+
+
+def test_rescrape_exports_only_new_rows(tmp_path):
+    db = make_db(str(tmp_path / "t.db"), n_users=30, n_messages=1500)
+    out = str(tmp_path / "exports")
+    first = export_incremental(db, out)
+    assert (first["kind"], first["users_count"], first["messages_count"]) == ("full", 30, 1500)
+
+    # 再スクレイピング + 1通追加 + 1人の値が変わる
+    rescrape(db, chat_history(db))
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO messages (user_id, sender, message, time_sent) "
+                 "VALUES ((SELECT MAX(id) FROM users), 'you', '追加', '2026-01-01 00:00:00')")
+    conn.execute("UPDATE users SET tags = '購入済み' WHERE id = (SELECT MIN(id) FROM users)")
+    conn.commit()
+    conn.close()
+    archive_messages(db, archive_dir=str(tmp_path / "archives"), cutoff="2024-06-01")
+
+    delta = export_incremental(db, out)
+    assert (delta["kind"], delta["users_count"], delta["messages_count"]) == ("delta", 1, 1)
+
+    # 同じ秒に続けて出力してもファイルは別
+    again = export_incremental(db, out)
+    assert again["messages_count"] == 0 and again["messages"] != delta["messages"]
+
+    merged = compact_exports(db, out)
+    assert (merged["users_count"], merged["messages_count"]) == (30, 1501)
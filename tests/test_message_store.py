@@ -0,0 +1,75 @@
+# tests/test_message_store.py
+# アーカイブ（archive_messages）と connect(include_archives=True) の件数が
+# 再スクレイピング・再アーカイブをはさんでも変わらないことを確かめる
+import sqlite3
+
+import pytest
+
+from message_store import archive_messages, connect, intern_message_bodies
+from synthetic import chat_history, make_db, rescrape
+
+CUTOFF = "2024-07-01"   # これより古いメッセージをアーカイブする
+
+
+def _count(db, archive_dir, where="1"):
+    conn = connect(db, include_archives=True, archive_dir=str(archive_dir))
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM messages_v WHERE {where}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _archived(archive_dir):
+    total = 0
+    for path in archive_dir.glob("messages_*.db"):
+        conn = sqlite3.connect(path)
+        total += conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        conn.close()
+    return total
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = make_db(str(tmp_path / "t.db"), n_users=20, n_messages=2000)
+    # 同じ分に同じ本文を3回連投（スタンプ連打など）
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO messages (user_id, sender_name, sender, message, time_sent) VALUES (1, NULL, 'you', 'よろしくお願いします', ?)",
+        [("2024-02-01 10:00:00",)] * 3)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_connect_does_not_migrate(db):
+    schema = sqlite3.connect(db).execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall()
+    conn = connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM messages_v").fetchone()[0] == 2003
+    conn.close()
+    assert sqlite3.connect(db).execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall() == schema
+
+
+def test_repeated_messages_survive_archive(db, tmp_path):
+    arc = tmp_path / "archives"
+    repeat = "sender = 'you' AND time_sent = '2024-02-01 10:00:00' AND message = 'よろしくお願いします'"
+    result = archive_messages(db, archive_dir=str(arc), cutoff=CUTOFF)
+    assert result["moved"] == _archived(arc) > 0
+    assert _count(db, arc) == 2003
+    assert _count(db, arc, repeat) == 3
+
+
+def test_rescrape_is_not_double_counted(db, tmp_path):
+    arc = tmp_path / "archives"
+    history = chat_history(db)
+    intern_message_bodies(db)
+    archive_messages(db, archive_dir=str(arc), cutoff=CUTOFF)
+    archived = _archived(arc)
+
+    # 再スクレイピング直後: アーカイブ済みの日が現行DBにも戻っている
+    rescrape(db, history)
+    assert _count(db, arc) == 2003
+
+    # 次のアーカイブで同じ行は二重に保存されない
+    archive_messages(db, archive_dir=str(arc), cutoff=CUTOFF)
+    assert _archived(arc) == archived
+    assert _count(db, arc) == 2003
@@ -0,0 +1,44 @@
+# tests/test_report_index.py
+# 索引だけで担当が分かること・古い形式や書き換えられたファイルの索引は作り直されること
+import json
+
+from report_index import IndexWriter, index_path, load_index, open_index
+
+ROWS = [(1, "佐藤", '{"score_overall": 4}'), (2, None, "ERROR: 429"), (3, "鈴木", '{"score_overall": 2.5}'),
+        (4, "佐藤", '{"summary": "x"}')]
+
+
+def _write(path):
+    with path.open("wb") as fw:
+        index = IndexWriter(fw)
+        for uid, support, report in ROWS:
+            index.write({"user_id": uid, "line_name": f"U{uid}", "support": support, "report": report})
+    index.save(path)
+
+
+def test_heads_carry_support(tmp_path):
+    path = tmp_path / "r_gemini_reports.jsonl"
+    _write(path)
+    idx = load_index(path)
+    assert idx.supports == ["佐藤", "鈴木"]
+    assert [(h["user_id"], h["support"], h["score_overall"], h["error"]) for h in idx.heads()] == [
+        (1, "佐藤", 4.0, False), (2, None, None, True), (3, "鈴木", 2.5, False), (4, "佐藤", None, False)]
+    assert idx.read(idx.find(3))["line_name"] == "U3"
+    idx.close()
+
+
+def test_stale_or_old_index_is_rebuilt(tmp_path):
+    path = tmp_path / "r_gemini_reports.jsonl"
+    _write(path)
+    with path.open("a", encoding="utf-8") as fa:
+        fa.write(json.dumps({"user_id": 5, "support": "高橋", "report": "{}"}, ensure_ascii=False) + "\n")
+    assert load_index(path) is None
+    idx = open_index(path)
+    assert len(idx) == 5 and idx.supports == ["佐藤", "鈴木", "高橋"]
+    idx.close()
+
+    # 担当の列がない旧形式（RPTIDX1）は読まずに作り直す
+    data = index_path(path).read_bytes()
+    index_path(path).write_bytes(b"RPTIDX1\0" + data[8:])
+    assert load_index(path) is None
+    assert open_index(path).supports == ["佐藤", "鈴木", "高橋"]
@@ -0,0 +1,103 @@
+# tests/test_rollups.py
+# スクレイピング → 分析 を2回繰り返しても、スコア集計が顧客1人を1件として数えること
+# 差分更新（refresh_rollups）の結果が全期間の作り直しと同じになること
+import sqlite3
+
+import pytest
+
+from analysis_pipeline import analyze_with_gemini, build_datasets_for_all_supports
+from llm_backends import StubBackend
+from rollups import dashboard, refresh_rollups, refresh_score_rollups
+from synthetic import chat_history, make_db, rescrape
+
+N_USERS = 24
+
+
+@pytest.fixture(autouse=True)
+def _cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # analysis_out/analysis.db を一時ディレクトリに作る
+
+
+def _analyse_all(db, out_dir, model="stub"):
+    _, manifest = build_datasets_for_all_supports(db, out_dir)
+    backend = StubBackend(latency=0, error_rate=0)
+    backend.name = model
+    for shard in manifest["shards"].values():
+        _, _, stats = analyze_with_gemini(out_dir / shard["file"], out_dir=out_dir, use_cache=False,
+                                          backend=backend)
+        assert stats["errors"] == 0
+
+
+def _score_counts(store_path):
+    refresh_score_rollups(store_path)
+    conn = sqlite3.connect(store_path)
+    try:
+        return (conn.execute("SELECT SUM(reports) FROM support_daily_scores").fetchone()[0],
+                conn.execute("SELECT SUM(n) FROM support_score_hist").fetchone()[0],
+                conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0])
+    finally:
+        conn.close()
+
+
+def test_two_scrape_and_analyse_cycles(tmp_path):
+    out_dir = tmp_path / "analysis_out"
+    out_dir.mkdir()
+    store_path = out_dir / "analysis.db"
+    db = make_db(str(tmp_path / "t.db"), n_users=N_USERS, n_messages=600)
+
+    _analyse_all(db, out_dir)
+    assert _score_counts(store_path) == (N_USERS, N_USERS, N_USERS)
+
+    # 再スクレイピング（users.id が振り直される）+ 1人に新しい発言 → 全員を分析し直す
+    rescrape(db, chat_history(db))
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO messages (user_id, sender, message, time_sent) "
+                 "VALUES ((SELECT MIN(id) FROM users), 'you', '追加の質問です', '2026-01-01 00:00:00')")
+    conn.commit()
+    conn.close()
+    _analyse_all(db, out_dir)
+    assert _score_counts(store_path) == (N_USERS, N_USERS, N_USERS)
+
+    # 別のモデルで分析しても、集計は1人1件（最新のレポート）
+    _analyse_all(db, out_dir, model="stub-2")
+    reports, hist, rows = _score_counts(store_path)
+    assert (reports, hist, rows) == (N_USERS, N_USERS, 2 * N_USERS)
+    assert sum(r["reports"] for r in dashboard(store_path)) == N_USERS
+
+
+def _daily(store_path):
+    conn = sqlite3.connect(store_path)
+    try:
+        return (conn.execute("""
+                    SELECT support, day, messages, customer_messages, support_messages, template_messages,
+                           responses, latency_sum, latency_median, latency_p90, latency_p95, latency_max,
+                           unanswered
+                    FROM support_daily ORDER BY 1, 2""").fetchall(),
+                conn.execute("SELECT * FROM support_latency_hist ORDER BY 1, 2, 3").fetchall())
+    finally:
+        conn.close()
+
+
+def _add(db, sender, time_sent):
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO messages (user_id, sender, message, time_sent) "
+                 "VALUES ((SELECT MIN(id) FROM users), ?, '追加の発言です', ?)", (sender, time_sent))
+    conn.commit()
+    conn.close()
+
+
+def test_incremental_refresh_matches_full_rebuild(tmp_path):
+    db = make_db(str(tmp_path / "t.db"), n_users=N_USERS, n_messages=600)
+    store_path = tmp_path / "incremental.db"
+    refresh_rollups(db, store_path)
+
+    # 前日のユーザーの発言（返信待ち）→ 翌日にサポートが返信
+    _add(db, "you", "2026-01-01 10:00:00")
+    refresh_rollups(db, store_path)
+    _add(db, "me", "2026-01-02 09:00:00")
+    result = refresh_rollups(db, store_path)
+    assert result["since"] <= "2026-01-01"   # 返信待ちだった日まで戻して作り直す
+
+    full_path = tmp_path / "full.db"
+    refresh_rollups(db, full_path, full=True)
+    assert _daily(store_path) == _daily(full_path)
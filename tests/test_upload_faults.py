@@ -0,0 +1,198 @@
+# tests/test_upload_faults.py
+# upload_db_ftps をローカル FTPS（benchmarks/ftps_server.py）に向け、障害を注入しても
+# 元と同じファイルが届き、.tmp が残らないことを確かめる
+import os
+import shutil
+import sqlite3
+import threading
+from ftplib import error_perm, error_temp
+
+import pytest
+
+pytest.importorskip("pyftpdlib")
+pytest.importorskip("cryptography")
+
+from synthetic import make_db
+from ftps_server import PASSWORD, USER, LocalFTPS
+import uploader
+
+REMOTE_DIR = "public_html/support/"
+REMOTE_NAME = "lstep_users.db"
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    path = tmp_path_factory.mktemp("db") / "faults.db"
+    make_db(str(path), n_users=200, n_messages=30_000)  # 約4MB
+    return path
+
+
+@pytest.fixture(autouse=True)
+def _state_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # .upload_state をテストごとに分ける
+
+
+def _upload(srv: LocalFTPS, db, **kw) -> dict:
+    kw.setdefault("snapshot", False)
+    return uploader.upload_db_ftps(USER, PASSWORD, hosts=[srv.host], port=srv.port,
+                                   remote_dir=REMOTE_DIR, remote_name=REMOTE_NAME, local_file=str(db),
+                                   timeout=10, backoff=0.0, **kw)
+
+
+def _assert_delivered(srv: LocalFTPS, db):
+    with open(srv.path(REMOTE_DIR + REMOTE_NAME), "rb") as remote, open(db, "rb") as local:
+        assert remote.read() == local.read()
+    assert [f for f in os.listdir(srv.path(REMOTE_DIR)) if f.endswith(".tmp")] == []
+
+
+def _ok_trial(debug: dict) -> dict:
+    return next(t for t in debug["trials"] if t.get("ok"))
+
+
+@pytest.mark.parametrize("faults, resumes", [
+    (dict(drop_data_after=1_000_000, drops=2), 2),      # データ接続だけ切れる（426）
+    (dict(drop_session_after=1_000_000, drops=3), 3),   # 制御・データとも切れる（回線断）
+])
+def test_transfer_resumes_after_drop(db, faults, resumes):
+    with LocalFTPS(**faults) as srv:
+        debug = _upload(srv, db)
+        assert debug["success"], debug.get("error")
+        assert len(srv.events) == resumes
+        trial = _ok_trial(debug)
+        assert len(trial["resumes"]) == resumes
+        assert trial["transfer"]["resumed_from"] > 0
+        _assert_delivered(srv, db)
+
+
+def test_drop_on_rename_retries_with_next_candidate(db):
+    with LocalFTPS(drop_on_rename=1) as srv:
+        debug = _upload(srv, db)
+        assert debug["success"], debug.get("error")
+        assert [kind for kind, _ in srv.events] == ["drop_on_rename"]
+        assert [t["ok"] for t in debug["trials"]] == [False, True]
+        _assert_delivered(srv, db)
+
+
+def test_hidden_in_list_is_found_by_search(db):
+    with LocalFTPS(hide_in_list=1) as srv:
+        debug = _upload(srv, db)
+        assert debug["success"], debug.get("error")
+        trial = _ok_trial(debug)
+        assert trial["search_results"] == ["/" + REMOTE_DIR + REMOTE_NAME]
+        _assert_delivered(srv, db)
+
+
+def test_search_errors_do_not_fail_upload(db, monkeypatch):
+    # アップロード・rename の後の探索で一覧が取れなくても、アップロードは成功のまま
+    def _broken(*args, **kw):
+        raise error_temp("421 Service not available, closing control connection.")
+
+    monkeypatch.setattr(uploader, "_list_entries", _broken)
+    with LocalFTPS(hide_in_list=1) as srv:
+        debug = _upload(srv, db)
+        assert debug["success"], debug.get("error")
+        trial = _ok_trial(debug)
+        assert trial["search_results"] == []
+        assert trial["search_stats"]["errors"] > 0
+        _assert_delivered(srv, db)
+
+def test_gives_up_after_retries_then_resumes_next_run(db):
+    with LocalFTPS(drop_session_after=1_000_000, drops=10) as srv:
+        debug = _upload(srv, db, retries=1)
+        assert not debug["success"]
+        assert not os.path.exists(srv.path(REMOTE_DIR + REMOTE_NAME))
+
+        # 次の実行は、元ファイルが同じなら残った .tmp の続きから送る
+        srv.faults["drops"] = 0
+        debug = _upload(srv, db)
+        assert debug["success"], debug.get("error")
+        trial = _ok_trial(debug)
+        assert trial["transfer"]["resumed_from"] > 0
+        assert "discarded_tmp" not in trial
+        _assert_delivered(srv, db)
+
+
+def test_changed_db_does_not_resume_stale_tmp(db, tmp_path):
+    local = tmp_path / "changed.db"
+    shutil.copy(db, local)
+    with LocalFTPS(drop_session_after=1_000_000, drops=10) as srv:
+        assert not _upload(srv, local, retries=1)["success"]
+
+        # 次の実行までに DB が書き換わった（残った .tmp は古い内容）
+        conn = sqlite3.connect(local)
+        conn.execute("UPDATE messages SET message = message || '（編集）' WHERE id % 7 = 0")
+        conn.commit()
+        conn.close()
+
+        srv.faults["drops"] = 0
+        debug = _upload(srv, local)
+        assert debug["success"], debug.get("error")
+        trial = _ok_trial(debug)
+        assert trial["transfer"]["resumed_from"] == 0
+        assert trial["discarded_tmp"] > 0
+        _assert_delivered(srv, local)
+        remote = sqlite3.connect(srv.path(REMOTE_DIR + REMOTE_NAME))
+        assert remote.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        remote.close()
+
+
+def test_server_without_size(db):
+    with LocalFTPS(no_size=True, drop_data_after=1_000_000) as srv:
+        debug = _upload(srv, db)
+        assert debug["success"], debug.get("error")
+        trial = _ok_trial(debug)
+        assert len(trial["resumes"]) == 1
+        assert trial["transfer"]["resumed_from"] == 0  # 続きが分からないので最初から
+        _assert_delivered(srv, db)
+
+
+def test_failed_reconnect_counts_as_attempt(db, monkeypatch):
+    # 回線断の直後はホストがまだ応答しない（断のあと最初の再接続だけ失敗する）
+    open_session = uploader._open_session
+    refused = []
+
+    def _flaky(*args, **kw):
+        if srv.events and not refused:
+            refused.append(args)
+            raise ConnectionRefusedError("host is still down")
+        return open_session(*args, **kw)
+
+    monkeypatch.setattr(uploader, "_open_session", _flaky)
+    with LocalFTPS(drop_session_after=1_000_000, drops=1) as srv:
+        debug = _upload(srv, db)
+        assert debug["success"], debug.get("error")
+        trial = _ok_trial(debug)
+        assert [t for t in debug["trials"] if not t.get("ok") and t.get("stage") != "login"] == []
+        errors = [r["error"] for r in trial["resumes"]]
+        assert len(errors) == 2 and "host is still down" in errors[1]
+        _assert_delivered(srv, db)
+
+
+def test_failed_logins_are_not_probed_again(db, monkeypatch):
+    # "u@host" はログインできない。最初に成功した組が rename で切れても、失敗済みの組は試し直さない
+    open_session = uploader._open_session
+    logins, active, peak = {}, {}, {}
+    lock = threading.Lock()
+
+    def _counting(host, port, user, password, timeout):
+        with lock:
+            logins[(host, user)] = logins.get((host, user), 0) + 1
+            active[host] = active.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), active[host])
+        try:
+            if "@" in user:
+                raise error_perm("530 Login incorrect.")
+            return open_session(host, port, user, password, timeout)
+        finally:
+            with lock:
+                active[host] -= 1
+
+    monkeypatch.setattr(uploader, "_open_session", _counting)
+    with LocalFTPS(drop_on_rename=1) as srv:
+        debug = uploader.upload_db_ftps(USER, PASSWORD, hosts=[srv.host, "localhost"], port=srv.port,
+                                        remote_dir=REMOTE_DIR, remote_name=REMOTE_NAME, local_file=str(db),
+                                        timeout=10, backoff=0.0, snapshot=False)
+        assert debug["success"], debug.get("error")
+        assert all(n == 1 for (host, user), n in logins.items() if "@" in user)
+        assert max(peak.values()) <= uploader.PROBE_PER_HOST
+        _assert_delivered(srv, db)
@@ -6,19 +6,27 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import Qt, Signal, QObject, Slot, QThread
 from style import app_stylesheet, apply_card_shadow
 from sheets_support import get_support_members
-from analysis_pipeline import build_dataset_for_support, analyze_with_gemini
+from analysis_pipeline import (build_dataset_for_support, build_datasets_for_all_supports, analyze_with_gemini,
+                               reports_file, retry_gemini_errors)
+from analysis_store import connect as connect_store, get_report, iter_job_report_heads, job_for_output, job_supports
+from report_index import open_index
+from rollups import dashboard, refresh_rollups, refresh_score_rollups
+from ui_report_list import ReportListPanel
+from datetime import datetime, timedelta
+from PySide6.QtWidgets import QTableWidget, QTableWidgetItem, QAbstractItemView
 from pathlib import Path
 import os
 # 先頭の import 群に追加
-import json, re
-from pathlib import Path
-from PySide6.QtWidgets import QScrollArea, QListWidget, QListWidgetItem, QTextBrowser
-# 先頭の import 群に追加
 from PySide6.QtWidgets import QSizePolicy
 
 
 SPREADSHEET_ID = "1mDccfeN9sR8OJdWLv6wPN0DzRr5Y5OfLSmrjjHOvMI"  # ← こちらは担当プルダウン用の正しいIDをセット
 
+# 担当別ダッシュボード（rollups の集計を足し合わせて表示）
+DASHBOARD_PERIODS = {"直近7日": 7, "直近30日": 30, "直近90日": 90, "全期間": None}
+DASHBOARD_COLUMNS = ["担当", "メッセージ", "ユーザー発言", "応答数", "平均応答(時間)", "中央値(目安・時間)",
+                     "p90(目安・時間)", "未返信", "レポート", "総合スコア", "スコア分布 0/1/2/3/4/5"]
+
 # 変更箇所だけ
 
 class FetchWorker(QObject):
@@ -53,7 +61,10 @@ class AnalysisWindow(QWidget):
         self.setStyleSheet(app_stylesheet())
         self.last_reports: Path | None = None  # 直近のGemini結果パス
         self.last_jsonl: Path | None = None  # 直近に生成したデータ
+        self.report_store = None              # 一覧の表示中は開いたままにする（詳細を1件ずつ引く）
+        self.report_index = None              # 同上（ジョブの記録がないレポートファイルの索引）
         self._build()
+        self._render_dashboard()
         self._fetch_supports()
 
     def _build(self):
@@ -74,32 +85,46 @@ class AnalysisWindow(QWidget):
         op = QHBoxLayout()
         self.btn_build = QPushButton("この担当のデータ生成（JSONL）")
         self.btn_build.clicked.connect(self.on_build_clicked)
+        self.btn_build_all = QPushButton("全担当のデータ生成（一括）")
+        self.btn_build_all.clicked.connect(self.on_build_all_clicked)
         self.btn_gemini = QPushButton("Geminiで評価生成")
         self.btn_gemini.clicked.connect(self.on_gemini_clicked)
+        self.btn_retry = QPushButton("エラーのみ再実行")
+        self.btn_retry.clicked.connect(self.on_retry_errors_clicked)
         self.btn_show = QPushButton("レポート一覧を表示")      # ← 追加
         self.btn_show.clicked.connect(self.on_show_reports)   # ← 追加
-        op.addWidget(self.btn_build); op.addWidget(self.btn_gemini); op.addWidget(self.btn_show)
+        op.addWidget(self.btn_build); op.addWidget(self.btn_build_all); op.addWidget(self.btn_gemini); op.addWidget(self.btn_retry); op.addWidget(self.btn_show)
         cv.addLayout(op)
 
         root.addWidget(card); apply_card_shadow(card)
 
-        # --- カード：レポート一覧（スクロール） ---
-        self.report_area = QScrollArea()
-        self.report_area.setWidgetResizable(True)
-        self.report_container = QWidget()
-        self.report_layout = QVBoxLayout(self.report_container)
-        # AnalysisWindow._build() の「レポート一覧（スクロール）」作成後に追加
-        self.report_layout.setContentsMargins(10, 10, 10, 10)  # ← ★カード群の外周余白
-        self.report_layout.setSpacing(16)                      # ← ★カード間の縦間隔
-        self.report_area.setMinimumHeight(420)                 # ← ★表示領域の最低高さ（任意）
-        self.report_area.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-
-        self.report_area.setWidget(self.report_container)
+        # --- カード：担当別ダッシュボード（集計テーブルから描画するので即表示） ---
+        dash_card = QFrame(); dash_card.setObjectName("Card")
+        dv = QVBoxLayout(dash_card)
+        drow = QHBoxLayout()
+        self.cmb_period = QComboBox(); self.cmb_period.addItems(list(DASHBOARD_PERIODS))
+        self.cmb_period.currentIndexChanged.connect(self._render_dashboard)
+        self.btn_rollup = QPushButton("集計を更新"); self.btn_rollup.clicked.connect(self.on_refresh_rollups_clicked)
+        drow.addWidget(QLabel("担当別ダッシュボード　期間：")); drow.addWidget(self.cmb_period)
+        drow.addStretch(1); drow.addWidget(self.btn_rollup)
+        dv.addLayout(drow)
+        self.tbl_dash = QTableWidget(0, len(DASHBOARD_COLUMNS))
+        self.tbl_dash.setHorizontalHeaderLabels(DASHBOARD_COLUMNS)
+        self.tbl_dash.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tbl_dash.verticalHeader().setVisible(False)
+        self.tbl_dash.setMinimumHeight(220)
+        dv.addWidget(self.tbl_dash)
+        root.addWidget(dash_card); apply_card_shadow(dash_card)
+
+        # --- カード：レポート一覧（見えている行だけ描く一覧 + 詳細） ---
+        self.report_list = ReportListPanel()
+        self.report_list.setMinimumHeight(420)
+        self.report_list.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
         list_card = QFrame(); list_card.setObjectName("Card")
         lc = QVBoxLayout(list_card)
         lc.addWidget(QLabel("レポート一覧"))
-        lc.addWidget(self.report_area)
+        lc.addWidget(self.report_list)
         root.addWidget(list_card); apply_card_shadow(list_card)
 
         root.addStretch(1)
@@ -121,6 +146,23 @@ class AnalysisWindow(QWidget):
         except Exception as e:
             QMessageBox.critical(self, "エラー", f"データ生成に失敗しました:\n{e}")
 
+    def on_build_all_clicked(self):
+        try:
+            manifest_path, manifest = build_datasets_for_all_supports()
+        except Exception as e:
+            QMessageBox.critical(self, "エラー", f"データ生成に失敗しました:\n{e}")
+            return
+        # 選択中の担当のシャードがあれば、そのまま『Geminiで評価生成』に使えるようにする
+        support = self.cmb_support.currentText().strip()
+        shard = manifest["shards"].get(support)
+        if shard:
+            self.last_jsonl = manifest_path.parent / shard["file"]
+        lines = [f"{name}: {sh['conversations']} 件" for name, sh in manifest["shards"].items()]
+        QMessageBox.information(
+            self, "生成完了",
+            f"{len(manifest['shards'])} 担当・会話 {manifest['conversations']} 件を出力しました"
+            f"（{manifest['elapsed_sec']} 秒）。\n\n" + "\n".join(lines) + f"\n\n{manifest_path}")
+
     # ------- Gemini（JSONL→レポート） -------
     def on_gemini_clicked(self):
         if not self.last_jsonl or not self.last_jsonl.exists():
@@ -130,12 +172,79 @@ class AnalysisWindow(QWidget):
         #     QMessageBox.warning(self, "APIキー未設定", "環境変数 GEMINI_API_KEY を設定してください。")
         #     return
         try:
-            out_path, n = analyze_with_gemini(self.last_jsonl)
+            out_path, n, stats = analyze_with_gemini(self.last_jsonl)
             self.last_reports = out_path     # ← 生成したJSONLを記憶
-            QMessageBox.information(self, "評価完了", f"Geminiレポート {n} 件を\n{out_path}\nに出力しました。")
+            refresh_score_rollups()
+            self._render_dashboard()
+            tok = stats["tokens"]
+            saved = tok["saved_batching"] + tok["saved_cache"] + tok["saved_digest"]
+            QMessageBox.information(
+                self, "評価完了",
+                f"Geminiレポート {n} 件を\n{out_path}\nに出力しました。\n\n"
+                f"リクエスト {tok['requests']} 回（まとめ送り {tok['batched_conversations']} 件・"
+                f"キャッシュ {tok['cache_hits']} 件）／ 節約トークン（見積もり） 約 {saved:,}")
         except Exception as e:
             QMessageBox.critical(self, "エラー", f"Gemini分析に失敗しました:\n{e}")
 
+    def on_retry_errors_clicked(self):
+        # 直近のGemini出力（無ければ選択中の担当の出力）のうち、失敗した会話だけを投げ直す
+        path = self.last_reports
+        if not path or not Path(path).exists():
+            support = self.cmb_support.currentText().strip()
+            path = reports_file(support)
+        if not Path(path).exists():
+            QMessageBox.warning(self, "未検出", "再実行するレポートファイルが見つかりません。先に『Geminiで評価生成』を実行してください。")
+            return
+        try:
+            out_path, stats = retry_gemini_errors(Path(path))
+            self.last_reports = out_path
+            refresh_score_rollups()
+            self._render_dashboard()
+            QMessageBox.information(
+                self, "再実行完了",
+                f"{stats['analyzed']} 件を再分析しました（残りのエラー {stats['errors']} 件 / 全 {stats['total']} 件）。\n{out_path}")
+        except Exception as e:
+            QMessageBox.critical(self, "エラー", f"再実行に失敗しました:\n{e}")
+
+    # ------- 担当別ダッシュボード -------
+    def _render_dashboard(self):
+        days = DASHBOARD_PERIODS.get(self.cmb_period.currentText())
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d") if days else None
+        try:
+            rows = dashboard(since=since)
+        except Exception as e:
+            QMessageBox.critical(self, "エラー", f"集計の読み込みに失敗しました:\n{e}")
+            return
+
+        def _hours(sec):
+            return round(sec / 3600, 1) if sec is not None else None
+
+        self.tbl_dash.setSortingEnabled(False)
+        self.tbl_dash.setRowCount(len(rows))
+        for i, r in enumerate(rows):
+            values = [r["support"], r["messages"], r["customer_messages"], r["responses"],
+                      _hours(r["latency_avg"]), _hours(r["latency_p50"]), _hours(r["latency_p90"]),
+                      r["unanswered"], r["reports"],
+                      round(r["score_overall"], 2) if r["score_overall"] is not None else None,
+                      " / ".join(str(n) for n in r["score_hist"])]
+            for j, v in enumerate(values):
+                item = QTableWidgetItem()
+                item.setData(Qt.DisplayRole, v if v is not None else "-")  # 数値のまま入れて数値順に並べ替える
+                self.tbl_dash.setItem(i, j, item)
+        self.tbl_dash.setSortingEnabled(True)
+        self.tbl_dash.resizeColumnsToContents()
+
+    def on_refresh_rollups_clicked(self):
+        try:
+            rs = refresh_rollups()
+            refresh_score_rollups()
+        except Exception as e:
+            QMessageBox.critical(self, "エラー", f"集計の更新に失敗しました:\n{e}")
+            return
+        self._render_dashboard()
+        QMessageBox.information(self, "集計更新",
+                                f"{rs['since']} 以降 {rs['days']} 件を更新しました。" if rs["since"] else "変更はありませんでした。")
+
     # ----- 分析ボタン（暫定） -----
     def _on_analyze_placeholder(self):
         name = self.cmb_support.currentText().strip()
@@ -167,62 +276,42 @@ class AnalysisWindow(QWidget):
         if not path or not Path(path).exists():
             # 直近担当名から推測: conversations_<担当>_gemini_reports.jsonl
             support = self.cmb_support.currentText().strip()
-            guess = Path("analysis_out") / f"conversations_{support}_gemini_reports.jsonl"
+            guess = reports_file(support)
             if guess.exists():
                 path = guess
                 self.last_reports = guess
         if not path or not Path(path).exists():
             QMessageBox.warning(self, "未検出", "表示できるレポートファイルが見つかりません。先に『Geminiで評価生成』を実行してください。")
             return
-        
-    def on_show_reports(self):
-        # 直近のGemini出力を使用（無ければ担当名から推測）
-        path = self.last_reports
-        if not path or not Path(path).exists():
-            # 直近担当名から推測: conversations_<担当>_gemini_reports.jsonl
-            support = self.cmb_support.currentText().strip()
-            guess = Path("analysis_out") / f"conversations_{support}_gemini_reports.jsonl"
-            if guess.exists():
-                path = guess
-                self.last_reports = guess
-        if not path or not Path(path).exists():
-            QMessageBox.warning(self, "未検出", "表示できるレポートファイルが見つかりません。先に『Geminiで評価生成』を実行してください。")
+
+        # このファイルを書いたジョブがあれば analysis.db の解析済みレポート（reports）から引く。
+        # ジョブの記録がないファイル（別の環境から持ってきた・analysis.db を消した）だけ、
+        # 索引（<ファイル>.idx。無ければ作る）で表示する行だけをファイルから読む。
+        # どちらも一覧のスクロールに合わせて少しずつ読むので、表示中は開いたままにする
+        self._close_report_source()
+        store = connect_store()
+        job = job_for_output(store, path)
+        if job:
+            self.report_store = store
+            self.report_list.set_source(iter_job_report_heads(store, job[0]),
+                                        lambda rec: get_report(store, rec["id"]),
+                                        supports=job_supports(store, job[0]))
             return
+        store.close()
+        idx = open_index(path)
+        self.report_index = idx
+        self.report_list.set_source(idx.heads(), lambda rec: idx.read(rec["_row"]),
+                                    load_head=lambda rec: idx.read(rec["_row"]), locate=idx.find,
+                                    supports=idx.supports)
+
+    def _close_report_source(self):
+        if self.report_store is not None:
+            self.report_store.close()
+            self.report_store = None
+        if self.report_index is not None:
+            self.report_index.close()
+            self.report_index = None
 
-        # 一覧をクリア
-        while self.report_layout.count():
-            item = self.report_layout.takeAt(0)
-            w = item.widget()
-            if w: w.deleteLater()
-
-        # 読み込み & カード描画
-        count = 0
-        with Path(path).open("r", encoding="utf-8") as fr:
-            for line in fr:
-                line = line.strip()
-                if not line: continue
-                try:
-                    rec = json.loads(line)
-                except Exception:
-                    continue
-                parsed = parse_gemini_report_text(rec.get("report",""))
-                card_data = {
-                    "line_name": rec.get("line_name"),
-                    "support": rec.get("support"),
-                    "score_comm": parsed.get("score_comm"),
-                    "score_time": parsed.get("score_time"),
-                    "score_overall": parsed.get("score_overall"),
-                    "summary": parsed.get("summary"),
-                    "improvements": parsed.get("improvements"),
-                    "_raw": parsed.get("_raw"),
-                }
-                card = ReportCard(card_data, self.report_container)
-                self.report_layout.addWidget(card)
-                apply_card_shadow(card)
-                count += 1
-
-        self.report_layout.addStretch(1)
-        QMessageBox.information(self, "表示完了", f"{count} 件のレポートを表示しました。")
     @Slot(list, str)
     def _on_fetch_finished(self, items, err):
         self.cmb_support.clear()
@@ -236,110 +325,3 @@ class AnalysisWindow(QWidget):
                 self.cmb_support.addItems(items)
         self.cmb_support.setEnabled(True)
         self.btn_reload.setEnabled(True)
-# スタイル・影は既存を使用
-def _score_chip(text: str, val: float | None) -> QLabel:
-    chip = QLabel(text)
-    chip.setAlignment(Qt.AlignCenter)
-    chip.setFixedHeight(26)
-    chip.setMinimumWidth(90)
-    chip.setStyleSheet("""
-        QLabel { border-radius: 13px; padding: 2px 10px; color: white; }
-    """)
-    # カラー判定
-    if val is None:
-        bg = "#9E9E9E"
-        chip.setText(f"{text}: N/A")
-    else:
-        if val >= 4.0: bg = "#2E7D32"      # 良
-        elif val >= 3.0: bg = "#F9A825"    # ふつう
-        else: bg = "#C62828"               # 要改善
-        chip.setText(f"{text}: {val:.2f}")
-    chip.setStyleSheet(f"QLabel {{ border-radius: 13px; padding: 2px 10px; color: white; background:{bg}; }}")
-    return chip
-
-class ReportCard(QFrame):
-    def __init__(self, record: dict, parent=None):
-        super().__init__(parent)
-        self.setObjectName("Card")
-        
-        self.setMinimumHeight(450)  # ← ★カードの最低高さを確保（好みに応じて 220〜280）
-        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)  # 横は広く、縦は必要分＋min
-
-        lay = QVBoxLayout(self)
-        lay.setContentsMargins(20, 16, 20, 20)  # ← ★内側余白を広めに
-        lay.setSpacing(10)  # ← セクション間のスペース
-
-        # ヘッダ
-        hdr = QHBoxLayout()
-        title = QLabel(f"{record.get('line_name','(No name)')}  /  担当: {record.get('support') or '(未割当)'}")
-        title.setObjectName("TitleLabel")
-        hdr.addWidget(title)
-        hdr.addStretch(1)
-        # スコア
-        sc = record.get("score_comm"); st = record.get("score_time"); so = record.get("score_overall")
-        hdr.addWidget(_score_chip("コミュ", sc))
-        hdr.addWidget(_score_chip("タイム", st))
-        hdr.addWidget(_score_chip("総合", so))
-        lay.addLayout(hdr)
-
-        # サマリー
-        summary = record.get("summary") or ""
-        if summary:
-            s = QLabel(summary)
-            s.setWordWrap(True)
-            lay.addWidget(s)
-
-        # 改善案
-        imps = record.get("improvements") or []
-        if isinstance(imps, str): imps = [imps]
-        if imps:
-            lbl = QLabel("改善提案")
-            lbl.setStyleSheet("font-weight:600;")
-            lay.addWidget(lbl)
-            ul = QVBoxLayout()
-            for it in imps[:5]:
-                li = QLabel(f"• {it}")
-                li.setWordWrap(True)
-                ul.addWidget(li)
-            lay.addLayout(ul)
-
-        # 展開用（生テキストを参考表示）
-        raw = record.get("_raw")
-        if raw:
-            tb = QTextBrowser()
-            tb.setOpenExternalLinks(True)
-            tb.setMinimumHeight(100)  # ← ★折りたたみ領域が潰れないように
-            tb.setHtml(f"<details><summary>全文を見る</summary><pre style='white-space:pre-wrap'>{raw}</pre></details>")
-            lay.addWidget(tb)
-        lay.addStretch(1)
-def parse_gemini_report_text(txt: str) -> dict:
-    # JSONならそのまま
-    try:
-        obj = json.loads(txt)
-        return {
-            "score_comm": obj.get("score_communication"),
-            "score_time": obj.get("score_timeliness"),
-            "score_overall": obj.get("score_overall"),
-            "summary": obj.get("summary"),
-            "improvements": obj.get("improvements"),
-            "examples": obj.get("notable_examples"),
-            "_raw": None,  # JSONなら原文は省略可（必要なら残す）
-        }
-    except Exception:
-        # 正規表現で最低限を抽出
-        sc = re.search(r"score_communication[^0-9]*([0-5](?:\.\d+)?)", txt)
-        st = re.search(r"score_timeliness[^0-9]*([0-5](?:\.\d+)?)", txt)
-        so = re.search(r"score_overall[^0-9]*([0-5](?:\.\d+)?)", txt)
-        sm = re.search(r'"summary"\s*:\s*"([^"]+)"', txt)
-        im = re.findall(r'"improvements"\s*:\s*\[(.*?)\]', txt, flags=re.S)
-        imps = []
-        if im:
-            imps = re.findall(r'"([^"]+)"', im[0])
-        return {
-            "score_comm": float(sc.group(1)) if sc else None,
-            "score_time": float(st.group(1)) if st else None,
-            "score_overall": float(so.group(1)) if so else None,
-            "summary": sm.group(1) if sm else None,
-            "improvements": imps,
-            "_raw": txt[:4000],  # 長すぎ防止
-        }
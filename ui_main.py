@@ -2,9 +2,6 @@
 import sys
 import sqlite3
 import threading
-import csv, os
-import json
-from datetime import datetime
 from PySide6.QtGui import QIcon
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
@@ -26,6 +23,9 @@ from tags import scrape_tags
 from style import app_stylesheet, apply_card_shadow
 import threading
 from uploader import upload_db_ftps               # ← 既存のFTPSアップローダ
+from message_store import archive_messages
+from rollups import refresh_rollups               # ← 担当別の日次集計（ダッシュボード用）
+from exporter import export_tables, export_incremental  # ← エクスポート（CSV / Parquet、ストリーミング）
 from ui_analysis import AnalysisWindow            # ← 別ウィンドウ
 import pprint
 from update_support_from_sheet import main as update_support_sync_main
@@ -33,74 +33,8 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-def export_tables_to_csv(db_path: str = "lstep_users.db", out_dir: str = "exports") -> dict:
-    """
-    users と messages を CSV 出力（UTF-8 with BOM）する。
-    戻り値: {"users": <path>, "messages": <path>}
-    """
-    os.makedirs(out_dir, exist_ok=True)
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    out_users = os.path.join(out_dir, f"users_{ts}.csv")
-    out_messages = os.path.join(out_dir, f"messages_{ts}.csv")
-
-    conn = sqlite3.connect(db_path)
-    try:
-        cur = conn.cursor()
-
-        # users
-        cur.execute("SELECT * FROM users")
-        cols_u = [d[0] for d in cur.description]
-        rows_u = cur.fetchall()
-        friend_value_idx = cols_u.index("friend_value") if "friend_value" in cols_u else None
-        friend_value_labels = []
-        friend_value_label_set = set()
-        parsed_friend_values = []
-
-        if friend_value_idx is not None:
-            for row in rows_u:
-                raw = row[friend_value_idx]
-                parsed = {}
-                if raw:
-                    try:
-                        json_obj = json.loads(raw)
-                        if isinstance(json_obj, dict):
-                            parsed = {str(k): v for k, v in json_obj.items()}
-                    except (json.JSONDecodeError, TypeError):
-                        parsed = {}
-
-                parsed_friend_values.append(parsed)
-                for label in parsed.keys():
-                    if label not in friend_value_label_set:
-                        friend_value_label_set.add(label)
-                        friend_value_labels.append(label)
-
-            cols_u_export = [c for c in cols_u if c != "friend_value"] + friend_value_labels
-            rows_u_export = []
-            for row, parsed in zip(rows_u, parsed_friend_values):
-                base = [v for i, v in enumerate(row) if i != friend_value_idx]
-                extra = [parsed.get(label, "") for label in friend_value_labels]
-                rows_u_export.append(base + extra)
-        else:
-            cols_u_export = cols_u
-            rows_u_export = rows_u
-
-        with open(out_users, "w", encoding="utf-8-sig", newline="") as fw:
-            w = csv.writer(fw)
-            w.writerow(cols_u_export)
-            w.writerows(rows_u_export)
-
-        # messages
-        cur.execute("SELECT * FROM messages")
-        cols_m = [d[0] for d in cur.description]
-        rows_m = cur.fetchall()
-        with open(out_messages, "w", encoding="utf-8-sig", newline="") as fw:
-            w = csv.writer(fw)
-            w.writerow(cols_m)
-            w.writerows(rows_m)
-
-        return {"users": out_users, "messages": out_messages, "users_count": len(rows_u_export), "messages_count": len(rows_m)}
-    finally:
-        conn.close()
+# スクレイピング後に古いメッセージをアーカイブDBへ移す（None なら移さない）
+ARCHIVE_KEEP_DAYS = None
 
 # ===================== モーダル：続行ゲート =====================
 class ContinueDialog(QDialog):
@@ -236,7 +170,23 @@ def run_scraping(logger: UILogger):
         except Exception as e:
             logger.message.emit(f"❌ サポート担当の同期に失敗: {e}")
             # 続行は可能なので、アプリは止めずにログだけ出す
-            
+
+        if ARCHIVE_KEEP_DAYS is not None:
+            try:
+                arc = archive_messages(keep_days=ARCHIVE_KEEP_DAYS)
+                logger.message.emit(f"🗄️ {arc['cutoff']} より前のメッセージ {arc['moved']}件 をアーカイブしました。")
+            except Exception as e:
+                logger.message.emit(f"❌ アーカイブに失敗: {e}")
+
+        try:
+            rs = refresh_rollups()
+            if rs["since"]:
+                logger.message.emit(f"📊 担当別の集計を更新しました（{rs['since']} 以降 {rs['days']} 件）。")
+            else:
+                logger.message.emit("📊 担当別の集計: 変更なし")
+        except Exception as e:
+            logger.message.emit(f"❌ 担当別の集計に失敗: {e}")
+
         logger.message.emit("🎉 全処理が完了しました！")
     except Exception as e:
         logger.message.emit(f"❌ エラー: {e}")
@@ -387,6 +337,16 @@ class MainWindow(QWidget):
         self.btn_export.clicked.connect(self.on_click_export)
         row3.addWidget(self.btn_export)
 
+        # ▼ 追加：Parquetエクスポート（型付き・pandas向け）
+        self.btn_export_parquet = QPushButton("Parquetエクスポート")
+        self.btn_export_parquet.clicked.connect(self.on_click_export_parquet)
+        row3.addWidget(self.btn_export_parquet)
+
+        # ▼ 追加：差分エクスポート（前回以降の追加・変更分だけ）
+        self.btn_export_delta = QPushButton("差分エクスポート")
+        self.btn_export_delta.clicked.connect(self.on_click_export_delta)
+        row3.addWidget(self.btn_export_delta)
+
         actions.addLayout(row1)
         actions.addLayout(row2)
         actions.addLayout(row3)
@@ -418,6 +378,7 @@ class MainWindow(QWidget):
                 remote_dir="/totalappworks.com/public_html/support/",  # ← ★ここを変更
                 remote_name="lstep_users.db",
                 local_file="lstep_users.db",
+                progress=self.logger.message.emit,  # ← 送信量・速度・残り時間をログへ
             )
 
             # 成否で分岐表示
@@ -441,18 +402,26 @@ class MainWindow(QWidget):
         self.btn_upload.setEnabled(enabled)
         # self.btn_analysis.setEnabled(enabled)
         self.btn_export.setEnabled(enabled)   # ← 追加
+        self.btn_export_parquet.setEnabled(enabled)
+        self.btn_export_delta.setEnabled(enabled)
 
     def append_log(self, text: str):
         self.log.appendPlainText(text)
 
-    def run_export(self):
+    def run_export(self, fmt: str = "csv", incremental: bool = False):
+        label = fmt.upper() + ("（差分）" if incremental else "")
         try:
             self.logger.enable_ui.emit(False)
-            self.logger.message.emit("🟡 CSVエクスポートを開始します…")
-            result = export_tables_to_csv(db_path="lstep_users.db", out_dir="exports")
+            self.logger.message.emit(f"🟡 {label}エクスポートを開始します…")
+            if incremental:
+                result = export_incremental(db_path="lstep_users.db", out_dir="exports", fmt=fmt)
+                if result["kind"] == "full":
+                    self.logger.message.emit("ℹ️ 初回のため全件を出力します。")
+            else:
+                result = export_tables(db_path="lstep_users.db", out_dir="exports", fmt=fmt)
             self.logger.message.emit(f"✅ エクスポート完了: users={result['users_count']}件, messages={result['messages_count']}件")
             self.logger.message.emit(f"📄 保存先: {result['users']}\n📄 保存先: {result['messages']}")
-            self.logger.show_info.emit("完了", f"CSVを出力しました。\n{result['users']}\n{result['messages']}")
+            self.logger.show_info.emit("完了", f"{label}を出力しました。\n{result['users']}\n{result['messages']}")
         except Exception as e:
             self.logger.message.emit(f"❌ エクスポート失敗: {e}")
             self.logger.show_error.emit("エクスポート失敗", f"{e}")
@@ -463,6 +432,14 @@ class MainWindow(QWidget):
         t = threading.Thread(target=self.run_export, daemon=True)
         t.start()
 
+    def on_click_export_parquet(self):
+        t = threading.Thread(target=self.run_export, args=("parquet",), daemon=True)
+        t.start()
+
+    def on_click_export_delta(self):
+        t = threading.Thread(target=self.run_export, args=("csv", True), daemon=True)
+        t.start()
+
     @Slot(str, str)
     def on_show_info(self, title, text):
         QMessageBox.information(self, title, text)
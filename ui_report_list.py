@@ -0,0 +1,395 @@
+# ui_report_list.py
+# レポート一覧（モデル／ビュー）
+#
+# 1件ごとにカード（QFrame + 影 + QTextBrowser）を作って QScrollArea に積んでいた一覧の置き換え。
+# - ReportListModel:   一覧用の軽い行（スコア・要約）を CHUNK 件ずつ読み足す（canFetchMore / fetchMore）
+#                      改善案・原文などの詳細は、選択された1件だけ load_detail で引く
+#                      名前・要約を持たない行（report_index.heads）は、描画やキーワードでの絞り込みで
+#                      必要になったときに load_head で読む
+# - ReportFilterProxy: 担当・総合スコア・キーワードでの絞り込みと並べ替え（メモリ上）
+# - ReportDelegate:    見えている行だけを固定の高さで描く（行ごとのウィジェットは作らない）
+# - ReportListPanel:   絞り込みバー + 一覧 + 詳細表示
+import html
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional
+
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QSize, QSortFilterProxyModel, QTimer
+from PySide6.QtGui import QColor, QFont, QFontMetrics, QPainter
+from PySide6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QLineEdit, QListView, QTextBrowser,
+    QStyledItemDelegate, QStyle, QSplitter, QAbstractItemView,
+)
+from style import PRIMARY_WHITE, NEUTRAL_TEXT
+
+CHUNK = 200            # スクロールで一度に読み足す行数
+DETAIL_CACHE = 64      # 詳細（改善案・原文）を覚えておく件数
+ROW_HEIGHT = 96        # 1行の高さ（固定にしてビューの計算を軽くする）
+FILTER_DELAY_MS = 250  # キーワード入力から絞り込みまでの待ち
+
+RecordRole = Qt.UserRole + 1   # 表示用の行（名前・要約がなければ読み込む）
+RawRole = Qt.UserRole + 2      # 手元にある項目だけ（スコアの絞り込み・並べ替え用。読み込まない）
+HEAD_FIELDS = ("line_name", "support", "summary", "score_comm", "score_time", "score_overall")
+
+ALL_SUPPORTS = "（すべての担当）"
+# 総合スコアの範囲（色分けと同じ区切り）
+SCORE_RANGES = {
+    "すべてのスコア": (None, None),
+    "要改善（3未満）": (None, 3.0),
+    "ふつう（3〜4）": (3.0, 4.0),
+    "良（4以上）": (4.0, None),
+}
+# 並べ替え: (項目, 降順か)。None はファイル順
+SORT_KEYS = {
+    "ファイル順": None,
+    "総合スコア（低い順）": ("score_overall", False),
+    "総合スコア（高い順）": ("score_overall", True),
+    "担当": ("support", False),
+    "名前": ("line_name", False),
+}
+SCORE_CHIPS = [("コミュ", "score_comm"), ("タイム", "score_time"), ("総合", "score_overall")]
+
+
+def score_color(val: Optional[float]) -> str:
+    if val is None: return "#9E9E9E"
+    if val >= 4.0: return "#2E7D32"      # 良
+    if val >= 3.0: return "#F9A825"      # ふつう
+    return "#C62828"                     # 要改善
+
+
+# ===== モデル =====
+class ReportListModel(QAbstractListModel):
+    """
+    rows: 一覧用の行（dict）のイテラブル。必要になった分だけ CHUNK 件ずつ取り出す
+    load_detail(行) → 詳細つきの dict（改善案・特徴的なやり取り・原文）。無ければ行をそのまま使う
+    load_head(行) → "summary" を持たない行の HEAD_FIELDS を読む（省略時は行をそのまま使う）
+    locate(user_id) → 行番号。省略時は読み込み済みの行から探し、無ければ読み足しながら探す
+    """
+
+    def __init__(self, rows: Iterable[Dict], load_detail: Callable[[Dict], Optional[Dict]],
+                 load_head: Optional[Callable[[Dict], Dict]] = None,
+                 locate: Optional[Callable[[int], Optional[int]]] = None, parent=None):
+        super().__init__(parent)
+        self._source = iter(rows)
+        self._rows: List[Dict] = []
+        self._done = False
+        self._load_detail = load_detail
+        self._load_head = load_head
+        self._locate = locate
+        self._details: "OrderedDict[int, Dict]" = OrderedDict()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        rec = self._rows[index.row()]
+        if role == RawRole:
+            return rec
+        if role in (RecordRole, Qt.DisplayRole) and self._load_head and "summary" not in rec:
+            head = self._load_head(rec)
+            rec.update({k: head.get(k) for k in HEAD_FIELDS})  # 詳細（改善案・原文）は持たない
+        if role == RecordRole:
+            return rec
+        if role == Qt.DisplayRole:
+            return rec.get("line_name") or "(No name)"
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._done
+
+    def fetchMore(self, parent=QModelIndex()):
+        chunk = list(islice(self._source, CHUNK))
+        if len(chunk) < CHUNK:
+            self._done = True
+        if chunk:
+            n = len(self._rows)
+            self.beginInsertRows(QModelIndex(), n, n + len(chunk) - 1)
+            self._rows.extend(chunk)
+            self.endInsertRows()
+
+    def fetch_all(self):
+        """絞り込み・並べ替えは全件が対象なので、残りの軽い行をまとめて読む"""
+        while self.canFetchMore():
+            self.fetchMore()
+
+    def is_complete(self) -> bool:
+        return self._done
+
+    def find_user(self, user_id: int) -> Optional[int]:
+        """user_id の行番号（その行まで読み足す）"""
+        if self._locate is not None:
+            row = self._locate(user_id)
+            if row is None:
+                return None
+            while row >= len(self._rows) and self.canFetchMore():
+                self.fetchMore()
+            return row if row < len(self._rows) else None
+        start = 0
+        while True:
+            for row in range(start, len(self._rows)):
+                if self._rows[row].get("user_id") == user_id:
+                    return row
+            if not self.canFetchMore():
+                return None
+            start = len(self._rows)
+            self.fetchMore()
+
+    def detail(self, row: int) -> Dict:
+        if row in self._details:
+            self._details.move_to_end(row)
+            return self._details[row]
+        rec = self._rows[row]
+        d = self._load_detail(rec) or rec
+        self._details[row] = d
+        if len(self._details) > DETAIL_CACHE:
+            self._details.popitem(last=False)
+        return d
+
+
+class ReportFilterProxy(QSortFilterProxyModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.support: Optional[str] = None
+        self.score_range = (None, None)
+        self.keyword = ""
+        self.sort_key = None
+
+    def set_filter(self, support: Optional[str], score_range, keyword: str):
+        self.support = support
+        self.score_range = score_range
+        self.keyword = keyword.strip().lower()
+        self.invalidateFilter()
+
+    def is_filtered(self) -> bool:
+        return bool(self.support or self.keyword or self.score_range != (None, None))
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        # キーワードで絞るときだけ名前・要約を読む（担当・スコアは一覧用の行にある）
+        role = RecordRole if self.keyword else RawRole
+        rec = self.sourceModel().index(source_row, 0, source_parent).data(role)
+        if self.support and (rec.get("support") or "") != self.support:
+            return False
+        lo, hi = self.score_range
+        if lo is not None or hi is not None:
+            so = rec.get("score_overall")
+            if so is None or (lo is not None and so < lo) or (hi is not None and so >= hi):
+                return False
+        if self.keyword:
+            text = f"{rec.get('line_name') or ''}\n{rec.get('support') or ''}\n{rec.get('summary') or ''}"
+            if self.keyword not in text.lower():
+                return False
+        return True
+
+    def _key(self, rec):
+        field, desc = self.sort_key
+        v = rec.get(field)
+        if v is None or v == "":
+            return (1, 0)  # 値のない行は昇順・降順とも最後
+        return (0, -v if desc else v)
+
+    def lessThan(self, left, right):
+        if not self.sort_key:
+            return left.row() < right.row()
+        role = RawRole if self.sort_key[0] in ("score_overall", "support") else RecordRole
+        return self._key(left.data(role)) < self._key(right.data(role))
+
+
+# ===== 描画 =====
+class ReportDelegate(QStyledItemDelegate):
+    """名前・担当・スコア・要約（2行まで）を1行に描く"""
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), ROW_HEIGHT)
+
+    def paint(self, painter, option, index):
+        rec = index.data(RecordRole)
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        card = option.rect.adjusted(6, 4, -6, -4)
+        selected = bool(option.state & QStyle.State_Selected)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor("#E3EDFF" if selected else PRIMARY_WHITE))
+        painter.drawRoundedRect(card, 10, 10)
+        inner = card.adjusted(14, 10, -14, -10)
+
+        # スコア（右上から左へ）
+        font = QFont(option.font)
+        painter.setFont(font)
+        fm = QFontMetrics(font)
+        x = inner.right()
+        for label, key in reversed(SCORE_CHIPS):
+            val = rec.get(key)
+            text = f"{label} {val:.1f}" if val is not None else f"{label} -"
+            w = fm.horizontalAdvance(text) + 20
+            chip = QRect(x - w, inner.top(), w, 24)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QColor(score_color(val)))
+            painter.drawRoundedRect(chip, 12, 12)
+            painter.setPen(QColor("white"))
+            painter.drawText(chip, Qt.AlignCenter, text)
+            x -= w + 6
+
+        # 名前 / 担当
+        bold = QFont(font); bold.setBold(True)
+        painter.setFont(bold)
+        painter.setPen(QColor(NEUTRAL_TEXT))
+        title_rect = QRect(inner.left(), inner.top(), max(0, x - inner.left() - 8), 24)
+        title = f"{rec.get('line_name') or '(No name)'}  /  担当: {rec.get('support') or '(未割当)'}"
+        painter.drawText(title_rect, Qt.AlignLeft | Qt.AlignVCenter,
+                         QFontMetrics(bold).elidedText(title, Qt.ElideRight, title_rect.width()))
+
+        # 要約（2行に収まる分だけ）
+        painter.setFont(font)
+        body = QRect(inner.left(), inner.top() + 30, inner.width(), inner.height() - 30)
+        if rec.get("error"):
+            painter.setPen(QColor("#C62828"))
+            summary = "分析に失敗しました（『エラーのみ再実行』で投げ直せます）"
+        else:
+            painter.setPen(QColor("#555A6E"))
+            summary = " ".join((rec.get("summary") or "").split())
+        painter.drawText(body, Qt.AlignLeft | Qt.AlignTop | Qt.TextWordWrap,
+                         fm.elidedText(summary, Qt.ElideRight, body.width() * 2 - fm.averageCharWidth() * 4))
+        painter.restore()
+
+
+def detail_html(rec: Dict) -> str:
+    """詳細表示（選択した1件）"""
+    e = lambda s: html.escape(str(s or ""))
+    scores = "　".join(
+        f"<span style='color:{score_color(rec.get(k))}'>{label}: "
+        f"{'N/A' if rec.get(k) is None else f'{rec.get(k):.2f}'}</span>" for label, k in SCORE_CHIPS)
+    parts = [f"<h3>{e(rec.get('line_name') or '(No name)')}　/　担当: {e(rec.get('support') or '(未割当)')}</h3>",
+             f"<p><b>{scores}</b></p>"]
+    if rec.get("summary"):
+        parts.append(f"<p>{e(rec['summary'])}</p>")
+    imps = rec.get("improvements") or []
+    if isinstance(imps, str): imps = [imps]
+    if imps:
+        parts.append("<p><b>改善提案</b></p><ul>" + "".join(f"<li>{e(t)}</li>" for t in imps[:5]) + "</ul>")
+    examples = rec.get("examples") or []
+    if examples:
+        parts.append("<p><b>特徴的なやり取り</b></p><ul>" + "".join(
+            f"<li>[{e(x.get('type'))}] 「{e(x.get('quote'))}」 {e(x.get('reason'))}</li>" for x in examples) + "</ul>")
+    if rec.get("_raw"):
+        parts.append(f"<details><summary>全文を見る</summary><pre style='white-space:pre-wrap'>{e(rec['_raw'])}</pre></details>")
+    return "".join(parts)
+
+
+# ===== パネル =====
+class ReportListPanel(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        lay = QVBoxLayout(self)
+        lay.setContentsMargins(0, 0, 0, 0)
+
+        bar = QHBoxLayout()
+        self.cmb_support = QComboBox(); self.cmb_support.addItem(ALL_SUPPORTS); self.cmb_support.setMinimumWidth(160)
+        self.cmb_score = QComboBox(); self.cmb_score.addItems(list(SCORE_RANGES))
+        self.txt_keyword = QLineEdit(); self.txt_keyword.setPlaceholderText("キーワード（名前・担当・要約）")
+        self.cmb_sort = QComboBox(); self.cmb_sort.addItems(list(SORT_KEYS))
+        self.txt_user = QLineEdit(); self.txt_user.setPlaceholderText("user_id へ移動"); self.txt_user.setMaximumWidth(130)
+        self.lbl_count = QLabel("")
+        for w in (self.cmb_support, self.cmb_score, self.txt_keyword, self.cmb_sort, self.txt_user):
+            bar.addWidget(w)
+        bar.addStretch(1); bar.addWidget(self.lbl_count)
+        lay.addLayout(bar)
+
+        self.proxy = ReportFilterProxy(self)
+        self.view = QListView()
+        self.view.setUniformItemSizes(True)
+        self.view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.view.setItemDelegate(ReportDelegate(self.view))
+        self.view.setModel(self.proxy)
+        self.view.selectionModel().currentChanged.connect(self._on_current_changed)
+
+        self.detail = QTextBrowser()
+        self.detail.setOpenExternalLinks(True)
+
+        split = QSplitter(Qt.Horizontal)
+        split.addWidget(self.view); split.addWidget(self.detail)
+        split.setStretchFactor(0, 3); split.setStretchFactor(1, 2)
+        lay.addWidget(split)
+
+        self._timer = QTimer(self); self._timer.setSingleShot(True); self._timer.setInterval(FILTER_DELAY_MS)
+        self._timer.timeout.connect(self._apply)
+        self.txt_keyword.textChanged.connect(self._timer.start)
+        self.cmb_support.currentIndexChanged.connect(self._apply)
+        self.cmb_score.currentIndexChanged.connect(self._apply)
+        self.cmb_sort.currentIndexChanged.connect(self._apply)
+        self.txt_user.returnPressed.connect(self._on_jump)
+
+    def set_source(self, rows: Iterable[Dict], load_detail: Callable[[Dict], Optional[Dict]],
+                   load_head: Optional[Callable[[Dict], Dict]] = None,
+                   locate: Optional[Callable[[int], Optional[int]]] = None,
+                   supports: Iterable[str] = ()):
+        """supports: 担当の選択肢（全件分が分かっていれば。読み足した行に新しい担当があればさらに足す）"""
+        old = self.proxy.sourceModel()
+        model = ReportListModel(rows, load_detail, load_head, locate, self)
+        model.rowsInserted.connect(self._on_rows_inserted)
+        model.rowsInserted.connect(self._update_count)
+        self.cmb_support.blockSignals(True)
+        self.cmb_support.clear(); self.cmb_support.addItem(ALL_SUPPORTS)
+        self.cmb_support.addItems(sorted({s for s in supports if s}))
+        self.cmb_support.blockSignals(False)
+        self.proxy.setSourceModel(model)
+        if old is not None:
+            old.deleteLater()
+        self.detail.clear()
+        model.fetchMore()
+        self._apply()
+
+    def total_loaded(self) -> int:
+        model = self.proxy.sourceModel()
+        return model.rowCount() if model is not None else 0
+
+    def _on_rows_inserted(self, parent, first, last):
+        # 読み足した行に新しい担当があれば絞り込みの選択肢に足す
+        model = self.proxy.sourceModel()
+        known = {self.cmb_support.itemText(i) for i in range(self.cmb_support.count())}
+        for row in range(first, last + 1):
+            sup = model.index(row, 0).data(RawRole).get("support")
+            if sup and sup not in known:
+                known.add(sup)
+                self.cmb_support.addItem(sup)
+
+    def _apply(self):
+        model = self.proxy.sourceModel()
+        if model is None:
+            return
+        sup = self.cmb_support.currentText()
+        self.proxy.set_filter(None if sup == ALL_SUPPORTS else sup,
+                              SCORE_RANGES[self.cmb_score.currentText()], self.txt_keyword.text())
+        self.proxy.sort_key = SORT_KEYS[self.cmb_sort.currentText()]
+        if self.proxy.is_filtered() or self.proxy.sort_key:
+            model.fetch_all()
+        self.proxy.sort(0 if self.proxy.sort_key else -1)
+        self._update_count()
+
+    def _update_count(self, *args):
+        model = self.proxy.sourceModel()
+        total = f"{model.rowCount():,}" + ("" if model.is_complete() else "+")
+        self.lbl_count.setText(f"{self.proxy.rowCount():,} / {total} 件")
+
+    def _on_jump(self):
+        model = self.proxy.sourceModel()
+        text = self.txt_user.text().strip()
+        if model is None or not text.isdigit():
+            return
+        row = model.find_user(int(text))
+        index = self.proxy.mapFromSource(model.index(row, 0)) if row is not None else None
+        if index is None or not index.isValid():
+            self.lbl_count.setText(f"user_id {text} は見つかりません（絞り込み中なら解除してください）")
+            return
+        self.view.setCurrentIndex(index)
+        self.view.scrollTo(index, QAbstractItemView.PositionAtCenter)
+
+    def _on_current_changed(self, current, previous):
+        if not current.isValid():
+            self.detail.clear()
+            return
+        row = self.proxy.mapToSource(current).row()
+        self.detail.setHtml(detail_html(self.proxy.sourceModel().detail(row)))
@@ -1,11 +1,39 @@
 # uploader.py
-from ftplib import FTP_TLS, error_perm
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from ftplib import FTP_TLS, error_perm, error_reply, error_temp
 from pathlib import Path
+from typing import Callable, Optional
+import hashlib
+import json
+import shutil
 import socket
+import sqlite3
+import ssl
+import tempfile
+import threading
 import time
 
+from db_delta import compress_file, file_sha1, load_page_hashes, make_delta, page_hashes, save_page_hashes
+
 DEFAULT_HOSTS = ["sv1108.star.ne.jp", "ss911157.stars.ne.jp"]
 DEFAULT_PORT = 21
+STATE_DIR = Path(".upload_state")      # 前回アップロード分のマニフェストなど（ローカル保存）
+MANIFEST_FILE = STATE_DIR / "manifest.json"
+DIR_INDEX_FILE = STATE_DIR / "dir_index.json"  # ホストごとの「ファイルが見つかった場所」
+SESSION_FILE = STATE_DIR / "last_session.json"  # 前回アップロードに成功した host / user
+RESUME_FILE = STATE_DIR / "resume.json"  # 送りかけの .tmp ごとの元ファイル（サイズ / sha1）
+COMPRESS_SUFFIX = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_BLOCKSIZE = 256 * 1024         # storbinary の1回の送信サイズ（回線に合わせて調整）
+DEFAULT_RETRIES = 5                    # 転送中の切断から再開する回数
+DEFAULT_BACKOFF = 2.0                  # 再接続までの待ち（秒）。2回目以降は倍々
+PROGRESS_INTERVAL = 2.0                # 進捗を報告する間隔（秒）
+PROBE_HEAD_START = 2.0                 # 前回成功した host / user だけを先に試す時間（秒）
+PROBE_PER_HOST = 1                     # 同じホストへ同時に試すログインの数（共用サーバーの同時接続数の上限対策）
+
+# 転送中の切断とみなす例外（ログイン失敗などの error_perm は含めない）
+_NETWORK_ERRORS = (OSError, EOFError, error_temp, ssl.SSLError)
+# 探索中の一覧取得で、そのディレクトリを飛ばす例外（アップロード自体は済んでいるので失敗にしない）
+_LIST_ERRORS = (error_perm, error_reply) + _NETWORK_ERRORS
 
 def _pwd(ftps: FTP_TLS) -> str:
     try:
@@ -40,36 +68,436 @@ def _ensure_dir_strict(ftps: FTP_TLS, remote_dir: str):
             ftps.mkd(part)
             ftps.cwd(part)
 
-def _walk_find(ftps: FTP_TLS, target_name: str, max_depth=6) -> list[str]:
-    """ホーム直下から再帰的に探索して一致パスを返す（簡易版）"""
-    found = []
-    def _walk(cur_path:str, depth:int):
-        if depth > max_depth: 
+def snapshot_db(local_file: str, vacuum: bool = False) -> Path:
+    """
+    稼働中のDBから一貫したスナップショットを一時ファイルに作る（スクレイピング中でもOK）。
+    - vacuum=False: SQLite のオンラインバックアップAPI（ページ単位コピー）
+    - vacuum=True : VACUUM INTO（空き領域を詰めた状態で書き出す）
+    圧縮・差分は _prepare_payload がスナップショットに対して行う。
+    一時フォルダごと消すのは呼び出し側（cleanup_snapshot）
+    """
+    src_path = Path(local_file)
+    work = Path(tempfile.mkdtemp(prefix="db_snapshot_"))
+    snap = work / src_path.name
+
+    # 読み取り専用で開く（アップロード側からは書き込まない）
+    src = sqlite3.connect(f"file:{src_path.as_posix()}?mode=ro", uri=True, timeout=60)
+    try:
+        if vacuum:
+            src.execute("VACUUM INTO ?", (str(snap),))
+        else:
+            dst = sqlite3.connect(str(snap))
+            try:
+                src.backup(dst)  # pages=-1: 読み取りトランザクション内で一括コピー
+            finally:
+                dst.close()
+    finally:
+        src.close()
+    return snap
+
+
+def cleanup_snapshot(path: Optional[Path]):
+    if path is not None:
+        shutil.rmtree(path.parent, ignore_errors=True)
+
+
+# ===================== 前回アップロード分のマニフェスト =====================
+def _manifest_key(remote_dir: str, remote_name: str) -> str:
+    return remote_dir.rstrip("/") + "/" + remote_name
+
+
+def _load_manifest() -> dict:
+    try:
+        return json.loads(MANIFEST_FILE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_manifest_entry(key: str, snap: Path, page_size: int, hashes: list[bytes], sha1: str):
+    STATE_DIR.mkdir(exist_ok=True)
+    pages_file = STATE_DIR / (hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".pages")
+    save_page_hashes(pages_file, hashes)
+    manifest = _load_manifest()
+    manifest[key] = {
+        "sha1": sha1,
+        "size": snap.stat().st_size,
+        "page_size": page_size,
+        "pages_file": str(pages_file),
+        "uploaded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    MANIFEST_FILE.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def _prepare_payload(snap: Path, remote_name: str, remote_dir: str,
+                     compress: Optional[str], delta: bool, debug: dict) -> tuple[Optional[Path], str, dict]:
+    """
+    送るファイルと送り先名を決める。
+    - delta=True で前回分のマニフェストがあれば、変わったページだけの <name>.delta
+    - それ以外は compress に応じて <name> / <name>.gz / <name>.zst
+    戻り値: (送るファイル, リモート名, 成功後にマニフェストへ書く情報)。前回と同一内容なら送るファイルは None
+    """
+    page_size, hashes = page_hashes(snap)
+    sha1 = file_sha1(snap)
+    record = {"page_size": page_size, "hashes": hashes, "sha1": sha1}
+
+    base = _load_manifest().get(_manifest_key(remote_dir, remote_name)) if delta else None
+    if base and base.get("page_size") == page_size and Path(base.get("pages_file", "")).exists():
+        if base["sha1"] == sha1:
+            debug["payload"] = {"mode": "unchanged"}
+            return None, remote_name, record
+        out = snap.with_name(snap.name + ".delta")
+        info = make_delta(snap, load_page_hashes(base["pages_file"]), base["sha1"],
+                          page_size, out, new_hashes=hashes)
+        debug["payload"] = {"mode": "delta", "base_sha1": base["sha1"], **info}
+        return out, remote_name + ".delta", record
+
+    if compress:
+        out = compress_file(snap, compress)
+        debug["payload"] = {"mode": compress, "size": out.stat().st_size}
+        return out, remote_name + COMPRESS_SUFFIX[compress], record
+    debug["payload"] = {"mode": "full", "size": snap.stat().st_size}
+    return snap, remote_name, record
+
+# ===================== 再開可能な転送 =====================
+def _fmt_eta(sec: float) -> str:
+    sec = int(sec)
+    return f"{sec // 3600}:{sec % 3600 // 60:02d}:{sec % 60:02d}" if sec >= 3600 else f"{sec // 60}:{sec % 60:02d}"
+
+
+class _Progress:
+    """storbinary のコールバック。一定間隔で 送信量 / 速度 / 残り時間 を報告する"""
+    def __init__(self, total: int, offset: int, report: Optional[Callable[[str], None]]):
+        self.total = total
+        self.done = offset
+        self.report = report
+        self.started = time.monotonic()
+        self.sent = 0          # この接続で送った量（速度計算用）
+        self.last = 0.0
+
+    def __call__(self, block: bytes):
+        self.done += len(block)
+        self.sent += len(block)
+        now = time.monotonic()
+        if self.report and (now - self.last >= PROGRESS_INTERVAL or self.done >= self.total):
+            self.last = now
+            self.report(self.line())
+
+    def rate(self) -> float:
+        return self.sent / max(time.monotonic() - self.started, 1e-6)
+
+    def line(self) -> str:
+        rate = self.rate()
+        eta = (self.total - self.done) / rate if rate > 0 else 0
+        pct = self.done / self.total * 100 if self.total else 100.0
+        return (f"📤 アップロード中 {pct:5.1f}% ({self.done / 1e6:.1f}/{self.total / 1e6:.1f} MB) "
+                f"{rate / 1e6:.2f} MB/s 残り {_fmt_eta(eta)}")
+
+
+def _remote_size(ftps: FTP_TLS, name: str) -> Optional[int]:
+    """リモートのファイルサイズ（無ければ 0。SIZE 非対応のサーバーでは None）"""
+    try:
+        ftps.voidcmd("TYPE I")  # SIZE はバイナリモードで
+        return ftps.size(name) or 0
+    except error_perm as e:
+        if str(e).startswith(("500", "501", "502", "504")):
+            return None
+        return 0
+
+
+def _load_resume() -> dict:
+    try:
+        return json.loads(RESUME_FILE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_resume_entry(key: str, source: Optional[dict]):
+    """.tmp の元ファイルを記録する（None なら消す）"""
+    STATE_DIR.mkdir(exist_ok=True)
+    resume = _load_resume()
+    if source is None:
+        if resume.pop(key, None) is None:
             return
-        # 一覧を NLST で取得
+    else:
+        resume[key] = source
+    RESUME_FILE.write_text(json.dumps(resume, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def _store_resumable(ftps: FTP_TLS, reconnect: Callable[[], FTP_TLS], lf: Path, tmp_name: str,
+                     resume_key: str, blocksize: int, retries: int, backoff: float,
+                     progress: Optional[Callable[[str], None]], trial: dict) -> FTP_TLS:
+    """
+    tmp_name へ送る。切断されたら再接続し、リモートの .tmp のサイズから REST で続きを送る。
+    再接続の失敗（ホストがまだ落ちている等）も1回の試行として数え、同じ待ちを入れて再試行する。
+    前回の実行が残した .tmp は、元ファイルのサイズ / sha1 が記録（RESUME_FILE の resume_key）と
+    一致するときだけ続きから送る。違えば消して最初から（別の内容の上に書き足さない）。
+    SIZE 非対応のサーバーでは続きからは送らず、転送後のサイズ確認もしない。
+    戻り値: 転送を終えた（rename などに使える）接続
+    """
+    total = lf.stat().st_size
+    source = {"size": total, "sha1": file_sha1(lf)}
+    resumable = _load_resume().get(resume_key) == source
+    trial["resumes"] = []
+    attempt = 0
+    reached = 0  # 直前までに送れていた量（再開の記録用）
+    while True:
+        cb = None
         try:
-            entries = ftps.nlst()
-        except Exception:
-            entries = []
-        # まずファイル一致を見る
-        if target_name in [e.split("/")[-1] for e in entries]:
-            found.append(cur_path.rstrip("/") + "/" + target_name)
-        # ディレクトリに降りる（. と .. を除外）
-        for e in entries:
-            name = e.split("/")[-1]
-            if name in (".", ".."):
-                continue
-            # ディレクトリか判定（CWDできるかで判定）
+            if ftps is None:
+                ftps = reconnect()
+            if not resumable:
+                # 別の内容の .tmp が残っているかもしれないので消してから、この内容を記録する
+                stale = _remote_size(ftps, tmp_name)
+                if stale:
+                    ftps.delete(tmp_name)
+                    trial["discarded_tmp"] = stale
+                _save_resume_entry(resume_key, source)
+                resumable = True
+            offset = _remote_size(ftps, tmp_name)
+            if offset is None or offset > total:
+                offset = 0  # SIZE が使えない・サイズが合わないときは最初から
+            cb = _Progress(total, offset, progress)
+            if offset < total or total == 0:
+                with lf.open("rb") as f:
+                    f.seek(offset)
+                    ftps.storbinary("STOR " + tmp_name, f, blocksize=blocksize, callback=cb,
+                                    rest=offset or None)
+                # 226 が返っても途中で切れていることがあるのでサイズで確認
+                size = _remote_size(ftps, tmp_name)
+                if size is not None and size != total:
+                    raise EOFError("転送後のリモートサイズが一致しません")
+            trial["transfer"] = {"bytes": total, "resumed_from": offset, "blocksize": blocksize,
+                                 "rate_bytes_per_sec": round(cb.rate())}
+            return ftps
+        except _NETWORK_ERRORS as e:
+            attempt += 1
+            if cb is not None:
+                reached = cb.done
+            trial["resumes"].append({"at": reached, "error": str(e)})
+            if attempt > retries:
+                raise
+            wait = backoff * (2 ** (attempt - 1))
+            if progress:
+                progress(f"⚠️ 転送が中断されました（{e}）。{wait:.0f}秒後にリモートの続きから再開します…"
+                         f"（{attempt}/{retries}）")
+            if ftps is not None:
+                try:
+                    ftps.close()
+                except Exception:
+                    pass
+            ftps = None  # 次の周回の先頭で再接続する
+            time.sleep(wait)
+
+
+# ===================== ディレクトリ一覧（MLSD / LIST）とホスト別インデックス =====================
+def _parse_list_line(line: str) -> Optional[tuple[str, bool]]:
+    """LIST の1行 → (名前, ディレクトリか)。UNIX 形式と DOS 形式に対応"""
+    parts = line.split(None, 8)
+    if len(parts) == 9 and parts[0][:1] in "-dlbcps":
+        name = parts[8]
+        if parts[0][0] == "l":
+            return name.split(" -> ")[0], False  # シンボリックリンクは辿らない
+        return name, parts[0][0] == "d"
+    parts = line.split(None, 3)
+    if len(parts) == 4 and parts[0][:1].isdigit():  # 01-02-24  10:00AM  <DIR>  name
+        return parts[3], parts[2].upper() == "<DIR>"
+    return None
+
+
+def _list_entries(ftps: FTP_TLS, path: str, use_mlsd: dict) -> list[tuple[str, bool, Optional[str]]]:
+    """
+    path の一覧を (名前, ディレクトリか, unique) で返す（CWD しない）。
+    unique は MLSD の unique ファクト（リンクによる循環の検出用。LIST では None）。
+    MLSD 非対応のサーバーでは LIST を解析する。use_mlsd["ok"] に結果を覚えておく。
+    """
+    if use_mlsd.get("ok", True):
+        try:
+            return [(name, facts.get("type", "").lower() == "dir", facts.get("unique"))
+                    for name, facts in ftps.mlsd(path, facts=["type", "unique"])
+                    if facts.get("type", "").lower() not in ("cdir", "pdir")]
+        except error_perm as e:
+            if not str(e).startswith(("500", "501", "502", "504")):
+                raise
+            use_mlsd["ok"] = False
+    lines = []
+    ftps.retrlines("LIST " + path if path else "LIST", lines.append)
+    entries = []
+    for line in lines:
+        parsed = _parse_list_line(line)
+        if parsed and parsed[0] not in (".", ".."):
+            entries.append(parsed + (None,))
+    return entries
+
+
+def _join(parent: str, name: str) -> str:
+    return parent.rstrip("/") + "/" + name
+
+
+def _load_dir_index() -> dict:
+    try:
+        return json.loads(DIR_INDEX_FILE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_dir_index(index: dict):
+    STATE_DIR.mkdir(exist_ok=True)
+    DIR_INDEX_FILE.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def _find_remote(ftps: FTP_TLS, host: str, start: str, target_name: str,
+                 max_depth: int = 6) -> tuple[list[str], dict]:
+    """
+    start 以下から target_name を探して一致パスを返す。
+    前回見つかった場所（.upload_state/dir_index.json）があれば、まずその親だけを一覧する。
+    無ければ MLSD で幅優先に辿り（CWD での判定はしない）、結果をホスト別に保存する。
+    一覧が取れないディレクトリ（権限・一時エラー・切断）は飛ばして errors に数える。
+    エラーがあって見つからなかったときは、前回の場所の記録を消さない。
+    戻り値: (一致パス, {"cached": 前回の場所で見つかったか, "listings": 一覧取得回数, "errors": 飛ばした数})
+    """
+    index = _load_dir_index()
+    entry = index.setdefault(host, {})
+    use_mlsd = {"ok": entry.get("mlsd", True)}
+    stats = {"cached": False, "listings": 0, "errors": 0}
+
+    found = []
+    for path in entry.get("found", {}).get(target_name, []):
+        parent, _, name = path.rpartition("/")
+        try:
+            stats["listings"] += 1
+            if any(n == name and not is_dir for n, is_dir, _ in _list_entries(ftps, parent or "/", use_mlsd)):
+                found.append(path)
+        except _LIST_ERRORS:
+            stats["errors"] += 1
+    stats["cached"] = bool(found)
+
+    if not found:
+        queue = [(start, 0)]
+        seen = set()
+        while queue:
+            cur, depth = queue.pop(0)
             try:
-                ftps.cwd(e)
-                nxt = _pwd(ftps)
-                _walk(nxt, depth+1)
-                ftps.cwd(cur_path)  # 戻る
-            except Exception:
+                stats["listings"] += 1
+                entries = _list_entries(ftps, cur, use_mlsd)
+            except _LIST_ERRORS:
+                stats["errors"] += 1
                 continue
-    start = _pwd(ftps)
-    _walk(start, 0)
-    return found
+            for name, is_dir, unique in entries:
+                if is_dir and depth < max_depth:
+                    if unique:
+                        if unique in seen:
+                            continue
+                        seen.add(unique)
+                    queue.append((_join(cur, name), depth + 1))
+                elif not is_dir and name == target_name:
+                    found.append(_join(cur, name))
+
+    entry["mlsd"] = use_mlsd.get("ok", True)
+    if found or not stats["errors"]:
+        entry.setdefault("found", {})[target_name] = found
+    _save_dir_index(index)
+    return found, stats
+
+# ===================== 接続の確立（ホスト・ユーザーの並列プローブ） =====================
+def _open_session(host: str, port: int, user: str, password: str, timeout: int) -> FTP_TLS:
+    s = FTP_TLS(timeout=timeout)
+    try:
+        s.connect(host=host, port=port)
+        s.login(user=user, passwd=password)
+        s.prot_p()
+    except Exception:
+        s.close()
+        raise
+    return s
+
+
+def _load_last_session() -> dict:
+    try:
+        return json.loads(SESSION_FILE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_last_session(host: str, user: str):
+    STATE_DIR.mkdir(exist_ok=True)
+    SESSION_FILE.write_text(json.dumps({"host": host, "user": user,
+                                        "saved_at": time.strftime("%Y-%m-%d %H:%M:%S")},
+                                       ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+_host_slots: dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+
+
+def _host_slot(host: str) -> threading.BoundedSemaphore:
+    """ホストごとのプローブの同時実行数（PROBE_PER_HOST）。呼び出しをまたいで共有する"""
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(PROBE_PER_HOST)
+        return _host_slots[host]
+
+
+def _probe_sessions(debug: dict, pairs: list[tuple[str, str]], port: int, password: str,
+                    timeout: int, failed: set, head_start: bool = False
+                    ) -> tuple[Optional[FTP_TLS], Optional[dict]]:
+    """
+    (host, user) の組を並列に 名前解決 → 接続 → ログイン → PROT P し、最初に成功したセッションを返す。
+    同じホストへの試行は PROBE_PER_HOST 本までに絞る（ホストの間は並列）。
+    head_start=True なら先頭の組（前回の成功）だけを PROBE_HEAD_START 秒先に試す。
+    失敗した組は debug["trials"] に残し、failed に加える（呼び出し側は以降その組を試さない）。
+    順番待ちの間に他の組が成功したら試さずに終える。後から成功した接続はその場で閉じる。
+    戻り値: (ftps, trial) / 全滅なら (None, None)
+    """
+    lock = threading.Lock()
+    state = {"winner": None}
+
+    def _attempt(host: str, u: str):
+        with _host_slot(host):
+            if state["winner"] is not None:
+                return None, None
+            return _login(host, u)
+
+    def _login(host: str, u: str):
+        trial = {"host": host, "user": u}
+        started = time.monotonic()
+        try:
+            trial["ip"] = socket.gethostbyname(host)
+            s = _open_session(host, port, u, password, timeout)
+        except Exception as e:
+            trial.update(stage="resolve" if "ip" not in trial else "login", ok=False, error=str(e))
+            with lock:
+                failed.add((host, u))
+                if state["winner"] is None:
+                    debug["trials"].append(trial)
+            return None, trial
+        trial["connect_sec"] = round(time.monotonic() - started, 3)
+        with lock:
+            if state["winner"] is None:
+                state["winner"] = (s, trial)
+                return s, trial
+        try:
+            s.quit()
+        except Exception:
+            s.close()
+        return None, trial
+
+    pool = ThreadPoolExecutor(max_workers=len(pairs), thread_name_prefix="ftps-probe")
+    try:
+        if head_start:
+            futures = [pool.submit(_attempt, *pairs[0])]
+            wait(futures, timeout=PROBE_HEAD_START)
+            if state["winner"] is None:
+                futures += [pool.submit(_attempt, *p) for p in pairs[1:]]
+        else:
+            futures = [pool.submit(_attempt, *p) for p in pairs]
+        for f in as_completed(futures):
+            s, trial = f.result()
+            if s is not None:
+                return s, trial
+        return None, None
+    finally:
+        pool.shutdown(wait=False)
+
 
 def upload_db_ftps(
     user: str,
@@ -82,9 +510,26 @@ def upload_db_ftps(
     timeout: int = 60,
     verify_after_upload: bool = True,
     search_if_not_visible: bool = True,
+    snapshot: bool = True,
+    vacuum: bool = False,
+    compress: Optional[str] = None,
+    delta: bool = False,
+    blocksize: int = DEFAULT_BLOCKSIZE,
+    retries: int = DEFAULT_RETRIES,
+    backoff: float = DEFAULT_BACKOFF,
+    progress: Optional[Callable[[str], None]] = None,
 ) -> dict:
     """
     戻り値: デバッグ情報を辞書で返す（UIログにも表示可）
+    snapshot=True なら、まず一貫したスナップショットを取り、それをアップロードする
+    （スクレイピング・タグ取得の書き込み中でも壊れたDBが上がらない）。
+    compress="gzip" / "zstd" なら remote_name + ".gz" / ".zst" として圧縮版を送る。
+    delta=True なら前回アップロード分（.upload_state のマニフェスト）との差分ページだけを
+    remote_name + ".delta" として送る（初回・基準なしの場合は compress に従って全体）。
+    サーバー側は db_delta.py の unpack で展開する。
+    ※ vacuum=True はページ配置が変わるため差分が大きくなる
+    転送が切れたら retries 回まで再接続し、REST で .tmp の続きから送る。
+    progress（例: logger.message.emit）には 送信量 / 速度 / 残り時間 を定期的に渡す。
     """
     hosts = hosts or DEFAULT_HOSTS
     lf = Path(local_file)
@@ -92,6 +537,37 @@ def upload_db_ftps(
         raise FileNotFoundError(f"ローカルに {local_file} が見つかりません。")
 
     debug = {"trials": []}
+
+    if not (snapshot or compress or delta):
+        return _upload_file(debug, lf, user, password, hosts, port, remote_dir, remote_name,
+                            timeout, verify_after_upload, search_if_not_visible,
+                            blocksize, retries, backoff, progress)
+
+    # 圧縮・差分はスナップショットに対して行う
+    snap = snapshot_db(local_file, vacuum=vacuum)
+    try:
+        debug["snapshot"] = {"path": str(snap), "source_size": lf.stat().st_size, "size": snap.stat().st_size}
+        payload, payload_name, record = _prepare_payload(snap, remote_name, remote_dir, compress, delta, debug)
+        if payload is None:
+            debug["success"] = True  # 前回と同一内容なので送らない
+            return debug
+        debug = _upload_file(debug, payload, user, password, hosts, port, remote_dir, payload_name,
+                             timeout, verify_after_upload, search_if_not_visible,
+                             blocksize, retries, backoff, progress)
+        if debug.get("success"):
+            _save_manifest_entry(_manifest_key(remote_dir, remote_name), snap,
+                                 record["page_size"], record["hashes"], record["sha1"])
+        return debug
+    finally:
+        cleanup_snapshot(snap)
+
+
+def _upload_file(debug: dict, lf: Path, user: str, password: str, hosts: list[str], port: int,
+                 remote_dir: str, remote_name: str, timeout: int,
+                 verify_after_upload: bool, search_if_not_visible: bool,
+                 blocksize: int = DEFAULT_BLOCKSIZE, retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF,
+                 progress: Optional[Callable[[str], None]] = None) -> dict:
     last_err = None
 
     # ユーザー名候補（@host 付きも試す）
@@ -99,70 +575,89 @@ def upload_db_ftps(
     if "@" not in user:
         user_candidates.append(f"{user}@{hosts[0]}")
 
-    for host in hosts:
-        try:
-            ip = socket.gethostbyname(host)
-        except Exception as e:
-            last_err = e
-            debug["trials"].append({"host": host, "stage": "resolve", "ok": False, "error": str(e)})
-            continue
+    # 前回成功した (host, user) を先頭にして先行させる
+    remaining = [(h, u) for h in hosts for u in user_candidates]
+    last = _load_last_session()
+    preferred = (last.get("host"), last.get("user"))
+    head_start = preferred in remaining
+    if head_start:
+        remaining.remove(preferred)
+        remaining.insert(0, preferred)
 
-        for u in user_candidates:
-            trial = {"host": host, "ip": ip, "user": u}
-            try:
-                ftps = FTP_TLS(timeout=timeout)
-                ftps.connect(host=host, port=port)
-                ftps.login(user=u, passwd=password)
-                ftps.prot_p()
-
-                trial["login_pwd"] = _pwd(ftps)
+    # ログインに失敗した組はこの呼び出しの間は試し直さない（アップロード失敗後の再プローブでも）
+    failed: set[tuple[str, str]] = set()
+    while remaining:
+        ftps, trial = _probe_sessions(debug, remaining, port, password, timeout, failed, head_start)
+        remaining = [p for p in remaining if p not in failed]
+        if ftps is None:
+            break
+        host, u = trial["host"], trial["user"]
+        remaining.remove((host, u))
+        head_start = False
+        try:
+            trial["login_pwd"] = _pwd(ftps)
 
-                # remote_dir に厳格遷移（自動補完しない）
-                _ensure_dir_strict(ftps, remote_dir)
-                trial["target_pwd"] = _pwd(ftps)
+            def _reconnect():
+                s = _open_session(host, port, u, password, timeout)
+                _ensure_dir_strict(s, remote_dir)
+                return s
 
-                # 一時名でアップロード → rename
-                tmp_name = remote_name + ".tmp"
-                with lf.open("rb") as f:
-                    ftps.storbinary(f"STOR " + tmp_name, f)
-                try:
-                    ftps.rename(tmp_name, remote_name)
-                except error_perm:
-                    try:
-                        ftps.delete(remote_name)
-                    except Exception:
-                        pass
-                    ftps.rename(tmp_name, remote_name)
-
-                # 直後の一覧
-                if verify_after_upload:
-                    trial["post_list_pwd"] = _pwd(ftps)
-                    trial["post_list"] = _listdir(ftps)
-
-                # 同名が見えないときは探索
-                if verify_after_upload:
-                    visible = any(remote_name in line for line in trial["post_list"])
-                    if not visible and search_if_not_visible:
-                        # ホームに戻って探索
-                        ftps.cwd(trial["login_pwd"])
-                        found = _walk_find(ftps, remote_name, max_depth=6)
-                        trial["search_results"] = found
+            # remote_dir に厳格遷移（自動補完しない）
+            _ensure_dir_strict(ftps, remote_dir)
+            trial["target_pwd"] = _pwd(ftps)
 
+            # 一時名でアップロード（切断時は続きから再開） → rename
+            tmp_name = remote_name + ".tmp"
+            resume_key = host + ":" + _manifest_key(remote_dir, tmp_name)
+            ftps = _store_resumable(ftps, _reconnect, lf, tmp_name, resume_key, blocksize, retries, backoff,
+                                    progress, trial)
+            try:
+                ftps.rename(tmp_name, remote_name)
+            except error_perm:
                 try:
-                    ftps.quit()
+                    ftps.delete(remote_name)
                 except Exception:
                     pass
+                ftps.rename(tmp_name, remote_name)
+            _save_resume_entry(resume_key, None)
+
+            # 直後の一覧
+            if verify_after_upload:
+                trial["post_list_pwd"] = _pwd(ftps)
+                trial["post_list"] = _listdir(ftps)
+
+            # 同名が見えないときは探索（前回の場所 → 無ければホームから）
+            if verify_after_upload:
+                visible = any(_parse_list_line(line) == (remote_name, False)
+                              for line in trial["post_list"])
+                if not visible and search_if_not_visible:
+                    home = trial["login_pwd"] if trial["login_pwd"].startswith("/") else "/"
+                    found, stats = _find_remote(ftps, host, home, remote_name, max_depth=6)
+                    trial["search_results"] = found
+                    trial["search_stats"] = stats
 
-                trial["ok"] = True
-                debug["trials"].append(trial)
-                debug["success"] = True
-                return debug
-            except Exception as e:
-                last_err = e
-                trial["ok"] = False
-                trial["error"] = str(e)
-                debug["trials"].append(trial)
+            try:
+                ftps.quit()
+            except Exception:
+                pass
+
+            trial["ok"] = True
+            debug["trials"].append(trial)
+            debug["success"] = True
+            _save_last_session(host, u)
+            return debug
+        except Exception as e:
+            last_err = e
+            trial["ok"] = False
+            trial["error"] = str(e)
+            debug["trials"].append(trial)
+            try:
+                ftps.close()
+            except Exception:
+                pass
 
+    if last_err is None and debug["trials"]:
+        last_err = debug["trials"][-1].get("error")
     debug["success"] = False
     debug["error"] = f"全候補でアップロード失敗。最後のエラー: {last_err}"
     return debug